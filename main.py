@@ -6,7 +6,10 @@ from src.utils import print_watermark
 from src.config.config_model import config
 from src.entity.agent.langgraph_agent import Langgraph_Agent
 from src.prompt import system_prompt
-from src.extend.tool import list_files, read_file, write_file, run_cmd
+from src.extend.openai.llm_cache import get_response_cache
+from src.extend.openai.http_pool import warm_up_in_background
+from src.extend.metrics import PHASE_SECONDS, metrics
+from src.extend.tool import list_files, scan_tree, find_files, read_file, search_file, write_file, run_cmd
 
 # 打印启动信息
 print_watermark()
@@ -17,31 +20,78 @@ config.langsmith_config.init_env()
 # 创建智能体实例
 agent = Langgraph_Agent(
     config.llm_model,
-    tools=[list_files, read_file, write_file, run_cmd],
+    tools=[list_files, scan_tree, find_files, read_file, search_file, write_file, run_cmd],
     system_prompt=system_prompt
 )
 
+# 正在逐段输出的角色(token:模型回复 tool_output:命令输出),切换输出内容前需要先换行
+inline_role = None
+
+def end_inline():
+    """结束逐段输出(换行)"""
+    global inline_role
+    if inline_role:
+        print(Fore.RESET)
+        inline_role = None
+
 def stream_func(role: str, content: str):
-    """根据角色打印不同颜色的输出"""
+    """根据角色打印不同颜色的输出(模型回复的token增量与命令输出实时追加在同一行)"""
+    global inline_role
     color_map = {
         "ai": Fore.GREEN,
         "assistant": Fore.GREEN,
+        "token": Fore.GREEN,
         "tool": Fore.YELLOW,
+        "tool_output": Fore.YELLOW,
         "error": Fore.RED,
+        "router": Fore.MAGENTA,
         "user": Fore.BLUE
     }
     color = color_map.get(role.lower(), Fore.WHITE)
     reset = Fore.RESET
+    if role in ("token", "tool_output"):
+        if inline_role != role:
+            end_inline()
+            # 模型回复以"ai: "开头,命令输出原样打印
+            print(f"{color}ai: " if role == "token" else color, end="")
+            inline_role = role
+        print(f"{color}{content}{reset}", end="", flush=True)
+        return
+    end_inline()
     print(f"{color}{role}: {content}{reset}")
 
 if __name__ == "__main__":
+    # 后台预热模型服务(建立连接、加载ollama模型),等待输入期间完成
+    warm_up_in_background([config.llm_model, config.summary_model])
     while True:
         # 使用蓝色显示用户输入提示符
         user_input = input(f"{Fore.BLUE}myself: {Fore.RESET}").strip()
         if user_input.lower() in {"exit", "quit"}:
+            # 打印本次运行各阶段耗时汇总
+            print(f"{Fore.WHITE}{metrics.format_summary()}{Fore.RESET}")
             print(f"{Fore.WHITE}🔚 结束对话{Fore.RESET}")
             break
         # 调用智能体并实时打印
-        res = agent.invoke(user_input, thread_id="1", stream_func=stream_func)
+        res = agent.invoke(user_input, thread_id="1", stream_func=stream_func, stream_tokens=True)
+        end_inline()
+        # 显示当前会话记忆的token占用
+        prefix = agent.get_prefix_stats("1")
+        print(f"{Fore.WHITE}[tokens: {agent.memory.get_token_total('1')}/{config.max_token_limit}, "
+              f"前缀变化 {prefix['changes']}/{prefix['turns']} 轮]{Fore.RESET}")
+        # 显示本轮使用的模型与各模型的累计耗时/token(配置了models时)
+        if config.models and res.route:
+            routes = ", ".join(f"{name} {s['turns']}次/{s['avg_latency_seconds']:.1f}s/{s['tokens']}tokens"
+                               for name, s in agent.get_route_stats().items() if s["turns"])
+            print(f"{Fore.WHITE}[model: {res.route} | {routes}]{Fore.RESET}")
+        # 显示响应缓存命中情况(启用时)
+        if agent.model.cache:
+            stats = get_response_cache().get_stats()
+            print(f"{Fore.WHITE}[cache: 命中 {stats['hits']}/{stats['lookups']}, "
+                  f"节省 {stats['saved_seconds']:.1f}s / {stats['saved_tokens']} tokens]{Fore.RESET}")
+        # 显示本轮耗时与累计耗时分位数
+        turn = metrics.get_histogram(PHASE_SECONDS, phase="turn")
+        if turn:
+            print(f"{Fore.WHITE}[耗时: 本轮 {turn.last:.2f}s, p50 {turn.percentile(0.5):.2f}s, "
+                  f"p99 {turn.percentile(0.99):.2f}s]{Fore.RESET}")
         # 自动保存历史对话
         agent.memory.save("1")
\ No newline at end of file
@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+AI智能体对话系统 - ASGI服务启动脚本(异步处理对话请求,支持大量并发会话)
+"""
+
+import sys
+import os
+
+import uvicorn
+
+# 添加当前目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from web.asgi import application
+from src.config.config_model import config
+from src.extend.openai.http_pool import warm_up_in_background
+
+if __name__ == '__main__':
+    # 后台预热模型服务(建立连接、加载ollama模型)
+    warm_up_in_background([config.llm_model, config.summary_model])
+    uvicorn.run(application, host='0.0.0.0', port=5000)
@@ -11,6 +11,10 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from web.app import app
+from src.config.config_model import config
+from src.extend.openai.http_pool import warm_up_in_background
 
 if __name__ == '__main__':
+    # 后台预热模型服务(建立连接、加载ollama模型)
+    warm_up_in_background([config.llm_model, config.summary_model])
     app.run(debug=True, host='0.0.0.0', port=5000)
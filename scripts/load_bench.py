@@ -0,0 +1,76 @@
+"""
+ASGI模式压测: 使用本地假模型,统计并发对话的吞吐量(req/s)与延迟(p50/p99)
+
+运行: python scripts/load_bench.py [并发数] [每个并发的请求数] [模型延迟秒数]
+(测试见 tests/test_benchmark.py)
+"""
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from src.config.config_model import config
+from src.entity.agent.langgraph_agent import Langgraph_Agent
+from tests.fake_model import FakeLLM_Model
+import web.routes as routes
+from web.asgi import application
+
+
+def percentile(values, p: float) -> float:
+    """计算百分位数(最近秩法)"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run_user(requests_per_user: int, latencies: list):
+    """一个独立会话(独立cookie)连续发送消息"""
+    transport = httpx.ASGITransport(app=application)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        await client.post("/new_session", data={"temp_session_id": f"新会话_{id(latencies)}_{time.perf_counter_ns()}"})
+        for i in range(requests_per_user):
+            start = time.perf_counter()
+            response = await client.post("/send_message", data={"message": f"问题{i}"})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+
+def use_fake_models(latency: float, set_attr=setattr):
+    """
+    服务端改用假模型(测试中传入 monkeypatch.setattr,结束后恢复全局配置)
+
+    摘要同样使用假模型,避免压测期间访问网络;压测服务端处理路径,关闭模型响应缓存
+    """
+    set_attr(config, "summary_model", FakeLLM_Model())
+    set_attr(config.llm_cache, "mode", "off")
+    set_attr(routes, "agent", Langgraph_Agent(FakeLLM_Model(latency=latency)))
+
+
+async def load_test(concurrency: int, requests_per_user: int) -> dict:
+    """并发发送消息(服务端的智能体由调用方设置,见 use_fake_models)"""
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_user(requests_per_user, latencies) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    concurrency = int(args[0]) if len(args) > 0 else 200
+    requests_per_user = int(args[1]) if len(args) > 1 else 5
+    latency = float(args[2]) if len(args) > 2 else 0.2
+    use_fake_models(latency)
+    result = asyncio.run(load_test(concurrency, requests_per_user))
+    print(f"并发: {concurrency}  请求数: {result['requests']}  模型延迟: {latency * 1000:.0f} ms")
+    print(f"吞吐量: {result['rps']:.1f} req/s")
+    print(f"延迟 p50: {result['p50_ms']:.1f} ms  p99: {result['p99_ms']:.1f} ms")
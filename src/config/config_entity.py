@@ -1,6 +1,6 @@
-from typing import Optional
+from typing import Dict, List, Optional
 from langchain.chat_models import init_chat_model
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import pymysql
 import os
 
@@ -13,18 +13,47 @@ class LLM_Model:
     base_url: Optional[str] = None  # API基础URL
     key: Optional[str] = None  # API密钥
     temperature: float = 0.0  # 生成温度
+    keep_alive: Optional[str] = "30m"  # ollama: 模型在显存中保留的时间(保留期间可复用提示词前缀的KV缓存)
 
-    def init_model(self):
-        """初始化语言模型"""
+    def init_model(self, cache=None):
+        """初始化语言模型(传入响应缓存时,仅在temperature为0时启用)"""
+        kwargs = {"cache": cache} if cache is not None and self.temperature == 0 else {}
+        if self.model_provider == "ollama" and self.keep_alive:
+            kwargs["keep_alive"] = self.keep_alive
+        # 所有模型客户端共用连接池(延迟导入: 连接池模块依赖配置)
+        from src.extend.openai.http_pool import client_kwargs
+        kwargs.update(client_kwargs(self.model_provider))
         return init_chat_model(
             model=self.model_name,
             model_provider=self.model_provider,
             base_url=self.base_url, 
             api_key=self.key,
-            temperature=self.temperature
+            temperature=self.temperature,
+            **kwargs
         )
 
 
+@dataclass
+class Route_Config:
+    """模型路由(models列表中的一项): 按顺序选择第一个满足条件的模型,都不满足时使用llm_model"""
+    name: str = "small"  # 路由名称(用于统计与日志)
+    model: LLM_Model = field(default_factory=LLM_Model)  # 该路由使用的模型
+    description: str = ""  # 适合处理的问题(model模式下提供给分类模型)
+    max_input_tokens: int = 200  # 本轮输入超过该token数时不使用(0表示不限制)
+    max_history_tokens: int = 0  # 会话历史超过该token数时不使用(0表示不限制)
+    exclude_keywords: List[str] = field(default_factory=list)  # 输入包含这些关键词时不使用
+    cost_per_1k_tokens: float = 0.0  # 每千token费用(用于统计)
+
+
+@dataclass
+class Router_Config:
+    """模型路由方式"""
+    mode: str = "heuristic"  # heuristic:按输入长度与关键词选择 model:由分类模型选择
+    classifier: LLM_Model = field(default_factory=LLM_Model)  # model模式使用的分类模型(建议本地小模型)
+    escalate: bool = True  # 模型出错、工具调用格式错误或没有回复时,改用下一个模型重试本轮
+    default_cost_per_1k_tokens: float = 0.0  # llm_model的每千token费用(用于统计)
+
+
 @dataclass
 class MySQL_Config:
     """MySQL数据库配置"""
@@ -47,6 +76,81 @@ class MySQL_Config:
         )
     
 
+@dataclass
+class Storage_Config:
+    """会话存储配置"""
+    backend: str = "file"  # 存储后端(file/sqlite/mysql)
+    file_dir: str = "./data/memory"  # file后端: 会话日志目录
+    sqlite_path: str = "./data/memory.db"  # sqlite后端: 数据库文件路径
+    pool_size: int = 5  # 数据库连接池大小
+    max_overflow: int = 10  # 连接池允许临时超出的连接数
+
+
+@dataclass
+class Cache_Config:
+    """模型响应缓存配置(仅在模型temperature为0时生效)"""
+    mode: str = "off"  # off:关闭(默认) exact:完全匹配 semantic:完全匹配+相似问题匹配
+    path: str = "./data/llm_cache.db"  # 缓存数据库文件路径
+    max_entries: int = 2000  # 最多缓存条数(超出时删除最久未使用的记录)
+    ttl: int = 86400  # 缓存有效期(秒,0表示不过期)
+    similarity: float = 0.92  # semantic模式的相似度阈值(余弦相似度)
+
+
+@dataclass
+class Tool_Config:
+    """工具执行配置(同一步内的多个工具调用并行执行)"""
+    max_workers: int = 8  # 工具线程池大小
+    timeout: float = 60.0  # 单个工具调用超时时间(秒,0表示不限制)
+    default_limit: int = 4  # 每个工具的默认并发上限
+    limits: Dict[str, int] = field(default_factory=lambda: {"run_cmd": 2})  # 按工具名单独设置的并发上限
+    max_output_tokens: int = 4000  # 单次工具输出的token上限(超出时截断并提示如何继续读取)
+    cmd_timeout: float = 50.0  # run_cmd执行时间上限(秒,超时结束整个进程组;应小于timeout)
+    cmd_max_output: int = 20000  # run_cmd保留的输出字符数上限(超出部分只实时输出不返回给模型)
+    persistent_shell: bool = False  # 每个会话复用一个常驻shell(仅Linux/macOS,默认每条命令启动新进程)
+    index_ignore: List[str] = field(default_factory=lambda: [
+        ".git", ".svn", ".hg", "node_modules", "__pycache__", ".venv", "venv", ".idea", ".mypy_cache"
+    ])  # scan_tree/find_files跳过的文件/目录名(支持通配符)
+
+
+@dataclass
+class Http_Config:
+    """模型服务HTTP连接池配置(对话模型与摘要模型共用)"""
+    max_connections: int = 20  # 最大连接数
+    max_keepalive_connections: int = 10  # 保持空闲的最大连接数
+    keepalive_expiry: float = 300.0  # 空闲连接保持时间(秒)
+    connect_timeout: float = 10.0  # 连接超时(秒)
+    read_timeout: float = 300.0  # 读取超时(秒,模型生成较慢时适当调大)
+    retries: int = 1  # 建立连接失败时的重试次数
+    warm_up: bool = True  # 启动时预先建立连接并加载ollama模型
+
+
+@dataclass
+class Trace_Config:
+    """调用追踪配置(记录每轮对话、模型调用与工具调用的耗时,不依赖LangSmith)"""
+    enabled: bool = True  # 是否记录追踪
+    buffer_size: int = 500  # 每个会话保留的最近span数
+    max_sessions: int = 100  # 最多保留追踪记录的会话数(超出时淘汰最久未使用的会话)
+    max_attr_chars: int = 500  # 记录的输入/输出最大长度
+    export_path: str = ""  # OTLP/JSON导出文件(为空时不导出),如 ./data/traces.jsonl
+    service_name: str = "ai-agent"  # 导出时的service.name
+
+
+@dataclass
+class Metrics_Config:
+    """本地性能指标配置(各阶段耗时分位数与token数,网页 /metrics 导出)"""
+    enabled: bool = True  # 是否记录指标
+    precision: int = 7  # 直方图每个2的幂区间的子桶位数(相对误差约 2^-(precision-1))
+    quantiles: List[float] = field(default_factory=lambda: [0.5, 0.9, 0.99])  # 导出的分位数
+
+
+@dataclass
+class Checkpoint_Config:
+    """检查点记忆配置(按会话增量保存graph状态,每轮只发送新消息)"""
+    backend: str = "off"  # off:每轮由HistoryMemory组装完整历史 memory:进程内检查点 sqlite:SQLite检查点
+    sqlite_path: str = "./data/checkpoints.db"  # backend为sqlite时的数据库文件
+    max_history_tokens: int = 0  # 发送给模型的历史上限(发送前裁剪,0表示使用max_token_limit)
+
+
 @dataclass
 class LangSmith_Config:
     """LangSmith监控配置"""
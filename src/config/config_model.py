@@ -8,7 +8,9 @@ from typing import List
 import yaml
 from cattrs import structure
 
-from src.config.config_entity import LLM_Model, MySQL_Config, LangSmith_Config
+from src.config.config_entity import (LLM_Model, MySQL_Config, LangSmith_Config, Storage_Config, Cache_Config,
+                                      Tool_Config, Http_Config, Route_Config, Router_Config, Trace_Config,
+                                      Metrics_Config, Checkpoint_Config)
 
 
 @dataclass(order=True)
@@ -16,11 +18,27 @@ class Project:
     """项目配置类"""
     name: str = 'dev'
     max_token_limit: int = 4096  # 会话记忆最大长度(超出会自动生成摘要)
+    summary_soft_ratio: float = 0.75  # 历史达到max_token_limit*该比例时在后台提前生成摘要
+    summary_keep_turns: int = 2  # 摘要时保留原文的最近对话轮数
+    summary_max_blocks: int = 4  # 摘要块数量上限(超出时合并为更高层级的摘要)
+    tokenizer: str = 'estimate'  # token计数方式(estimate:离线估算 tiktoken:cl100k_base:精确计数)
+    memory_max_threads: int = 256  # 内存中最多缓存的会话数(超出时按LRU淘汰,淘汰前回写存储)
+    memory_ttl: int = 0  # 会话闲置超过该秒数后移出内存(0表示不按时间淘汰)
     max_steps: int = 10  # 迭代次数限制(单次回答)
+    graph_cache_size: int = 32  # 已编译graph的缓存数量(按模型+工具集合,LRU,工具变化时直接复用)
     llm_model: LLM_Model = field(default_factory=LLM_Model)  # 语言模型(生产力模型)
     summary_model: LLM_Model = field(default_factory=LLM_Model)  # 摘要模型(推荐使用本地小模型进行摘要)
+    models: List[Route_Config] = field(default_factory=list)  # 可选的小模型(简单问题优先使用,失败时升级到llm_model)
+    router: Router_Config = field(default_factory=Router_Config)  # 模型路由方式
+    llm_cache: Cache_Config = field(default_factory=Cache_Config)  # 模型响应缓存配置
+    tool_config: Tool_Config = field(default_factory=Tool_Config)  # 工具执行配置
+    http_config: Http_Config = field(default_factory=Http_Config)  # 模型服务HTTP连接池配置
+    trace: Trace_Config = field(default_factory=Trace_Config)  # 调用追踪配置
+    metrics: Metrics_Config = field(default_factory=Metrics_Config)  # 本地性能指标配置
+    checkpoint: Checkpoint_Config = field(default_factory=Checkpoint_Config)  # 检查点记忆配置
     langsmith_config: LangSmith_Config = field(default_factory=LangSmith_Config)  # LangSmith配置(监控模型指标)
     mysql: MySQL_Config = field(default_factory=MySQL_Config)  # 数据库配置
+    storage: Storage_Config = field(default_factory=Storage_Config)  # 会话存储配置
 
 
 @dataclass
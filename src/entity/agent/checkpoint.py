@@ -0,0 +1,125 @@
+"""
+检查点记忆
+
+启用后每个会话(thread_id)的完整消息状态(含工具调用与工具结果)由LangGraph检查点增量保存,
+每轮只向graph发送新的用户消息;发送给模型前由 trim_history 按token上限裁剪历史并加上系统提示,
+超出上限的旧消息在下一轮开始时从检查点中移除(对话原文仍由HistoryMemory保存)。
+"""
+import os
+import asyncio
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, RemoveMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import InMemorySaver
+
+from src.config.config_entity import Checkpoint_Config
+from src.config.config_model import config as project_config
+from src.extend.openai.token_counter import token_counter
+
+
+def _create_sqlite_saver(path: str) -> BaseCheckpointSaver:
+    """SQLite检查点(异步接口在线程中执行同步方法,ainvoke/astream也可使用)"""
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+    except ImportError as e:
+        raise ImportError("checkpoint.backend为sqlite时需要安装 langgraph-checkpoint-sqlite") from e
+
+    class ThreadedSqliteSaver(SqliteSaver):
+        async def aget_tuple(self, config: RunnableConfig):
+            return await asyncio.to_thread(self.get_tuple, config)
+
+        async def alist(self, config, *, filter=None, before=None, limit=None):
+            for item in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before,
+                                                                      limit=limit))):
+                yield item
+
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+        async def aput_writes(self, config, writes, task_id, task_path=""):
+            return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+        async def adelete_thread(self, thread_id: str):
+            return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return ThreadedSqliteSaver(sqlite3.connect(path, check_same_thread=False))
+
+
+def create_checkpointer(options: Checkpoint_Config) -> Optional[BaseCheckpointSaver]:
+    """按配置创建检查点(backend为off时返回None,使用HistoryMemory组装历史)"""
+    if options.backend == "off":
+        return None
+    if options.backend == "memory":
+        return InMemorySaver()
+    if options.backend == "sqlite":
+        return _create_sqlite_saver(options.sqlite_path)
+    raise ValueError(f"不支持的检查点后端: {options.backend}")
+
+
+def count_message_tokens(messages: List[BaseMessage]) -> int:
+    """消息列表的token数(工具调用参数计入)"""
+    total = 0
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        total += token_counter.count_message(message.type, content)
+        for call in getattr(message, "tool_calls", None) or ():
+            total += token_counter.count(f"{call['name']}{call['args']}")
+    return total
+
+
+def trim_index(messages: List[BaseMessage], max_tokens: int) -> Tuple[int, int]:
+    """
+    计算裁剪位置: 从最新的消息向前保留不超过 max_tokens 的消息,只计算保留部分的token数
+
+    Returns:
+        (开头摘要块的条数, 保留部分的起始下标);保留 messages[:head] + messages[start:]。
+        保留部分从用户消息开始(工具调用与结果不会被拆开),本轮输入本身超过上限时至少保留本轮
+    """
+    head = 0
+    while head < len(messages) and messages[head].type == "system":
+        head += 1
+    budget = max_tokens - count_message_tokens(messages[:head])
+    start = len(messages)
+    while start > head:
+        budget -= count_message_tokens(messages[start - 1:start])
+        if budget < 0:
+            break
+        start -= 1
+    kept = next((i for i in range(start, len(messages)) if messages[i].type == "human"), None)
+    if kept is None:
+        kept = max((i for i in range(head, len(messages)) if messages[i].type == "human"), default=head)
+    return head, kept
+
+
+def history_limit(options: Dict) -> int:
+    """发送给模型的历史token上限"""
+    return options.get("max_history_tokens") or project_config.max_token_limit
+
+
+def expired_messages(messages: List[BaseMessage], options: Dict) -> List[RemoveMessage]:
+    """已超出裁剪范围、不会再发送给模型的消息(从检查点中移除,状态大小与每步的序列化开销保持稳定)"""
+    head, kept = trim_index(messages, history_limit(options))
+    return [RemoveMessage(id=m.id) for m in messages[head:kept]]
+
+
+def trim_history(state: Dict, config: RunnableConfig) -> List[BaseMessage]:
+    """
+    裁剪发送给模型的历史(作为graph的prompt在模型节点中执行)
+
+    由记忆初始化的开头的摘要块始终保留,最后在开头加上系统提示。
+    上限与系统提示都从运行配置的configurable中读取,graph本身与提示词无关。
+    """
+    options = config.get("configurable", {})
+    messages = state["messages"]
+    head, kept = trim_index(messages, history_limit(options))
+    trimmed = messages[:head] + messages[kept:]
+    system_prompt = options.get("system_prompt")
+    if system_prompt:
+        trimmed = [SystemMessage(content=system_prompt)] + trimmed
+    return trimmed
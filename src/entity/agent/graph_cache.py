@@ -0,0 +1,129 @@
+"""
+已编译graph缓存
+
+create_react_agent 每次编译都会重新构建执行图并把工具定义绑定到模型,ParallelToolNode还会创建线程池。
+编译结果按 模型实例 + 工具集合(与工具执行配置) 缓存在LRU中,增删工具时只需查表,
+工具集合相同的智能体/会话共用同一个graph。系统提示在每轮对话时组装(见PromptAssembler),
+不编译进graph,因此不作为缓存键。启用检查点时graph绑定检查点实例,并在模型节点中裁剪历史(trim_history)。
+"""
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Sequence, Tuple
+
+from langgraph.prebuilt import create_react_agent
+
+from src.config.config_model import config
+from src.entity.agent.checkpoint import trim_history
+from src.extend.parallel_tool_node import ParallelToolNode
+
+
+@dataclass
+class GraphCacheStats:
+    """graph缓存指标"""
+    hits: int = 0  # 命中次数
+    misses: int = 0  # 未命中(重新编译)次数
+    evictions: int = 0  # 超出容量被淘汰的次数
+
+
+def tool_name(tool: Any) -> str:
+    """工具名称(@tool装饰的工具为name,普通函数为__name__)"""
+    return getattr(tool, "name", None) or getattr(tool, "__name__", None) or str(tool)
+
+
+def tools_key(tools: Sequence) -> Tuple:
+    """工具集合的缓存键(与顺序无关,按对象区分同名的不同工具)"""
+    return tuple(sorted((tool_name(t), id(t)) for t in tools))
+
+
+def _tool_config_key() -> Tuple:
+    options = config.tool_config
+    return options.max_workers, options.timeout, options.default_limit, tuple(sorted(options.limits.items()))
+
+
+class GraphCache:
+    """按 模型 + 工具集合 缓存已编译graph与工具节点(LRU)"""
+
+    def __init__(self, max_size: int = 32):
+        self.max_size = max(1, max_size)
+        self.stats = GraphCacheStats()
+        # 缓存值同时保存模型、工具与检查点的引用,保证键中的id在缓存期间不会被复用
+        self._graphs: "OrderedDict[Tuple, Tuple[Any, Any, Sequence, Any]]" = OrderedDict()
+        self._tool_nodes: "OrderedDict[Tuple, Tuple[ParallelToolNode, Sequence]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _put(self, cache: OrderedDict, key: Tuple, value):
+        cache[key] = value
+        while len(cache) > self.max_size:
+            _, evicted = cache.popitem(last=False)
+            if cache is self._graphs:
+                self.stats.evictions += 1
+            else:
+                # 释放工具节点的线程池(仍在使用该节点的graph再次执行工具时会重新创建)
+                evicted[0].shutdown(wait=False)
+
+    def get_tool_node(self, tools: Sequence) -> ParallelToolNode:
+        """获取工具节点(同一工具集合的各模型共用一个节点与线程池)"""
+        key = (tools_key(tools), _tool_config_key())
+        with self._lock:
+            entry = self._tool_nodes.get(key)
+            if entry is not None:
+                self._tool_nodes.move_to_end(key)
+                return entry[0]
+        options = config.tool_config
+        node = ParallelToolNode(
+            list(tools),
+            max_workers=options.max_workers,
+            timeout=options.timeout,
+            default_limit=options.default_limit,
+            limits=options.limits
+        )
+        with self._lock:
+            # 并发创建时保留先放入的节点
+            entry = self._tool_nodes.get(key)
+            if entry is None:
+                entry = (node, tuple(tools))
+                self._put(self._tool_nodes, key, entry)
+            return entry[0]
+
+    def get_graph(self, model, tools: Sequence, checkpointer=None):
+        """获取模型与工具集合对应的graph(未缓存时编译,指定checkpointer时按会话保存状态)"""
+        key = (id(model), tools_key(tools), _tool_config_key(), id(checkpointer))
+        with self._lock:
+            entry = self._graphs.get(key)
+            if entry is not None:
+                self._graphs.move_to_end(key)
+                self.stats.hits += 1
+                return entry[0]
+        # v1: 一条消息中的全部工具调用交给同一个工具节点处理
+        # 检查点模式下状态包含完整会话,发送给模型前裁剪(不使用pre_model_hook,避免每步多一个节点与检查点)
+        prompt = trim_history if checkpointer is not None else None
+        graph = create_react_agent(model=model, tools=self.get_tool_node(tools), version="v1",
+                                   prompt=prompt, checkpointer=checkpointer)
+        with self._lock:
+            entry = self._graphs.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                entry = (graph, model, tuple(tools), checkpointer)
+                self._put(self._graphs, key, entry)
+            else:
+                self.stats.hits += 1
+                self._graphs.move_to_end(key)
+            return entry[0]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {**asdict(self.stats), "size": len(self._graphs), "tool_nodes": len(self._tool_nodes)}
+
+    def clear(self):
+        """清空缓存(工具执行配置之外的设置变化后调用)"""
+        with self._lock:
+            self._graphs.clear()
+            nodes = [entry[0] for entry in self._tool_nodes.values()]
+            self._tool_nodes.clear()
+        for node in nodes:
+            node.shutdown(wait=False)
+
+
+# 全局graph缓存(所有智能体共用)
+graph_cache = GraphCache(config.graph_cache_size)
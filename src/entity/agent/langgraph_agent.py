@@ -1,31 +1,83 @@
-from typing import List, Callable
-from langgraph.prebuilt import create_react_agent
+import time
+import uuid
+import asyncio
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, List, Callable, Dict, Iterator, AsyncIterator, Optional, Tuple
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage, convert_to_messages
 from langgraph.errors import GraphRecursionError
 
 from src.extend.openai.summarizing_memory import HistoryMemory
-from src.config.config_entity import LLM_Model
+from src.config.config_entity import LLM_Model, Route_Config
 from src.extend.openai.openai_message import OpenAIMessage
+from src.extend.openai.llm_cache import get_response_cache
+from src.extend.openai.prompt_prefix import PromptAssembler
+from src.extend.tool_memo import current_thread_id
+from src.extend.tracing import SPAN_INVOKE, Span, tracer
+from src.extend.metrics import PHASE_SECONDS, TURNS_TOTAL, metrics
+from src.entity.agent.model_router import DEFAULT_ROUTE, ModelRouter, completed_steps, failure_reason
+from src.entity.agent.graph_cache import graph_cache, tool_name as get_tool_name
+from src.entity.agent.checkpoint import (create_checkpointer, expired_messages, history_limit, trim_history,
+                                         trim_index)
 from src.config.config_model import config
 
+# stream/astream使用的流模式
+STREAM_MODES = ["messages", "values", "custom"]
+
+
+@dataclass
+class _TurnState:
+    """一轮对话的graph输入(升级到下一个模型时累积之前已执行完的工具步骤)"""
+    thread_id: str
+    max_steps: int
+    messages: List  # 本轮发送给graph的消息
+    history_len: int  # 提问消息在结果中的下标
+    input_len: int  # 本轮输入后状态中的消息数
+    configurable: Optional[Dict]  # 检查点运行参数(未启用检查点时为None)
+    carried: List = field(default_factory=list)  # 之前的尝试中已执行完的工具调用与结果
+
+    @property
+    def attempt_input_len(self) -> int:
+        """本次尝试输入后状态中的消息数"""
+        return self.input_len + len(self.carried)
+
+    def graph_input(self) -> Dict:
+        return {"messages": self.messages + self.carried}
+
+
 class Langgraph_Agent:
-    def __init__(self, model: LLM_Model, tools: List = None, system_prompt: str = None):
+    def __init__(self, model: LLM_Model, tools: List = None, system_prompt: str = None,
+                 routes: List[Route_Config] = None, checkpointer=None):
         """
         初始化LangGraph智能体
         
         Args:
-            model: LLM_Model对象，包含init_model()方法
+            model: LLM_Model对象，包含init_model()方法(temperature为0时启用响应缓存)
             tools: 工具列表
             system_prompt: 系统提示信息
+            routes: 可选的小模型路由(默认使用配置中的models,简单问题优先使用,失败时升级到model)
+            checkpointer: LangGraph检查点(默认按配置checkpoint.backend创建,backend为off时每轮重放完整历史)
         """
-        self.model = model.init_model()
+        cache = get_response_cache()
+        self.model = model.init_model(cache=cache)
+        routes = config.models if routes is None else routes
+        self.router = ModelRouter(routes, config.router)
+        # 各路由的聊天模型(llm_model对应DEFAULT_ROUTE)
+        self.models = {route.name: route.model.init_model(cache=cache) for route in routes}
+        self.models[DEFAULT_ROUTE] = self.model
         self.tools = tools.copy() if tools else []
         self.system_prompt = system_prompt
         self.memory = HistoryMemory()
+        self.prompt = PromptAssembler()
+        self.checkpointer = checkpointer if checkpointer is not None else create_checkpointer(config.checkpoint)
         self._init_graph()
 
     def _init_graph(self):
-        """初始化或刷新graph对象"""
-        self.graph = create_react_agent(model=self.model, tools=self.tools)
+        """初始化或刷新各路由的graph对象(按模型+工具集合从缓存中获取,未缓存时才编译)"""
+        self.prompt.set_tools(self.tools)
+        self.graphs = {name: graph_cache.get_graph(model, self.tools, self.checkpointer)
+                       for name, model in self.models.items()}
+        self.graph = self.graphs[DEFAULT_ROUTE]
 
     # --- 工具管理方法 ---
     def add_tool(self, tool: Callable):
@@ -35,7 +87,7 @@ class Langgraph_Agent:
 
     def remove_tool(self, tool_name: str):
         """根据工具名称移除工具并刷新graph"""
-        self.tools = [t for t in self.tools if getattr(t, "__name__", None) != tool_name]
+        self.tools = [t for t in self.tools if get_tool_name(t) != tool_name]
         self._init_graph()
 
     def set_tools(self, tools: List):
@@ -45,10 +97,105 @@ class Langgraph_Agent:
 
     def list_tools(self) -> List[str]:
         """返回当前工具列表名称"""
-        return [getattr(t, "__name__", str(t)) for t in self.tools]
+        return [get_tool_name(t) for t in self.tools]
+
+    def _build_messages(self, user_input: str, thread_id: str):
+        """
+        组装本轮发送给graph的消息,并记录用户输入(可能读取存储或等待摘要,异步调用时在线程池中执行)
+
+        Returns:
+            (消息列表, 提问消息在结果中的下标, 本轮输入后的消息数, 检查点运行参数(未启用检查点时为None))
+        """
+        with metrics.timer(PHASE_SECONDS, phase="history"):
+            if self.checkpointer is not None:
+                messages, input_len, configurable = self._checkpoint_messages(user_input, thread_id)
+                self.memory.add_message(thread_id, "user", user_input)
+                return messages, input_len - 1, input_len, configurable
+            # 按稳定前缀的顺序组装系统提示、历史消息与当前输入
+            history_messages = self.memory.get_history(thread_id)
+            history_len = len(history_messages) if history_messages else 1
+            messages = self.prompt.assemble(thread_id, self.system_prompt, history_messages, user_input)
+        self.memory.add_message(thread_id, "user", user_input)
+        return messages, history_len, len(messages), None
+
+    def _checkpoint_messages(self, user_input: str, thread_id: str):
+        """
+        检查点模式下的本轮消息: 已有检查点时只发送新消息(并移除超出裁剪范围的旧消息),从上次成功的检查点继续;
+        会话还没有检查点时(新会话、重启后的内存检查点、从存储加载的会话)用记忆中裁剪范围内的历史初始化。
+        发送前由graph中的trim_history裁剪,记忆不再生成摘要;前缀指标按第一次调用模型时发送的消息统计。
+
+        Returns:
+            (消息列表, 本轮输入后状态中的消息数, 运行参数configurable)
+        """
+        # turn_id写入本轮检查点的元数据,用于区分其他智能体实例写入的检查点
+        configurable = {"thread_id": thread_id, "system_prompt": self.system_prompt,
+                        "max_history_tokens": config.checkpoint.max_history_tokens, "turn_id": uuid.uuid4().hex}
+        question = HumanMessage(content=user_input)
+        # 失败的对话结束时会把最后一个成功的检查点恢复为最新检查点,因此最新检查点总是成功状态
+        base = self.checkpointer.get_tuple({"configurable": {"thread_id": thread_id}})
+        if base is None:
+            history = convert_to_messages(self.memory.get_history(thread_id, summarize=False))
+            head, kept = trim_index(history + [question], history_limit(configurable))
+            messages = history[:head] + history[kept:] + [question]
+            self._observe_prompt(thread_id, messages, configurable)
+            return messages, len(messages), configurable
+        # 本轮各次尝试固定从该检查点分叉,升级前失败的尝试不会进入下一次尝试
+        configurable["checkpoint_id"] = base.config["configurable"]["checkpoint_id"]
+        base_messages = base.checkpoint["channel_values"].get("messages", [])
+        expired = expired_messages(base_messages, configurable)
+        removed = {message.id for message in expired}
+        self._observe_prompt(thread_id, [m for m in base_messages if m.id not in removed] + [question], configurable)
+        return expired + [question], len(base_messages) - len(expired) + 1, configurable
+
+    def _observe_prompt(self, thread_id: str, state: List, configurable: Dict):
+        """统计检查点模式下第一次调用模型时发送的消息(与graph中的trim_history结果一致)"""
+        self.prompt.observe(thread_id, trim_history({"messages": state}, {"configurable": configurable}),
+                            self.system_prompt)
+
+    def _checkpoint_done(self, thread_id: str, configurable: Optional[Dict], ok: bool):
+        """
+        失败时回退会话状态: 把本轮开始时的检查点复制为最新检查点(不按会话缓存检查点id,内存占用不随会话数增长);
+        成功时本轮写入的最新检查点即为下一轮的起点。
+
+        没有可回退的检查点时只删除本轮写入的检查点: 会话中存在其他智能体实例(共用SQLite检查点)
+        写入的检查点时不删除,改为从其中最新的一个继续,不会清空其他实例正在写入的会话。
+        """
+        if configurable is None or ok:
+            return
+        if configurable.get("checkpoint_id") is None:
+            turn_id = configurable["turn_id"]
+            other = next((item for item in self.checkpointer.list({"configurable": {"thread_id": thread_id}})
+                          if item.metadata.get("turn_id") != turn_id), None)
+            if other is None:
+                self.checkpointer.delete_thread(thread_id)
+                return
+            configurable["checkpoint_id"] = other.config["configurable"]["checkpoint_id"]
+        self.graph.update_state({"configurable": {"thread_id": thread_id, "checkpoint_ns": "",
+                                                  "checkpoint_id": configurable["checkpoint_id"]}}, None)
+
+    def _history_tokens(self, thread_id: str) -> int:
+        """路由判断使用的历史token数(检查点模式下发送给模型的历史不超过裁剪上限)"""
+        total = self.memory.get_token_total(thread_id)
+        if self.checkpointer is not None:
+            total = min(total, config.checkpoint.max_history_tokens or config.max_token_limit)
+        return total
+
+    def reset_checkpoint(self, thread_id: str):
+        """删除会话的检查点(历史被改写或会话改名后调用,下一轮从记忆中的历史重新初始化)"""
+        if self.checkpointer is not None:
+            self.checkpointer.delete_thread(thread_id)
+
+    def delete_thread(self, thread_id: str):
+        """移除会话的记忆线程与检查点"""
+        self.memory.remove_thread(thread_id)
+        self.reset_checkpoint(thread_id)
+
+    def get_prefix_stats(self, thread_id: str = None) -> Dict:
+        """获取提示词前缀的稳定性指标(不传thread_id时返回全部会话合计)"""
+        return self.prompt.get_stats(thread_id)
 
     def invoke(self, user_input: str, thread_id: str = "1", max_steps: int = None, 
-               stream_func: Callable = None) -> OpenAIMessage:
+               stream_func: Callable = None, stream_tokens: bool = False) -> OpenAIMessage:
         """
         调用智能体处理用户输入
         
@@ -56,65 +203,294 @@ class Langgraph_Agent:
             user_input: 提问内容
             thread_id: 会话id
             max_steps: 最大递归次数
-            stream_func: 流式调用时的回调函数
+            stream_func: 流式调用时的回调函数 stream_func(角色, 内容)
+            stream_tokens: 为True时模型回复按token增量以 stream_func("token", 增量) 实时回调,
+                           已逐token输出的回复不再整条回调
             
         Returns:
             OpenAIMessage: 处理结果
         """
-        # 准备消息
-        max_steps = max_steps or config.max_steps
-        messages = []
-        
-        # 添加系统提示
-        if self.system_prompt:
-            messages.append(("system", self.system_prompt))
-            
-        # 添加历史消息
-        history_messages = self.memory.get_history(thread_id)
-        history_len = len(history_messages) if history_messages else 1
-        if history_messages:
-            messages.extend(history_messages)
-            history_len = len(history_messages)
-        
-        # 添加当前用户输入
-        messages.append(("user", user_input))
-        self.memory.add_message(thread_id, "user", user_input)
+        # 同一会话的轮次串行执行,不同会话可并行
+        queued = time.perf_counter()
+        with self.memory.turn_lock(thread_id), self._turn(user_input, thread_id, queued) as span:
+            streamed = False
+            for kind, payload, started in self._run_attempts(user_input, thread_id, max_steps, span,
+                                                             self._invoke_modes(stream_func, stream_tokens)):
+                streamed = self._invoke_event(kind, payload, started, stream_func, streamed)
+                if kind == "result":
+                    return payload
+
+    async def ainvoke(self, user_input: str, thread_id: str = "1", max_steps: int = None,
+                      stream_func: Callable = None, stream_tokens: bool = False) -> OpenAIMessage:
+        """异步调用智能体处理用户输入(参数与invoke相同)"""
+        queued = time.perf_counter()
+        # 与invoke/stream共用同一会话的轮次锁(在线程池中等待与加载会话)
+        async with self.memory.async_turn_lock(thread_id):
+            with self._turn(user_input, thread_id, queued) as span:
+                streamed = False
+                async for kind, payload, started in self._arun_attempts(
+                        user_input, thread_id, max_steps, span, self._invoke_modes(stream_func, stream_tokens)):
+                    streamed = self._invoke_event(kind, payload, started, stream_func, streamed)
+                    if kind == "result":
+                        return payload
+
+    def stream(self, user_input: str, thread_id: str = "1", max_steps: int = None) -> Iterator[Dict]:
+        """
+        流式调用智能体,在生成过程中逐个产出事件
         
-        # 处理响应
+        事件格式:
+            {"type": "token", "content": str}  模型输出的token增量
+            {"type": "tool_call", "name": str, "args": dict}  模型请求调用工具
+            {"type": "tool_output", "name": str, "content": str}  工具执行过程中的实时输出(如命令输出)
+            {"type": "tool_result", "name": str, "content": str}  工具执行结果
+            {"type": "router", "content": str}  当前模型处理失败,改用下一个模型继续本轮(之前输出的token作废,
+                                                已执行的工具结果保留,不会重复执行)
+            {"type": "done", "content": str}  最终回复
+            {"type": "error", "content": str}  错误信息
+        """
+        queued = time.perf_counter()
+        with self.memory.turn_lock(thread_id), self._turn(user_input, thread_id, queued) as span:
+            for kind, payload, started in self._run_attempts(user_input, thread_id, max_steps, span, STREAM_MODES):
+                yield from self._stream_item(kind, payload, started)
+
+    async def astream(self, user_input: str, thread_id: str = "1", max_steps: int = None) -> AsyncIterator[Dict]:
+        """异步流式调用智能体(事件格式与stream相同)"""
+        queued = time.perf_counter()
+        async with self.memory.async_turn_lock(thread_id):
+            with self._turn(user_input, thread_id, queued) as span:
+                async for kind, payload, started in self._arun_attempts(user_input, thread_id, max_steps, span,
+                                                                        STREAM_MODES):
+                    for event in self._stream_item(kind, payload, started):
+                        yield event
+
+    def _run_attempts(self, user_input: str, thread_id: str, max_steps: int, span: Span,
+                      stream_mode: List[str]) -> Iterator[Tuple[str, Any, bool]]:
+        """
+        按路由依次尝试处理本轮对话,失败时升级到下一个模型(invoke与stream共用)
+
+        升级时从上一个模型已执行完的工具步骤继续,已经执行过的工具不会重复执行。
+
+        Yields:
+            ("graph", (mode, data), started)  graph的流式输出(started: 本次尝试之前是否已产出过完整状态)
+            ("router", 提示信息, False)  当前模型处理失败,改用下一个模型
+            ("result", OpenAIMessage, False)  本轮结果(最后一项)
+        """
+        # 先选择模型再记录用户输入: 选择失败时不会留下没有回复的提问
+        plan = self.router.plan(user_input, self._history_tokens(thread_id))
+        turn = self._start_turn(user_input, thread_id, max_steps)
+        for index, route in enumerate(plan):
+            started, last_result, error = time.monotonic(), None, None
+            try:
+                for mode, data in self.graphs[route].stream(turn.graph_input(),
+                                                            config=self._run_config(turn, span, route),
+                                                            stream_mode=stream_mode):
+                    yield "graph", (mode, data), last_result is not None
+                    if mode == "values":
+                        last_result = data
+            except Exception as e:
+                error = e
+            notice = self._attempt_done(turn, plan, index, started, last_result, error)
+            if notice is None:
+                yield "result", self._turn_result(turn, route, last_result, error, span), False
+                return
+            span.set(escalations=index + 1)
+            yield "router", notice, False
+
+    async def _arun_attempts(self, user_input: str, thread_id: str, max_steps: int, span: Span,
+                             stream_mode: List[str]) -> AsyncIterator[Tuple[str, Any, bool]]:
+        """_run_attempts 的异步实现(ainvoke与astream共用,读写存储与检查点在线程池中执行)"""
+        plan = await self.router.aplan(user_input, await asyncio.to_thread(self._history_tokens, thread_id))
+        turn = await asyncio.to_thread(self._start_turn, user_input, thread_id, max_steps)
+        for index, route in enumerate(plan):
+            started, last_result, error = time.monotonic(), None, None
+            try:
+                async for mode, data in self.graphs[route].astream(turn.graph_input(),
+                                                                   config=self._run_config(turn, span, route),
+                                                                   stream_mode=stream_mode):
+                    yield "graph", (mode, data), last_result is not None
+                    if mode == "values":
+                        last_result = data
+            except Exception as e:
+                error = e
+            notice = await asyncio.to_thread(self._attempt_done, turn, plan, index, started, last_result, error)
+            if notice is None:
+                yield "result", await asyncio.to_thread(self._turn_result, turn, route, last_result, error, span), False
+                return
+            span.set(escalations=index + 1)
+            yield "router", notice, False
+
+    def _start_turn(self, user_input: str, thread_id: str, max_steps: int) -> "_TurnState":
+        """组装本轮的输入状态"""
+        messages, history_len, input_len, configurable = self._build_messages(user_input, thread_id)
+        return _TurnState(thread_id, max_steps or config.max_steps, messages, history_len, input_len, configurable)
+
+    def _attempt_done(self, turn: "_TurnState", plan: List[str], index: int, started: float,
+                      last_result: Optional[Dict], error: Optional[Exception]) -> Optional[str]:
+        """
+        记录一次模型尝试并判断是否需要升级(需要升级时把已执行完的工具步骤带入下一次尝试)
+
+        Returns:
+            需要改用下一个模型继续时返回提示信息,否则返回None(接受本次的结果或错误)
+        """
+        input_len = turn.attempt_input_len
+        messages = last_result["messages"] if last_result else []
+        new_messages = messages[input_len:]
+        reason = f"{type(error).__name__}: {error}" if error else failure_reason(new_messages)
+        escalate = reason is not None and index < len(plan) - 1
+        self.router.record(plan[index], time.monotonic() - started, messages, input_len,
+                           failed=reason is not None, escalated=escalate)
+        self._checkpoint_done(turn.thread_id, turn.configurable, ok=not escalate and error is None)
+        if not escalate:
+            return None
+        turn.carried += completed_steps(new_messages)
+        return f"{plan[index]} 处理失败({reason}),改用 {plan[index + 1]} 继续"
+
+    def _turn_result(self, turn: "_TurnState", route: str, last_result: Optional[Dict],
+                     error: Optional[Exception], span: Span) -> OpenAIMessage:
+        """整理本轮结果并记录到span"""
+        if error:
+            result = self._error_result(error, turn.max_steps)
+        else:
+            result = self._finish(turn.thread_id, last_result, turn.history_len, route)
+        return self._traced(span, result)
+
+    def _invoke_event(self, kind: str, payload, started: bool, stream_func: Callable, streamed: bool) -> bool:
+        """
+        把一项尝试输出交给invoke的回调函数
+
+        Returns:
+            当前这一步的回复是否已逐token输出(已输出的回复不再整条回调)
+        """
+        if not stream_func:
+            return False
+        if kind == "router":
+            stream_func("router", payload)
+            return False
+        if kind == "result":
+            if not payload.isOk:
+                stream_func("error", str(payload))
+            return False
+        mode, event = payload
+        # 工具执行过程中的实时输出(如run_cmd的命令输出)
+        if mode == "custom":
+            stream_func(event["type"], event["content"])
+            return streamed
+        # 模型回复的token增量
+        if mode == "messages":
+            return self._emit_token(event, stream_func) or streamed
+        # 跳过第一次迭代的打印,已逐token输出的回复不再整条打印
+        if started and not (streamed and isinstance(event["messages"][-1], AIMessage)):
+            self._emit_step(event, stream_func)
+        return False
+
+    def _stream_item(self, kind: str, payload, started: bool) -> List[Dict]:
+        """把一项尝试输出转换为stream事件"""
+        if kind == "router":
+            return [{"type": "router", "content": payload}]
+        if kind == "result":
+            if payload.isOk:
+                return [{"type": "done", "content": payload.last_message}]
+            return [{"type": "error", "content": str(payload.error_data)}]
+        return self._stream_events(*payload, started)
+
+    @staticmethod
+    @contextmanager
+    def _turn(user_input: str, thread_id: str, queued: float):
+        """记录一轮对话的span与耗时(queued为开始等待轮次锁的时间)"""
+        # 工具缓存按会话隔离(在调用方的上下文中设置,异步调用时工具同样可见)
+        current_thread_id.set(thread_id)
+        started = time.perf_counter()
+        metrics.observe(PHASE_SECONDS, started - queued, phase="queue")
         try:
-            events = self.graph.stream(
-                {"messages": messages},
-                config={"recursion_limit": max_steps},
-                stream_mode="values"
-            )
-            
-            last_result = None
-            for event in events:
-                msg = event["messages"][-1]
-                role = getattr(msg, "role", getattr(msg, "type", "unknown"))
-                content = getattr(msg, "content", str(msg))
-                
-                # 跳过第一次迭代的打印
-                if stream_func and last_result:
-                    stream_func(role, content)
-                    
-                last_result = event
-            
-            # 处理最终结果
-            all_messages = OpenAIMessage(last_result['messages'], history_len)
-            self.memory.add_message(thread_id, "assistant", all_messages.last_message)
-            
-        except GraphRecursionError:
-            all_messages = OpenAIMessage().set_error(f"超过最大递归次数限制：{max_steps} 次")
-            if stream_func:
-                stream_func("error", str(all_messages))
-                
-        except Exception as e:
-            all_messages = OpenAIMessage().set_error(str(e))
-            if stream_func:
-                stream_func("error", str(all_messages))
-                
-        return all_messages
+            with tracer.span("invoke", SPAN_INVOKE, thread_id, input=tracer.truncate(user_input)) as span:
+                yield span
+        finally:
+            metrics.observe(PHASE_SECONDS, time.perf_counter() - started, phase="turn")
+
+    @staticmethod
+    def _traced(span: Span, result: OpenAIMessage) -> OpenAIMessage:
+        """把本轮对话的结果记录到span"""
+        span.set(route=result.route)
+        metrics.inc(TURNS_TOTAL, status="ok" if result.isOk else "error")
+        if result.isOk:
+            span.set(output=tracer.truncate(result.last_message))
+        else:
+            span.fail(result.error_data)
+        return result
+
+    @staticmethod
+    def _run_config(turn: "_TurnState", span: Span, route: str) -> Dict:
+        """graph运行配置(模型与工具调用记录为span的子span,并记录耗时与token数;检查点模式下带上会话参数)"""
+        run_config = {"recursion_limit": turn.max_steps,
+                      "callbacks": tracer.callbacks(span, route=route) + metrics.callbacks(route=route)}
+        if turn.configurable is not None:
+            run_config["configurable"] = turn.configurable
+        return run_config
+
+    def get_route_stats(self) -> Dict[str, Dict]:
+        """获取各模型路由的调用次数、失败/升级次数、耗时与token消耗"""
+        return self.router.get_stats()
+
+    @staticmethod
+    def _invoke_modes(stream_func: Callable, stream_tokens: bool) -> List[str]:
+        """invoke使用的流模式(没有回调函数时只需要完整状态)"""
+        if not stream_func:
+            return ["values"]
+        return ["values", "custom", "messages"] if stream_tokens else ["values", "custom"]
+
+    @staticmethod
+    def _emit_token(event, stream_func: Callable) -> bool:
+        """把模型回复的token增量交给回调函数,返回是否有输出"""
+        chunk, _ = event
+        if isinstance(chunk, AIMessage) and chunk.content and isinstance(chunk.content, str):
+            stream_func("token", chunk.content)
+            return True
+        return False
+
+    @staticmethod
+    def _emit_step(event: Dict, stream_func: Callable):
+        """把一步完整状态的最后一条消息交给回调函数"""
+        msg = event["messages"][-1]
+        role = getattr(msg, "role", getattr(msg, "type", "unknown"))
+        content = getattr(msg, "content", str(msg))
+        stream_func(role, content)
+
+    @staticmethod
+    def _stream_events(mode: str, data, started: bool) -> List[Dict]:
+        """把graph的流式输出转换为stream事件"""
+        events = []
+        if mode == "custom":
+            # 工具通过stream writer写入的事件,原样转发
+            return [data]
+        if mode == "values":
+            # 完整状态: 用于识别完整的工具调用请求
+            msg = data["messages"][-1]
+            if started and isinstance(msg, AIMessage):
+                for tool_call in msg.tool_calls:
+                    events.append({"type": "tool_call", "name": tool_call["name"], "args": tool_call["args"]})
+            return events
+        chunk, _ = data
+        # 模型不支持流式输出时,整条回复会作为一个AIMessage产出
+        if isinstance(chunk, AIMessage):
+            if chunk.content and isinstance(chunk.content, str):
+                events.append({"type": "token", "content": chunk.content})
+        elif isinstance(chunk, ToolMessage):
+            events.append({"type": "tool_result", "name": chunk.name, "content": str(chunk.content)})
+        return events
+
+    def _finish(self, thread_id: str, last_result: Dict, history_len: int, route: str = DEFAULT_ROUTE) -> OpenAIMessage:
+        """整理最终结果并记录回复"""
+        result = OpenAIMessage(last_result["messages"], history_len)
+        result.route = route
+        self.memory.add_message(thread_id, "assistant", result.last_message)
+        return result
+
+    @staticmethod
+    def _error_result(e: Exception, max_steps: int) -> OpenAIMessage:
+        """把异常转换为错误结果"""
+        if isinstance(e, GraphRecursionError):
+            return OpenAIMessage().set_error(f"超过最大递归次数限制：{max_steps} 次")
+        return OpenAIMessage().set_error(str(e))
 
     def draw_graph(self, filename: str = "graph.png") -> str:
         """保存决策图"""
@@ -0,0 +1,183 @@
+"""
+模型路由
+
+每轮对话开始前选择处理本轮问题的模型: heuristic 模式按输入长度、会话长度与关键词选择 models 中
+第一个满足条件的小模型,model 模式由本地分类模型选择;都不满足时使用 llm_model。
+小模型出错、工具调用格式错误(工具不存在、参数校验失败)或没有给出回复时,按顺序升级到下一个模型,
+从已执行的工具步骤继续本轮(已执行的工具不会重复执行)。
+按路由统计调用次数、失败/升级次数、耗时与token消耗。
+"""
+import asyncio
+import threading
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+from src.config.config_entity import Route_Config, Router_Config
+from src.config.config_model import config
+from src.extend.openai.token_counter import token_counter
+from src.prompt import router_prompt
+
+# llm_model对应的路由名称
+DEFAULT_ROUTE = "default"
+
+
+@dataclass
+class RouteStats:
+    """单个路由的指标"""
+    turns: int = 0  # 调用次数(含升级后的重试)
+    failures: int = 0  # 失败次数
+    escalations: int = 0  # 失败后升级到下一个模型的次数
+    latency_seconds: float = 0.0  # 累计耗时(秒)
+    tokens: int = 0  # 累计token数(模型未返回用量时按消息估算)
+    cost: float = 0.0  # 累计费用(按cost_per_1k_tokens计算)
+
+
+# ToolNode对不存在的工具、参数校验失败返回的错误消息(工具没有执行)
+_BAD_CALL_PATTERNS = ("is not a valid tool", "validation error for")
+
+
+def is_bad_call(message: BaseMessage) -> bool:
+    """工具结果是否说明模型的工具调用本身有误(工具名不存在或参数校验失败)"""
+    if not isinstance(message, ToolMessage) or message.status != "error":
+        return False
+    content = str(message.content)
+    return content.startswith("Error:") and any(pattern in content for pattern in _BAD_CALL_PATTERNS)
+
+
+def failure_reason(messages: Sequence[BaseMessage]) -> Optional[str]:
+    """判断本轮新增的消息是否说明模型处理失败(成功返回None)"""
+    for message in messages:
+        if isinstance(message, AIMessage) and message.invalid_tool_calls:
+            return "工具调用格式错误"
+        # 工具执行时抛出的异常、超时不是模型的问题,交给模型自行处理,不升级
+        if is_bad_call(message):
+            return f"工具调用错误: {str(message.content)[:100]}"
+    if not messages or not isinstance(messages[-1], AIMessage) or not str(messages[-1].content).strip():
+        return "没有给出回复"
+    return None
+
+
+def completed_steps(messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """
+    本轮新增消息中已执行过工具的步骤(到最后一个有工具成功执行的步骤为止)
+
+    升级到下一个模型时带入这些消息继续,已执行的工具不会重复执行;
+    只有错误调用(工具不存在、参数校验失败)的尾部步骤没有执行任何工具,不带入。
+    """
+    end = 0
+    for index, message in enumerate(messages):
+        if isinstance(message, ToolMessage) and not is_bad_call(message):
+            end = index + 1
+    # 同一步的工具结果全部带入,保持工具调用与结果成对
+    while end and end < len(messages) and isinstance(messages[end], ToolMessage):
+        end += 1
+    return list(messages[:end])
+
+
+def count_tokens(messages: Sequence[BaseMessage], input_len: int) -> int:
+    """
+    统计本轮消耗的token数
+
+    优先使用模型返回的用量;否则按每次模型调用的输入(之前的全部消息)+输出估算
+    """
+    usage = [m.usage_metadata for m in messages[input_len:] if isinstance(m, AIMessage) and m.usage_metadata]
+    if usage:
+        return sum(u.get("total_tokens", 0) for u in usage)
+    total, context = 0, 0
+    for index, message in enumerate(messages):
+        tokens = token_counter.count_message(message.type, str(message.content))
+        if index >= input_len and isinstance(message, AIMessage):
+            total += context + tokens
+        context += tokens
+    return total
+
+
+class ModelRouter:
+    """按规则或分类模型为每轮对话选择模型"""
+
+    def __init__(self, routes: Sequence[Route_Config] = (), router_config: Router_Config = None):
+        self.routes = list(routes)
+        self.router_config = router_config or Router_Config()
+        self.names = [route.name for route in self.routes] + [DEFAULT_ROUTE]
+        self._costs = {route.name: route.cost_per_1k_tokens for route in self.routes}
+        self._costs[DEFAULT_ROUTE] = self.router_config.default_cost_per_1k_tokens
+        self._stats: Dict[str, RouteStats] = {name: RouteStats() for name in self.names}
+        self._classifier = None
+        self._classifier_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _matches(route: Route_Config, user_input: str, input_tokens: int, history_tokens: int) -> bool:
+        if route.max_input_tokens and input_tokens > route.max_input_tokens:
+            return False
+        if route.max_history_tokens and history_tokens > route.max_history_tokens:
+            return False
+        return not any(keyword in user_input for keyword in route.exclude_keywords)
+
+    def _get_classifier(self):
+        """分类模型(首次使用时创建,并发的首轮对话只创建一次)"""
+        if self._classifier is None:
+            with self._classifier_lock:
+                if self._classifier is None:
+                    self._classifier = self.router_config.classifier.init_model()
+        return self._classifier
+
+    def _classify(self, user_input: str) -> Optional[str]:
+        """由分类模型选择路由(分类模型配置错误、调用失败或回答无法识别时返回None,按heuristic选择)"""
+        routes = "\n".join(f"{route.name}: {route.description}" for route in self.routes)
+        routes += f"\n{DEFAULT_ROUTE}: 复杂问题、需要多步推理或多次调用工具的问题"
+        try:
+            answer = str(self._get_classifier().invoke([("system", router_prompt.format(routes=routes)),
+                                                        ("user", user_input)]).content)
+        except Exception:
+            return None
+        # 名称较长的优先匹配,避免名称互为前缀时误判
+        return next((name for name in sorted(self.names, key=len, reverse=True) if name in answer), None)
+
+    def plan(self, user_input: str, history_tokens: int = 0) -> List[str]:
+        """
+        选择本轮使用的模型
+
+        Returns:
+            按尝试顺序排列的路由名称(第一个为首选,后面为失败时依次升级的模型,最后一个为llm_model)
+        """
+        if not self.routes:
+            return [DEFAULT_ROUTE]
+        input_tokens = token_counter.count(user_input)
+        candidates = [route.name for route in self.routes
+                      if self._matches(route, user_input, input_tokens, history_tokens)]
+        plan = candidates + [DEFAULT_ROUTE]
+        if self.router_config.mode == "model":
+            chosen = self._classify(user_input)
+            if chosen is not None:
+                plan = [chosen] if chosen == DEFAULT_ROUTE else [chosen, DEFAULT_ROUTE]
+        return plan if self.router_config.escalate else plan[:1]
+
+    async def aplan(self, user_input: str, history_tokens: int = 0) -> List[str]:
+        """plan 的异步版本(分类模型在线程中调用,不阻塞事件循环)"""
+        if self.routes and self.router_config.mode == "model":
+            return await asyncio.to_thread(self.plan, user_input, history_tokens)
+        return self.plan(user_input, history_tokens)
+
+    def record(self, route: str, seconds: float, messages: Sequence[BaseMessage], input_len: int,
+               failed: bool, escalated: bool):
+        """记录一次模型尝试"""
+        tokens = count_tokens(messages, input_len) if messages else 0
+        with self._lock:
+            stats = self._stats[route]
+            stats.turns += 1
+            stats.failures += failed
+            stats.escalations += escalated
+            stats.latency_seconds += seconds
+            stats.tokens += tokens
+            stats.cost += tokens / 1000 * self._costs[route]
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """获取各路由的指标(含平均耗时)"""
+        with self._lock:
+            result = {name: asdict(stats) for name, stats in self._stats.items()}
+        for stats in result.values():
+            stats["avg_latency_seconds"] = stats["latency_seconds"] / stats["turns"] if stats["turns"] else 0.0
+        return result
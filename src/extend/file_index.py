@@ -0,0 +1,137 @@
+"""
+目录索引
+
+缓存每个目录的子项列表(名称、是否为目录),以目录的mtime判断是否需要重新读取:
+目录内新建、删除、重命名文件时目录mtime会变化,未变化的目录直接复用缓存,不再调用scandir。
+文件大小在匹配后按需读取,因此原地修改文件内容不会得到过期的大小。
+"""
+import os
+import re
+import fnmatch
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from src.config.config_model import config
+
+
+def compile_pattern(regex: str) -> re.Pattern:
+    """编译由fnmatch.translate生成的正则(Windows下文件名不区分大小写)"""
+    return re.compile(regex, re.IGNORECASE if os.name == "nt" else 0)
+
+
+def compile_glob(pattern: str) -> re.Pattern:
+    """把通配符编译为正则(逐个文件匹配时比fnmatch.fnmatch快)"""
+    return compile_pattern(fnmatch.translate(pattern))
+
+
+@dataclass
+class FileIndexStats:
+    """目录索引指标"""
+    scanned: int = 0  # 重新读取的目录数
+    reused: int = 0  # 直接复用缓存的目录数
+
+
+@dataclass
+class _DirEntry:
+    mtime_ns: int
+    dirs: List[str]
+    files: List[str]
+
+
+class FileIndex:
+    """按目录mtime增量刷新的文件树索引(所有根目录共用一份缓存)"""
+
+    def __init__(self, ignore: Sequence[str] = (), max_dirs: int = 50000):
+        self.ignore = list(ignore)  # 跳过的文件/目录名(支持通配符)
+        self._ignore_matcher = compile_pattern("|".join(f"(?:{fnmatch.translate(p)})" for p in self.ignore)) \
+            if self.ignore else None
+        self.max_dirs = max_dirs  # 最多缓存的目录数(超出时淘汰最久未使用的目录)
+        self.stats = FileIndexStats()
+        self._dirs: "OrderedDict[str, _DirEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _listing(self, path: str) -> Optional[_DirEntry]:
+        """获取目录的子项(目录未变化时使用缓存,无法访问时返回None)"""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._dirs.get(path)
+            if cached is not None and cached.mtime_ns == mtime_ns:
+                self._dirs.move_to_end(path)
+                self.stats.reused += 1
+                return cached
+        dirs, files = [], []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if self._ignore_matcher and self._ignore_matcher.match(entry.name):
+                        continue
+                    try:
+                        # 不跟随符号链接,避免目录循环
+                        (dirs if entry.is_dir(follow_symlinks=False) else files).append(entry.name)
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+        listing = _DirEntry(mtime_ns, sorted(dirs), sorted(files))
+        with self._lock:
+            self.stats.scanned += 1
+            self._dirs[path] = listing
+            self._dirs.move_to_end(path)
+            while len(self._dirs) > self.max_dirs:
+                self._dirs.popitem(last=False)
+        return listing
+
+    def _children(self, path: str, prefix: str, depth: int) -> Iterator[Tuple[str, str, bool, int]]:
+        listing = self._listing(path)
+        if listing is None:
+            return
+        for name in listing.dirs:
+            yield os.path.join(path, name), prefix + name, True, depth
+        for name in listing.files:
+            yield os.path.join(path, name), prefix + name, False, depth
+
+    def walk(self, root: str, max_depth: int = 0) -> Iterator[Tuple[str, bool, int]]:
+        """
+        按目录树顺序遍历(每个目录内子目录在前,按名称排序)
+
+        Args:
+            root: 根目录
+            max_depth: 最大深度(1表示只遍历根目录的子项,0表示不限制)
+
+        Returns:
+            (相对路径, 是否为目录, 深度) 的迭代器,相对路径使用"/"分隔
+        """
+        root = os.path.abspath(root)
+        if not os.path.isdir(root):
+            raise NotADirectoryError(f"目录不存在: {root}")
+        stack = [self._children(root, "", 1)]
+        while stack:
+            item = next(stack[-1], None)
+            if item is None:
+                stack.pop()
+                continue
+            path, relative, is_dir, depth = item
+            yield relative, is_dir, depth
+            if is_dir and (not max_depth or depth < max_depth):
+                stack.append(self._children(path, relative + "/", depth + 1))
+
+    def clear(self):
+        """清空索引"""
+        with self._lock:
+            self._dirs.clear()
+
+    def get_stats(self) -> Dict:
+        """获取索引指标"""
+        with self._lock:
+            stats = asdict(self.stats)
+            stats["dirs"] = len(self._dirs)
+        return stats
+
+
+# 全局目录索引
+file_index = FileIndex(config.tool_config.index_ignore)
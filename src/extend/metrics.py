@@ -0,0 +1,269 @@
+"""
+本地性能指标
+
+记录每轮对话各阶段的耗时(排队、加载历史、摘要、模型首token、模型生成、工具执行、持久化)与token数量,
+耗时使用HDR风格的直方图统计分位数,可导出为Prometheus文本格式(/metrics)或在命令行打印汇总。
+不依赖LangSmith,关闭LangSmith追踪时也能在本地查看耗时分布。
+"""
+import time
+import threading
+from contextlib import contextmanager
+from itertools import groupby
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.config.config_model import config
+from src.extend.openai.token_counter import token_counter
+
+# 指标名称
+PHASE_SECONDS = "agent_phase_seconds"
+TOKENS_TOTAL = "agent_tokens_total"
+TURNS_TOTAL = "agent_turns_total"
+HTTP_SECONDS = "http_request_seconds"
+
+# 指标说明(Prometheus HELP)
+METRIC_HELP = {
+    PHASE_SECONDS: "每轮对话各阶段耗时(秒)",
+    TOKENS_TOTAL: "模型输入/输出token数",
+    TURNS_TOTAL: "对话轮数",
+    HTTP_SECONDS: "网页接口请求耗时(秒,流式接口包含整个流式响应)",
+}
+
+# 阶段名称(命令行汇总按该顺序显示)
+PHASES = ["queue", "history", "summary_wait", "summary", "model_ttft", "model", "tool", "persist", "turn"]
+
+
+class Histogram:
+    """
+    HDR风格直方图
+
+    数值按 unit 取整后,按2的幂分段、每段再等分为 2**precision 个子桶,
+    任意数值的相对误差不超过 2**-(precision-1),内存只与出现过的子桶数量有关。
+    """
+
+    def __init__(self, precision: int = 7, unit: float = 1e-6):
+        self.precision = precision
+        self.unit = unit  # 最小分辨率(默认1微秒)
+        self.counts: Dict[int, int] = {}  # 子桶下界 -> 次数
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.last: Optional[float] = None  # 最近一次记录的值
+
+    def record(self, value: float):
+        """记录一个数值"""
+        value = max(value, 0.0)
+        scaled = int(value / self.unit)
+        shift = max(scaled.bit_length() - self.precision, 0)
+        key = scaled >> shift << shift
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.last = value
+
+    def percentile(self, q: float) -> float:
+        """分位数(q取0~1,返回所在子桶的中值,不超过最大值)"""
+        if not self.count:
+            return 0.0
+        rank = max(q * self.count, 1)
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= rank:
+                width = 1 << max(key.bit_length() - self.precision, 0)
+                return min((key + (width - 1) / 2) * self.unit, self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+def _label_key(labels: Dict[str, Any]) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _format_labels(labels: Tuple, extra: Tuple = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in items)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + "}"
+
+
+class Metrics:
+    """线程安全的指标注册表(耗时直方图与计数器)"""
+
+    def __init__(self, enabled: bool = True, precision: int = 7, quantiles: List[float] = None):
+        self.enabled = enabled
+        self.precision = precision
+        self.quantiles = quantiles or [0.5, 0.9, 0.99]
+        self._histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, **labels):
+        """记录一次耗时(秒)"""
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.precision)
+            histogram.record(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """累加计数器"""
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """记录代码块耗时(单调时钟,出错时同样记录)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def get_histogram(self, name: str, **labels) -> Optional[Histogram]:
+        return self._histograms.get((name, _label_key(labels)))
+
+    def get_counter(self, name: str, **labels) -> float:
+        return self._counters.get((name, _label_key(labels)), 0)
+
+    def callbacks(self, **labels) -> List[BaseCallbackHandler]:
+        """返回记录模型/工具耗时与token数的LangChain回调(labels附加到模型指标)"""
+        return [MetricsCallbackHandler(self, labels)] if self.enabled else []
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def summary(self) -> Dict[str, Dict]:
+        """各耗时指标的汇总(键为 名称{标签})"""
+        with self._lock:
+            result = {}
+            for (name, labels), h in sorted(self._histograms.items()):
+                stats = {"count": h.count, "mean": h.mean, "max": h.max}
+                stats.update({f"p{q * 100:g}": h.percentile(q) for q in self.quantiles})
+                result[f"{name}{_format_labels(labels)}"] = stats
+            return result
+
+    def format_summary(self) -> str:
+        """命令行显示的各阶段耗时汇总"""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        rows = []
+        for phase in PHASES:
+            for (name, labels), h in histograms:
+                if name != PHASE_SECONDS or dict(labels).get("phase") != phase:
+                    continue
+                extra = ",".join(v for k, v in labels if k != "phase")
+                title = f"{phase}({extra})" if extra else phase
+                percentiles = " ".join(f"p{q * 100:g} {h.percentile(q) * 1000:.1f}ms" for q in self.quantiles)
+                rows.append(f"{title:<24} {h.count:>6}次  平均 {h.mean * 1000:.1f}ms  {percentiles}  "
+                            f"最大 {h.max * 1000:.1f}ms")
+        tokens = ", ".join(f"{_format_labels(labels)} {int(value)}"
+                           for (name, labels), value in counters if name == TOKENS_TOTAL)
+        if tokens:
+            rows.append(f"tokens: {tokens}")
+        return "\n".join(rows)
+
+    def render_prometheus(self) -> str:
+        """Prometheus文本格式(耗时以summary类型导出分位数)"""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            lines = []
+            for name, group in groupby(histograms, key=lambda item: item[0][0]):
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} summary")
+                for (_, labels), h in group:
+                    for q in self.quantiles:
+                        quantile = _format_labels(labels, (("quantile", f"{q:g}"),))
+                        lines.append(f"{name}{quantile} {h.percentile(q):.6f}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {h.sum:.6f}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {h.count}")
+            for name, group in groupby(counters, key=lambda item: item[0][0]):
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for (_, labels), value in group:
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """记录模型首token时间、生成耗时、token数与工具执行耗时"""
+    # 只做计时与字典操作,异步执行时也直接在当前线程调用
+    run_inline = True
+
+    def __init__(self, metrics: Metrics, labels: Dict = None):
+        self.metrics = metrics
+        self.labels = labels or {}
+        # run_id -> [开始时间, 是否已收到token(工具调用时为工具名), 估算的输入token数]
+        self._runs: Dict[UUID, list] = {}
+
+    def on_chat_model_start(self, serialized: Dict, messages: List[List], *, run_id: UUID, **kwargs):
+        tokens = sum(token_counter.count_message(m.type, str(m.content)) for batch in messages for m in batch)
+        self._runs[run_id] = [time.perf_counter(), False, tokens]
+
+    def on_llm_start(self, serialized: Dict, prompts: List[str], *, run_id: UUID, **kwargs):
+        self._runs[run_id] = [time.perf_counter(), False, sum(token_counter.count(p) for p in prompts)]
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs):
+        run = self._runs.get(run_id)
+        if run and not run[1]:
+            run[1] = True
+            self.metrics.observe(PHASE_SECONDS, time.perf_counter() - run[0], phase="model_ttft", **self.labels)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        self.metrics.observe(PHASE_SECONDS, time.perf_counter() - run[0], phase="model", **self.labels)
+        generations = response.generations[0] if response.generations else []
+        message = getattr(generations[0], "message", None) if generations else None
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            input_tokens, output_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        else:
+            # 模型未返回用量时离线估算
+            input_tokens = run[2]
+            output_tokens = token_counter.count(generations[0].text) if generations else 0
+        self.metrics.inc(TOKENS_TOTAL, input_tokens, kind="input", **self.labels)
+        self.metrics.inc(TOKENS_TOTAL, output_tokens, kind="output", **self.labels)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            self.metrics.observe(PHASE_SECONDS, time.perf_counter() - run[0], phase="model", **self.labels)
+
+    def on_tool_start(self, serialized: Dict, input_str: str, *, run_id: UUID, **kwargs):
+        self._runs[run_id] = [time.perf_counter(), (serialized or {}).get("name") or "tool", 0]
+
+    def _tool_done(self, run_id: UUID):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            self.metrics.observe(PHASE_SECONDS, time.perf_counter() - run[0], phase="tool", tool=run[1])
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs):
+        self._tool_done(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        self._tool_done(run_id)
+
+
+# 全局指标
+metrics = Metrics(config.metrics.enabled, config.metrics.precision, config.metrics.quantiles)
@@ -0,0 +1,148 @@
+"""
+模型服务HTTP连接池
+
+所有 LLM_Model 创建的模型客户端(对话模型、摘要模型)共用同一组httpx传输层,
+连接在请求之间保持(keep-alive)并复用,连接数与超时由 http_config 配置。
+同步传输层全进程共用;异步连接绑定事件循环,按事件循环分别建立连接池。
+warm_up 在启动时通过同一连接池预先建立连接,Ollama模型同时被加载到显存,
+使第一次对话的耗时与之后的对话一致。
+"""
+import asyncio
+import threading
+import weakref
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+from src.config.config_model import config
+
+_lock = threading.Lock()
+_transports: Dict[str, httpx.BaseTransport] = {}
+
+
+def _limits() -> httpx.Limits:
+    http_config = config.http_config
+    return httpx.Limits(
+        max_connections=http_config.max_connections,
+        max_keepalive_connections=http_config.max_keepalive_connections,
+        keepalive_expiry=http_config.keepalive_expiry
+    )
+
+
+def get_timeout() -> httpx.Timeout:
+    """模型请求超时(连接超时与读取超时分别配置)"""
+    http_config = config.http_config
+    return httpx.Timeout(http_config.read_timeout, connect=http_config.connect_timeout)
+
+
+def get_transport() -> httpx.HTTPTransport:
+    """共享的同步传输层(连接池)"""
+    with _lock:
+        if "sync" not in _transports:
+            _transports["sync"] = httpx.HTTPTransport(limits=_limits(), retries=config.http_config.retries)
+        return _transports["sync"]
+
+
+class LoopLocalAsyncTransport(httpx.AsyncBaseTransport):
+    """
+    按事件循环分别创建连接池的异步传输层
+
+    异步连接绑定创建它的事件循环,多次 asyncio.run(或多个线程各自的事件循环)共用一个连接池时,
+    在新的循环中复用旧连接会出错或挂起。这里在每个运行中的事件循环首次请求时创建该循环自己的连接池,
+    循环被回收后连接池随之释放;同一循环内的请求仍然复用连接。
+    """
+
+    def __init__(self):
+        self._transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport]" = \
+            weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _current(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(
+                    limits=_limits(), retries=config.http_config.retries)
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._current().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        """关闭当前事件循环的连接池"""
+        with self._lock:
+            transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+def get_async_transport() -> LoopLocalAsyncTransport:
+    """共享的异步传输层(每个事件循环一个连接池)"""
+    with _lock:
+        if "async" not in _transports:
+            _transports["async"] = LoopLocalAsyncTransport()
+        return _transports["async"]
+
+
+def client_kwargs(model_provider: str) -> Dict:
+    """按模型提供商生成使用共享连接池的 init_chat_model 参数(其他提供商返回空字典)"""
+    if model_provider == "ollama":
+        return {
+            "client_kwargs": {"timeout": get_timeout()},
+            "sync_client_kwargs": {"transport": get_transport()},
+            "async_client_kwargs": {"transport": get_async_transport()},
+        }
+    if model_provider == "openai":
+        return {
+            "timeout": get_timeout(),
+            "http_client": httpx.Client(transport=get_transport(), timeout=get_timeout()),
+            "http_async_client": httpx.AsyncClient(transport=get_async_transport(), timeout=get_timeout()),
+        }
+    return {}
+
+
+def _warm_up_request(client: httpx.Client, model) -> None:
+    base_url = (model.base_url or "").rstrip("/")
+    if model.model_provider == "ollama":
+        # 不带prompt的generate请求只加载模型,不生成内容
+        payload = {"model": model.model_name}
+        if model.keep_alive:
+            payload["keep_alive"] = model.keep_alive
+        client.post(f"{base_url or 'http://127.0.0.1:11434'}/api/generate", json=payload).raise_for_status()
+    elif model.model_provider == "openai" and base_url:
+        # 建立TCP/TLS连接并放入连接池(不消耗token)
+        client.get(f"{base_url}/models", headers={"Authorization": f"Bearer {model.key or ''}"})
+
+
+def warm_up(models: Iterable) -> List[Optional[str]]:
+    """
+    预热模型服务(相同的服务与模型只请求一次)
+
+    Returns:
+        每个模型的预热结果(成功为None,失败为错误信息)
+    """
+    # 不关闭client: 关闭时会一并关闭共享的传输层
+    client = httpx.Client(transport=get_transport(), timeout=get_timeout())
+    results, seen = [], set()
+    for model in models:
+        key = (model.model_provider, model.base_url, model.model_name)
+        if key in seen:
+            results.append(None)
+            continue
+        seen.add(key)
+        try:
+            _warm_up_request(client, model)
+            results.append(None)
+        except Exception as e:
+            results.append(str(e))
+    return results
+
+
+def warm_up_in_background(models: Iterable) -> Optional[threading.Thread]:
+    """在后台线程中预热(http_config.warm_up 关闭时不执行)"""
+    if not config.http_config.warm_up:
+        return None
+    thread = threading.Thread(target=warm_up, args=(list(models),), name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,250 @@
+"""
+模型响应缓存
+
+exact 模式: 以模型参数(模型名、温度、绑定的工具等) + 归一化后的消息列表(含系统提示、去掉消息ID)的哈希为键;
+semantic 模式: 完全匹配失败时,在"上下文相同、只有最后一个问题不同"的记录中,
+用本地哈希向量做最近邻查找,相似度达到阈值即复用回复。
+缓存保存在SQLite文件中,按条数(最久未使用优先)与TTL淘汰。只在temperature为0时启用。
+"""
+import re
+import json
+import time
+import zlib
+import math
+import sqlite3
+import hashlib
+import threading
+from array import array
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+from src.config.config_model import config
+from src.extend.openai.token_counter import token_counter
+
+# 本地哈希向量维度
+EMBED_DIM = 256
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS llm_cache (
+        key TEXT PRIMARY KEY,
+        context TEXT NOT NULL,
+        vector BLOB,
+        response TEXT NOT NULL,
+        latency REAL NOT NULL,
+        tokens INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        accessed_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_llm_cache_context ON llm_cache (context)",
+    "CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache (accessed_at)",
+]
+
+
+def embed(text: str, dim: int = EMBED_DIM) -> List[float]:
+    """本地文本向量(字符与相邻字符对的特征哈希,L2归一化)"""
+    text = _NON_WORD.sub("", text.lower())
+    vector = [0.0] * dim
+    for feature in list(text) + [text[i:i + 2] for i in range(len(text) - 1)]:
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm else vector
+
+
+def _normalize(prompt: str) -> List:
+    """把序列化的消息列表归一化为 (角色, 内容, 工具调用, 名称),去掉每次都会变化的消息ID与工具调用ID"""
+    messages = []
+    for item in json.loads(prompt):
+        kwargs = item.get("kwargs", {})
+        tool_calls = [(tc.get("name"), tc.get("args")) for tc in kwargs.get("tool_calls") or []]
+        messages.append((kwargs.get("type") or item.get("id", [""])[-1], kwargs.get("content"),
+                         tool_calls, kwargs.get("name")))
+    return messages
+
+
+def _unpack(blob: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+def _hash(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class ResponseCacheStats:
+    """响应缓存指标"""
+    lookups: int = 0  # 查询次数
+    hits: int = 0  # 命中次数(含相似匹配)
+    semantic_hits: int = 0  # 相似问题匹配命中次数
+    evictions: int = 0  # 超出容量或过期被删除的条数
+    saved_seconds: float = 0.0  # 命中节省的模型耗时(按写入时记录的耗时累计)
+    saved_tokens: int = 0  # 命中节省的token数
+
+
+class ResponseCache(BaseCache):
+    """磁盘持久化的模型响应缓存(通过聊天模型的cache参数接入)"""
+
+    def __init__(self, path: str, mode: str = "exact", max_entries: int = 2000,
+                 ttl: float = 86400, similarity: float = 0.92):
+        self.path = Path(path)
+        self.semantic = mode == "semantic"
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.stats = ResponseCacheStats()
+        self.token_counter = token_counter
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._pending: Dict[str, float] = {}  # 未命中的键 -> 开始调用模型的时间
+        self._vectors: Dict[str, Dict[str, List[float]]] = {}  # 上下文 -> {键: 问题向量}(最近邻索引,按需加载)
+
+    def _db(self) -> sqlite3.Connection:
+        """首次使用时打开数据库(调用方持有锁)"""
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+        return self._conn
+
+    @staticmethod
+    def _keys(messages: List, llm_string: str):
+        """返回 (完整键, 上下文键, 最后一个用户问题)"""
+        question = None
+        if messages and messages[-1][0] == "human" and isinstance(messages[-1][1], str):
+            question = messages[-1][1]
+        return _hash(llm_string, messages), _hash(llm_string, messages[:-1]), question
+
+    def _deadline(self) -> float:
+        return time.time() - self.ttl if self.ttl else 0.0
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        """查询缓存,未命中返回None"""
+        key, context, question = self._keys(_normalize(prompt), llm_string)
+        with self._lock:
+            self.stats.lookups += 1
+            db = self._db()
+            row = db.execute("SELECT key, response, latency, tokens FROM llm_cache WHERE key = ? AND created_at >= ?",
+                             (key, self._deadline())).fetchone()
+            semantic = False
+            if row is None and self.semantic and question:
+                row = self._nearest(db, context, question)
+                semantic = row is not None
+            if row is None:
+                self._pending[key] = time.monotonic()
+                return None
+            db.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (time.time(), row[0]))
+            db.commit()
+            self.stats.hits += 1
+            self.stats.semantic_hits += semantic
+            self.stats.saved_seconds += row[2]
+            self.stats.saved_tokens += row[3]
+        message = messages_from_dict([json.loads(row[1])])[0]
+        return [ChatGeneration(message=message)]
+
+    def _nearest(self, db: sqlite3.Connection, context: str, question: str) -> Optional[tuple]:
+        """在同一上下文的记录中查找最相似的问题(调用方持有锁)"""
+        vectors = self._vectors.get(context)
+        if vectors is None:
+            rows = db.execute("SELECT key, vector FROM llm_cache WHERE context = ? AND vector IS NOT NULL", (context,))
+            vectors = self._vectors[context] = {k: _unpack(v) for k, v in rows}
+        if not vectors:
+            return None
+        query = embed(question)
+        key, score = max(((k, sum(a * b for a, b in zip(query, v))) for k, v in vectors.items()), key=lambda x: x[1])
+        if score < self.similarity:
+            return None
+        return db.execute("SELECT key, response, latency, tokens FROM llm_cache WHERE key = ? AND created_at >= ?",
+                          (key, self._deadline())).fetchone()
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        """写入模型回复"""
+        if len(return_val) != 1 or not isinstance(return_val[0], ChatGeneration):
+            return
+        message = return_val[0].message
+        messages = _normalize(prompt)
+        key, context, question = self._keys(messages, llm_string)
+        usage = getattr(message, "usage_metadata", None) or {}
+        tokens = usage.get("total_tokens") or (
+            sum(self.token_counter.count(str(m[1])) for m in messages) + self.token_counter.count(str(message.content))
+        )
+        vector = embed(question) if question else None
+        now = time.time()
+        with self._lock:
+            latency = time.monotonic() - self._pending.pop(key, time.monotonic())
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, context, vector, response, latency, tokens, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, context, array("f", vector).tobytes() if vector else None,
+                 json.dumps(message_to_dict(message), ensure_ascii=False), latency, tokens, now, now)
+            )
+            if vector and context in self._vectors:
+                self._vectors[context][key] = vector
+            self._evict(db)
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection):
+        """删除过期与超出容量的记录(调用方持有锁)"""
+        removed = db.execute("DELETE FROM llm_cache WHERE created_at < ?", (self._deadline(),)).rowcount
+        overflow = db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            removed += db.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY accessed_at LIMIT ?)",
+                (overflow,)
+            ).rowcount
+        if removed:
+            self.stats.evictions += removed
+            self._vectors.clear()
+        # 丢弃调用失败后残留的计时
+        if len(self._pending) > 1024:
+            self._pending.clear()
+
+    def clear(self, **kwargs) -> None:
+        """清空缓存"""
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM llm_cache")
+            db.commit()
+            self._vectors.clear()
+            self._pending.clear()
+
+    def get_stats(self) -> Dict:
+        """获取缓存指标(含命中率)"""
+        with self._lock:
+            stats = asdict(self.stats)
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+
+_response_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """按配置获取全局响应缓存(mode为off时返回None)"""
+    global _response_cache
+    cache_config = config.llm_cache
+    if cache_config.mode not in ("exact", "semantic"):
+        return None
+    with _cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(
+                cache_config.path,
+                mode=cache_config.mode,
+                max_entries=cache_config.max_entries,
+                ttl=cache_config.ttl,
+                similarity=cache_config.similarity
+            )
+    return _response_cache
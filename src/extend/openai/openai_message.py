@@ -16,7 +16,9 @@ class OpenAIMessage:
     all_result_messages:list[Message]=[] #所有消息(包含递归调用消息)
     isOk:bool=True #是否正常返回
     error_data:str=None #错误信息
+    route:str=None #回答所用的模型路由
     def __init__(self, message_data:list=[],history_len:int=0):
+        self.all_result_messages = [] #每个实例独立的列表,避免在会话间共享
         if len(message_data)>1:
             self.question_message = message_data[history_len].content #提问消息
             self.last_message = message_data[-1].content #所有消息
@@ -26,6 +28,7 @@ class OpenAIMessage:
     def set_error(self, error_data:str):
         self.isOk = False
         self.error_data = error_data
+        return self
 
     
     def __str__(self):
@@ -0,0 +1,152 @@
+"""
+提示词前缀
+
+每轮按固定顺序组装发送给模型的消息: 工具定义 → 系统提示 → 摘要块(旧→新) → 原文历史 → 本轮输入。
+前面的部分在轮次之间保持逐字节不变、只在末尾追加新消息,模型服务端(Ollama KV缓存、OpenAI提示词缓存)
+即可复用已计算的前缀。每轮记录上一轮的消息是否仍是本轮的前缀,变化时记录变化位置所属的部分。
+检查点模式下消息由graph组装(trim_history),通过 observe 统计同样的指标。
+"""
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from src.extend.openai.token_counter import token_counter
+
+
+@dataclass
+class PrefixStats:
+    """前缀稳定性指标"""
+    turns: int = 0  # 与上一轮比较的次数(每个会话的第一轮不计入)
+    stable: int = 0  # 上一轮的消息完整保留为本轮前缀的次数
+    changes: int = 0  # 前缀发生变化的次数
+    causes: Dict[str, int] = field(default_factory=dict)  # 按变化位置统计: tools/system/summary/history
+    reused_tokens: int = 0  # 与上一轮相同的前缀token数累计
+    prompt_tokens: int = 0  # 发送的token数累计
+
+    def record(self, cause: Optional[str], reused: int, total: int):
+        self.turns += 1
+        if cause is None:
+            self.stable += 1
+        else:
+            self.changes += 1
+            self.causes[cause] = self.causes.get(cause, 0) + 1
+        self.reused_tokens += reused
+        self.prompt_tokens += total
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha1(json.dumps(parts, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+# 工具定义缓存 id(工具) -> (工具, 定义),工具变化时不必重新生成全部工具的JSON Schema
+_tool_schemas: Dict[int, Tuple[object, Dict]] = {}
+
+
+def _tool_schema(tool) -> Dict:
+    """工具的OpenAI格式定义(按工具对象缓存)"""
+    entry = _tool_schemas.get(id(tool))
+    if entry is None or entry[0] is not tool:
+        if len(_tool_schemas) >= 1024:
+            _tool_schemas.clear()
+        entry = _tool_schemas[id(tool)] = (tool, convert_to_openai_tool(tool))
+    return entry[1]
+
+
+class PromptAssembler:
+    """组装每轮的消息并统计各会话的前缀变化"""
+
+    def __init__(self, max_threads: int = 1024):
+        self.max_threads = max_threads
+        self.stats = PrefixStats()  # 全部会话合计
+        self._tools: Tuple[str, int] = (_digest(), 0)  # 工具定义的 (哈希, token数)
+        self._threads: "OrderedDict[str, Tuple[List[Tuple[str, int]], PrefixStats]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set_tools(self, tools: Sequence):
+        """记录绑定到模型的工具定义(工具变化会使整个前缀失效;与graph缓存键一致,不区分顺序)"""
+        schemas = sorted((_tool_schema(t) for t in tools), key=lambda schema: schema["function"]["name"])
+        text = json.dumps(schemas, ensure_ascii=False, sort_keys=True)
+        self._tools = (_digest(text), token_counter.count(text))
+
+    def assemble(self, thread_id: str, system_prompt: Optional[str], history: List, user_input: str) -> List:
+        """
+        组装本轮消息
+
+        Args:
+            thread_id: 会话ID
+            system_prompt: 系统提示
+            history: 会话历史(开头的system消息为摘要块)
+            user_input: 本轮输入
+        """
+        messages = [("system", system_prompt)] if system_prompt else []
+        messages.extend(history)
+        messages.append(("user", user_input))
+        summaries = next((i for i, (role, _) in enumerate(history) if role != "system"), len(history))
+        # 各条消息所属的部分(下标0为工具定义)
+        sections = ["tools"] + ["system"] * bool(system_prompt) + ["summary"] * summaries
+        self._observe(thread_id, messages, sections)
+        return messages
+
+    def observe(self, thread_id: str, messages: Sequence[BaseMessage], system_prompt: Optional[str]):
+        """
+        记录由graph组装的消息(检查点模式下由trim_history裁剪并加上系统提示,只统计不修改)
+
+        Args:
+            thread_id: 会话ID
+            messages: 本轮第一次调用模型时发送的消息
+            system_prompt: 系统提示(开头的其余system消息为摘要块)
+        """
+        entries = []
+        for message in messages:
+            content = message.content if isinstance(message.content, str) else str(message.content)
+            calls = getattr(message, "tool_calls", None)
+            if calls:
+                content += json.dumps([(call["name"], call["args"]) for call in calls], ensure_ascii=False,
+                                      sort_keys=True, default=str)
+            entries.append((message.type, content))
+        heads = next((i for i, message in enumerate(messages) if message.type != "system"), len(messages))
+        sections = ["tools"] + ["system"] * bool(system_prompt) + ["summary"] * (heads - bool(system_prompt))
+        self._observe(thread_id, entries, sections)
+
+    def _observe(self, thread_id: str, messages: List, sections: List[str]):
+        with self._lock:
+            previous, stats = self._threads.pop(thread_id, (None, None))
+        stats = stats or PrefixStats()
+        # 与上一轮逐条比较,相同位置哈希一致的消息复用上一轮的token数
+        entries = [self._tools]
+        common = 0 if previous is None or previous[0] != self._tools else 1
+        for index, (role, content) in enumerate(messages, 1):
+            digest = _digest(role, content)
+            if common == index and index < len(previous) and previous[index][0] == digest:
+                entries.append(previous[index])
+                common += 1
+            else:
+                entries.append((digest, token_counter.count_message(role, content)))
+        total = sum(tokens for _, tokens in entries)
+        reused = sum(tokens for _, tokens in entries[:common])
+        cause = None
+        if previous is not None and common < len(previous):
+            cause = sections[common] if common < len(sections) else "history"
+        with self._lock:
+            if previous is not None:
+                stats.record(cause, reused, total)
+                self.stats.record(cause, reused, total)
+            self._threads[thread_id] = (entries, stats)
+            while len(self._threads) > self.max_threads:
+                self._threads.popitem(last=False)
+
+    def get_stats(self, thread_id: Optional[str] = None) -> Dict:
+        """获取前缀指标(不传thread_id时返回全部会话合计),reuse_rate为前缀复用的token占比"""
+        with self._lock:
+            if thread_id is None:
+                stats = asdict(self.stats)
+            else:
+                stats = asdict(self._threads[thread_id][1]) if thread_id in self._threads else asdict(PrefixStats())
+        stats["reuse_rate"] = stats["reused_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+        return stats
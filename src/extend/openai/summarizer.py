@@ -0,0 +1,35 @@
+import threading
+from dataclasses import astuple
+from typing import Dict, Tuple
+
+from langgraph.prebuilt import create_react_agent
+
+from src.config.config_entity import LLM_Model
+
+# 已编译的摘要智能体缓存(按模型配置区分,进程内共享)
+_summarizers: Dict[Tuple, object] = {}
+_lock = threading.Lock()
+
+
+def _model_key(model: LLM_Model) -> Tuple:
+    """模型配置的缓存键(LLM_Model不可哈希,按类型与字段值生成)"""
+    return (type(model), astuple(model))
+
+
+def get_summarizer(model: LLM_Model):
+    """获取摘要智能体,同一模型配置只创建一次模型客户端与执行图"""
+    key = _model_key(model)
+    summarizer = _summarizers.get(key)
+    if summarizer is None:
+        with _lock:
+            summarizer = _summarizers.get(key)
+            if summarizer is None:
+                summarizer = create_react_agent(model=model.init_model(), tools=[])
+                _summarizers[key] = summarizer
+    return summarizer
+
+
+def clear_summarizers():
+    """清空摘要智能体缓存(模型配置变更后调用)"""
+    with _lock:
+        _summarizers.clear()
@@ -1,103 +1,514 @@
+import os
 import json
-from typing import List, Dict
+import time
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from typing import AsyncIterator, List, Dict, Optional
 from pathlib import Path
-from langgraph.prebuilt import create_react_agent
 
 from src.config.config_model import config
-from src.prompt import summary_prompt
+from src.prompt import summary_prompt, merge_summary_prompt, previous_summary_prefix
+from src.extend.openai.token_counter import token_counter
+from src.extend.openai.summarizer import get_summarizer
+from src.extend.store.session_store import session_store
+from src.extend.metrics import PHASE_SECONDS, metrics
+
+# 后台摘要线程池(所有会话共用)
+summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summary")
+
+
+@dataclass
+class SummaryStats:
+    """摘要执行指标"""
+    scheduled: int = 0  # 已调度的摘要次数
+    completed: int = 0  # 成功替换历史的次数
+    discarded: int = 0  # 因历史被整体替换而丢弃的结果数
+    failures: int = 0  # 失败次数
+    blocking_waits: int = 0  # 触发硬阈值而阻塞等待的次数
+    blocking_wait_seconds: float = 0.0  # 阻塞等待累计耗时(秒)
+    last_lag_seconds: float = 0.0  # 最近一次从调度到替换完成的耗时(秒)
+    max_lag_seconds: float = 0.0  # 最大摘要延迟(秒)
+    total_lag_seconds: float = 0.0  # 累计摘要延迟(秒)
+    last_error: Optional[str] = None  # 最近一次失败原因
 
 
 class MemoryThread:
-    """管理单个线程的内存型存储"""
+    """
+    管理单个线程的内存型存储
+
+    历史由两部分组成: 滚动摘要块(summaries, 旧→新)与最近若干轮的原文消息(history_memory)。
+    压缩时只把最旧的一段原文连同上一个摘要块发给摘要模型,最近 summary_keep_turns 轮保持原文;
+    摘要块超过块预算后冻结,块数超过 summary_max_blocks 时再合并为更高一级的摘要。
+    """
 
     def __init__(self, thread_id: str):
         self.thread_id = thread_id
         self.history_memory: List = []
+        self.summaries: List[str] = []  # 滚动摘要块(旧→新,最后一块为正在累积的摘要)
+        self._token_counts: List[int] = []  # 每条消息的token数缓存
+        self._summary_tokens: List[int] = []  # 每个摘要块的token数缓存
+        self.token_total: int = 0  # 当前历史记录(含摘要)的token总数
+        self._lock = threading.RLock()
+        self._generation = 0  # 历史被整体替换(清空/加载)时递增,用于丢弃过期的摘要结果
+        self._summary_future: Optional[Future] = None
+        self.summary_stats = SummaryStats()
+        self.turn_lock = threading.Lock()  # 串行执行同一会话内的对话轮次(同步与异步调用共用)
+        self.persist_lock = threading.Lock()  # 回写存储期间持有(移除/重命名线程时等待进行中的回写结束)
+        self._persisted = 0  # 已持久化的原文消息条数
+        self._needs_reset = True  # 未从存储加载过或已被摘要/清空改写,下次需要整体保存
+        self.transient = False  # 临时线程(不写回存储)
+        self.last_access = time.monotonic()
 
     def add_message(self, role: str, content: str):
         """添加消息到历史记录"""
-        self.history_memory.append((role, content))
+        tokens = token_counter.count_message(role, content)
+        with self._lock:
+            self.history_memory.append((role, content))
+            self._token_counts.append(tokens)
+            self.token_total += tokens
 
     def clear_history(self):
         """清空历史记录"""
-        self.history_memory.clear()
-
-    def get_history(self) -> List:
-        """获取历史记录，超过限制时自动生成摘要"""
-        # 检查是否超过token限制
-        total_length = sum(len(role) + len(content) for role, content in self.history_memory)
-        if total_length > config.max_token_limit:
-            summary = self._create_summary()
-            self.clear_history()
-            self.add_message("system", summary)
-        return self.history_memory
-
-    def _create_summary(self) -> str:
-        """创建历史消息摘要"""
-        messages = self.history_memory.copy()
-        # 创建摘要智能体
-        summarizer = create_react_agent(
-            model=config.summary_model.init_model(), 
-            tools=[]
-        )
-        messages.append(("user", summary_prompt))
-        
-        # 获取摘要结果
+        with self._lock:
+            self.history_memory.clear()
+            self.summaries.clear()
+            self._token_counts.clear()
+            self._summary_tokens.clear()
+            self.token_total = 0
+            self._generation += 1
+            self._needs_reset = True
+
+    def _recount(self):
+        """重新计算全部消息的token数(仅在整体替换历史时调用)"""
+        self._token_counts = [token_counter.count_message(role, content) for role, content in self.history_memory]
+        self._summary_tokens = [token_counter.count_message("system", s) for s in self.summaries]
+        self.token_total = sum(self._token_counts) + sum(self._summary_tokens)
+
+    def _compose(self) -> List:
+        """拼接摘要块与原文消息"""
+        return [("system", s) for s in self.summaries] + list(self.history_memory)
+
+    def get_history(self, summarize: bool = True) -> List:
+        """
+        获取历史记录
+
+        超过软阈值时在后台生成摘要,本轮仍使用未压缩的历史;
+        超过硬阈值(max_token_limit)时阻塞等待摘要完成,摘要失败时本轮使用未压缩的历史。
+        summarize为False时不生成摘要(已有的摘要块仍然返回)。
+        """
+        soft_limit = int(config.max_token_limit * config.summary_soft_ratio)
+        if summarize and self.token_total > config.max_token_limit:
+            start = time.monotonic()
+            try:
+                self._schedule_summary().result()
+            except Exception:
+                # 失败原因已记录在summary_stats中
+                pass
+            wait = time.monotonic() - start
+            with self._lock:
+                self.summary_stats.blocking_waits += 1
+                self.summary_stats.blocking_wait_seconds += wait
+            metrics.observe(PHASE_SECONDS, wait, phase="summary_wait")
+        elif summarize and self.token_total > soft_limit:
+            self._schedule_summary()
+        with self._lock:
+            return self._compose()
+
+    def _fold_index(self) -> int:
+        """计算需要折叠进摘要的原文前缀长度(保留最近 summary_keep_turns 轮原文)"""
+        turn_starts = [i for i, (role, _) in enumerate(self.history_memory) if role == "user"]
+        keep_turns = max(config.summary_keep_turns, 1)
+        if len(turn_starts) > keep_turns:
+            return turn_starts[-keep_turns]
+        # 轮数不足时至少保留最后一轮
+        return turn_starts[-1] if turn_starts else 0
+
+    def _schedule_summary(self) -> Future:
+        """提交后台摘要任务(同一线程同时只有一个任务在执行)"""
+        with self._lock:
+            if self._summary_future is None:
+                count = self._fold_index()
+                if count == 0:
+                    # 没有可折叠的旧消息
+                    done = Future()
+                    done.set_result(None)
+                    return done
+                delta = self.history_memory[:count]
+                # 最后一个摘要块未超过块预算时继续在其上累积,否则开启新块
+                block_limit = config.max_token_limit // 4
+                previous = None
+                if self.summaries and self._summary_tokens[-1] < block_limit:
+                    previous = self.summaries[-1]
+                self.summary_stats.scheduled += 1
+                self._summary_future = summary_executor.submit(
+                    self._run_summary, delta, previous, self._generation, time.monotonic()
+                )
+            return self._summary_future
+
+    def _run_summary(self, delta: List, previous: Optional[str], generation: int, scheduled_at: float):
+        """执行增量摘要并以原子方式替换已被摘要的历史前缀"""
+        try:
+            with metrics.timer(PHASE_SECONDS, phase="summary"):
+                summary = self._create_summary(delta, previous)
+            with self._lock:
+                if generation != self._generation:
+                    # 摘要期间历史被清空或重新加载,结果已过期
+                    self.summary_stats.discarded += 1
+                    return
+                self._apply_fold(len(delta), summary, replace_last=previous is not None)
+                blocks = self.summaries[:-1] if len(self.summaries) > config.summary_max_blocks else None
+            if blocks:
+                self._merge_blocks(blocks, generation)
+        except Exception as e:
+            with self._lock:
+                self.summary_stats.failures += 1
+                self.summary_stats.last_error = str(e)
+            raise
+        finally:
+            with self._lock:
+                self._summary_future = None
+        lag = time.monotonic() - scheduled_at
+        with self._lock:
+            stats = self.summary_stats
+            stats.completed += 1
+            stats.last_lag_seconds = lag
+            stats.total_lag_seconds += lag
+            stats.max_lag_seconds = max(stats.max_lag_seconds, lag)
+
+    def _apply_fold(self, count: int, summary: str, replace_last: bool):
+        """用新摘要替换前count条原文(摘要开始后新增的消息保持不变)"""
+        summary_tokens = token_counter.count_message("system", summary)
+        self.token_total -= sum(self._token_counts[:count])
+        del self.history_memory[:count]
+        del self._token_counts[:count]
+        if replace_last:
+            self.token_total -= self._summary_tokens.pop()
+            self.summaries.pop()
+        self.summaries.append(summary)
+        self._summary_tokens.append(summary_tokens)
+        self.token_total += summary_tokens
+        self._needs_reset = True
+
+    def _merge_blocks(self, blocks: List[str], generation: int):
+        """将已冻结的摘要块合并为一个更高层级的摘要块"""
+        merged = self._create_summary([("system", block) for block in blocks], None, merge_summary_prompt)
+        with self._lock:
+            if generation != self._generation or self.summaries[:len(blocks)] != blocks:
+                self.summary_stats.discarded += 1
+                return
+            merged_tokens = token_counter.count_message("system", merged)
+            self.token_total += merged_tokens - sum(self._summary_tokens[:len(blocks)])
+            self.summaries[:len(blocks)] = [merged]
+            self._summary_tokens[:len(blocks)] = [merged_tokens]
+            self._needs_reset = True
+
+    def _create_summary(self, delta: List, previous: Optional[str] = None, prompt: str = summary_prompt) -> str:
+        """创建摘要(只发送上一个摘要与新增的消息)"""
+        messages = []
+        if previous:
+            messages.append(("system", f"{previous_summary_prefix}\n{previous}"))
+        messages.extend(delta)
+        messages.append(("user", prompt))
+        # 复用已编译的摘要智能体
+        summarizer = get_summarizer(config.summary_model)
         result = summarizer.invoke({"messages": messages})
-        return result.get("output", str(result))
+        return result["messages"][-1].content
+
+    def persist(self, store):
+        """持久化到会话存储(只追加新消息,摘要改写过历史时整体保存)"""
+        with self._lock:
+            if self._needs_reset:
+                store.save(self.thread_id, self._compose())
+            else:
+                store.append(self.thread_id, self.history_memory[self._persisted:])
+            self._persisted = len(self.history_memory)
+            self._needs_reset = False
+
+    @property
+    def dirty(self) -> bool:
+        """是否有尚未写入存储的修改"""
+        return self._needs_reset or self._persisted < len(self.history_memory)
+
+    @property
+    def busy(self) -> bool:
+        """是否有对话轮次正在进行"""
+        return self.turn_lock.locked()
+
+    def restore(self, store):
+        """从会话存储加载历史"""
+        history = store.load(self.thread_id)
+        with self._lock:
+            self._set_history(history)
 
     def save(self, file_path: str):
-        """保存历史到硬盘（自动建目录）"""
+        """导出历史快照到指定文件（自动建目录,临时文件+重命名原子写入）"""
         path = Path(file_path)
         path.parent.mkdir(parents=True, exist_ok=True)
-        path.write_text(
-            json.dumps(self.history_memory, ensure_ascii=False, indent=2), 
-            encoding="utf-8"
-        )
+        with self._lock:
+            data = json.dumps(self._compose(), ensure_ascii=False, indent=2)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(data, encoding="utf-8")
+        os.replace(tmp, path)
 
     def load(self, file_path: str):
-        """从硬盘加载历史"""
+        """从指定文件导入历史快照"""
         path = Path(file_path)
-        if path.exists():
-            self.history_memory = json.loads(path.read_text(encoding="utf-8"))
-        else:
-            self.history_memory = []
+        history = json.loads(path.read_text(encoding="utf-8")) if path.exists() else []
+        with self._lock:
+            self._set_history(history)
+            self._needs_reset = True
+
+    def _set_history(self, history: List):
+        """整体替换历史(开头的system消息视为摘要块)"""
+        split = 0
+        while split < len(history) and history[split][0] == "system":
+            split += 1
+        self.summaries = [content for _, content in history[:split]]
+        self.history_memory = [tuple(item) for item in history[split:]]
+        self._generation += 1
+        self._recount()
+        self._persisted = len(self.history_memory)
+        self._needs_reset = False
+
+    def __repr__(self):
+        return (f"MemoryThread(thread_id={self.thread_id!r}, summaries={len(self.summaries)}, "
+                f"messages={len(self.history_memory)}, tokens={self.token_total})")
+
+
+@dataclass
+class CacheStats:
+    """线程缓存指标"""
+    hits: int = 0  # 命中内存的次数
+    misses: int = 0  # 从存储加载的次数
+    evictions: int = 0  # 超出容量被淘汰的次数
+    expirations: int = 0  # 闲置超时被移出的次数
+    write_backs: int = 0  # 移出时回写存储的次数
+    write_back_failures: int = 0  # 回写存储失败的次数
+    last_error: Optional[str] = None  # 最近一次回写失败原因
 
 
 class HistoryMemory:
-    """管理多个线程的内存型存储"""
+    """
+    管理多个线程的内存型存储
+
+    线程缓存有容量上限(LRU)与可选的闲置超时: 首次访问时从会话存储懒加载,
+    被淘汰时把未保存的修改写回存储。正在进行对话的线程不会被淘汰。
+    """
 
-    def __init__(self):
-        self._dict_memory: Dict[str, MemoryThread] = {}
+    def __init__(self, store=None, max_threads: int = None, ttl: float = None):
+        self._dict_memory: "OrderedDict[str, MemoryThread]" = OrderedDict()  # 按最近访问排序(旧→新)
+        self._lock = threading.Lock()  # 保护 _dict_memory 与 _writing_back
+        self._writing_back: Dict[str, MemoryThread] = {}  # 已移出、正在锁外回写存储的线程
+        self.store = store or session_store  # 会话存储
+        self.max_threads = max(1, max_threads or config.memory_max_threads)
+        self.ttl = config.memory_ttl if ttl is None else ttl
+        self.cache_stats = CacheStats()
 
     def _get_thread(self, thread_id: str) -> MemoryThread:
-        """获取或创建线程"""
-        if thread_id not in self._dict_memory:
-            self._dict_memory[thread_id] = MemoryThread(thread_id)
-        return self._dict_memory[thread_id]
+        """获取线程(未命中时从存储加载)"""
+        with self._lock:
+            thread = self._touch(thread_id)
+            if thread is not None:
+                self.cache_stats.hits += 1
+                evicted = self._evict()
+        if thread is None:
+            # 在锁外读取存储,避免阻塞其他会话
+            loaded = MemoryThread(thread_id)
+            loaded.restore(self.store)
+            with self._lock:
+                thread = self._touch(thread_id)
+                if thread is None:
+                    thread = self._dict_memory[thread_id] = loaded
+                    self.cache_stats.misses += 1
+                evicted = self._evict()
+        self._write_back(evicted)
+        return thread
+
+    def _touch(self, thread_id: str) -> Optional[MemoryThread]:
+        """标记线程为最近使用(调用方持有锁,正在回写的线程直接放回缓存,不从存储重新加载)"""
+        thread = self._dict_memory.get(thread_id)
+        if thread is None:
+            thread = self._writing_back.pop(thread_id, None)
+            if thread is None:
+                return None
+            self._dict_memory[thread_id] = thread
+        self._dict_memory.move_to_end(thread_id)
+        thread.last_access = time.monotonic()
+        return thread
+
+    def _evict(self) -> List[MemoryThread]:
+        """
+        移出闲置超时与超出容量的线程(调用方持有锁,最近访问的线程不会被移出)
+
+        Returns:
+            需要回写存储的线程(由调用方在释放锁后调用_write_back)
+        """
+        deadline = time.monotonic() - self.ttl
+        oldest = next(iter(self._dict_memory.values()))
+        if len(self._dict_memory) <= self.max_threads and not (self.ttl and oldest.last_access < deadline):
+            return []
+        evicted = []
+        candidates = [t for t in list(self._dict_memory.values())[:-1] if not t.busy]
+        if self.ttl:
+            while candidates and candidates[0].last_access < deadline:
+                evicted.append(self._remove(candidates.pop(0)))
+                self.cache_stats.expirations += 1
+        while candidates and len(self._dict_memory) > self.max_threads:
+            evicted.append(self._remove(candidates.pop(0)))
+            self.cache_stats.evictions += 1
+        return [thread for thread in evicted if thread is not None]
+
+    def _remove(self, thread: MemoryThread) -> Optional[MemoryThread]:
+        """移出线程(调用方持有锁),有未保存的修改时返回该线程,等待回写"""
+        del self._dict_memory[thread.thread_id]
+        if thread.transient or not thread.dirty:
+            return None
+        self._writing_back[thread.thread_id] = thread
+        return thread
+
+    def _write_back(self, threads: List[MemoryThread]):
+        """
+        把被移出线程的修改写回存储(在全局锁外执行,失败原因记录在cache_stats中)
+
+        写入前确认线程仍在等待回写: 已被删除或重命名的线程不再写入,避免重新创建已删除的会话或写到旧ID下
+        """
+        for thread in threads:
+            error = None
+            with thread.persist_lock:
+                with self._lock:
+                    if self._writing_back.get(thread.thread_id) is not thread:
+                        continue
+                try:
+                    thread.persist(self.store)
+                except Exception as e:
+                    error = f"{thread.thread_id}: {e}"
+            with self._lock:
+                if self._writing_back.get(thread.thread_id) is thread:
+                    del self._writing_back[thread.thread_id]
+                if error is None:
+                    self.cache_stats.write_backs += 1
+                else:
+                    self.cache_stats.write_back_failures += 1
+                    self.cache_stats.last_error = error
+
+    def has_thread(self, thread_id: str) -> bool:
+        """线程是否已在内存中"""
+        with self._lock:
+            return thread_id in self._dict_memory
+
+    def turn_lock(self, thread_id: str) -> threading.Lock:
+        """获取线程的对话轮次锁(同一会话串行,不同会话并行)"""
+        return self._get_thread(thread_id).turn_lock
+
+    @asynccontextmanager
+    async def async_turn_lock(self, thread_id: str) -> AsyncIterator[None]:
+        """
+        异步持有线程的对话轮次锁(与turn_lock是同一把锁,同一会话的同步与异步轮次互相串行)
+
+        锁被占用时在线程池中等待,不阻塞事件循环;等待期间被取消时,线程拿到锁后立即释放
+        """
+        lock = await asyncio.to_thread(self.turn_lock, thread_id)
+        if not lock.acquire(blocking=False):
+            waiter = asyncio.ensure_future(asyncio.to_thread(lock.acquire))
+            try:
+                await asyncio.shield(waiter)
+            except asyncio.CancelledError:
+                waiter.add_done_callback(lambda _: lock.release())
+                raise
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def set_history(self, thread_id: str, history: List, transient: bool = False):
+        """整体替换指定线程的历史(transient为True时该线程不会写回存储)"""
+        thread = self._get_thread(thread_id)
+        with thread._lock:
+            thread._set_history(history)
+            thread._needs_reset = True
+            thread.transient = transient
+
+    def get_messages(self, thread_id: str) -> List:
+        """获取指定线程的完整历史(摘要块在前,不触发摘要)"""
+        thread = self._get_thread(thread_id)
+        with thread._lock:
+            return thread._compose()
+
+    def rename_thread(self, old_id: str, new_id: str):
+        """重命名线程(会话重命名时同步;正在等待回写的线程放回缓存,之后按新ID写回)"""
+        with self._lock:
+            thread = self._dict_memory.pop(old_id, None)
+            pending = self._writing_back.pop(old_id, None)
+        if pending is not None:
+            # 等待进行中的回写结束,之后的回写发现线程已不在等待列表中会跳过
+            with pending.persist_lock:
+                pass
+        thread = thread or pending
+        if thread is None:
+            return
+        with self._lock:
+            thread.thread_id = new_id
+            self._dict_memory[new_id] = thread
+            self._dict_memory.move_to_end(new_id)
+            evicted = self._evict()
+        self._write_back(evicted)
+
+    def remove_thread(self, thread_id: str):
+        """从内存中移除线程(等待进行中的回写结束,返回后不会再写入该会话)"""
+        with self._lock:
+            self._dict_memory.pop(thread_id, None)
+            pending = self._writing_back.pop(thread_id, None)
+        if pending is not None:
+            with pending.persist_lock:
+                pass
 
     def add_message(self, thread_id: str, role: str, content: str):
         """添加消息到指定线程"""
         self._get_thread(thread_id).add_message(role, content)
 
-    def get_history(self, thread_id: str) -> List:
-        """获取指定线程的历史消息"""
-        return self._get_thread(thread_id).get_history()
+    def get_history(self, thread_id: str, summarize: bool = True) -> List:
+        """获取指定线程的历史消息(summarize为False时不生成摘要)"""
+        return self._get_thread(thread_id).get_history(summarize)
 
     def clear_history(self, thread_id: str):
         """清空指定线程的历史消息"""
         self._get_thread(thread_id).clear_history()
 
+    def get_token_total(self, thread_id: str) -> int:
+        """获取指定线程当前历史的token总数"""
+        return self._get_thread(thread_id).token_total
+
+    def get_summary_stats(self, thread_id: str) -> Dict:
+        """获取指定线程的摘要执行指标"""
+        thread = self._get_thread(thread_id)
+        with thread._lock:
+            return asdict(thread.summary_stats)
+
+    def get_cache_stats(self) -> Dict:
+        """获取线程缓存指标"""
+        with self._lock:
+            return {**asdict(self.cache_stats), "size": len(self._dict_memory)}
+
     def list_threads(self) -> List[str]:
-        """列出所有线程ID"""
-        return list(self._dict_memory.keys())
+        """列出内存中的线程ID"""
+        with self._lock:
+            return list(self._dict_memory.keys())
 
     def save(self, thread_id: str, file_path: str = ""):
-        """保存指定线程的历史"""
-        file_path = file_path or f"./data/memory/{thread_id}.json"
-        self._get_thread(thread_id).save(file_path)
+        """保存指定线程的历史(指定file_path时导出为JSON快照)"""
+        with metrics.timer(PHASE_SECONDS, phase="persist"):
+            if file_path:
+                self._get_thread(thread_id).save(file_path)
+            else:
+                self._get_thread(thread_id).persist(self.store)
 
     def load(self, thread_id: str, file_path: str = ""):
-        """加载指定线程的历史"""
-        file_path = file_path or f"./data/memory/{thread_id}.json"
-        self._get_thread(thread_id).load(file_path)
+        """加载指定线程的历史(指定file_path时从JSON快照导入)"""
+        if file_path:
+            self._get_thread(thread_id).load(file_path)
+        else:
+            self._get_thread(thread_id).restore(self.store)
@@ -0,0 +1,63 @@
+import re
+from typing import Callable, Optional
+
+from src.config.config_model import config
+
+# 中日韩字符(CJK统一表意文字、假名、韩文、全角标点)
+_CJK_PATTERN = re.compile("[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+# 每条消息的固定开销(角色标记、分隔符等)
+MESSAGE_OVERHEAD = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """离线估算token数(CJK字符按1个token计,其余字符按4个字符1个token计)"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+
+def _load_tiktoken(encoding_name: str) -> Optional[Callable[[str], int]]:
+    """加载tiktoken分词器,不可用时返回None"""
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding(encoding_name)
+    except Exception:
+        return None
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+class TokenCounter:
+    """Token计数器(可插拔分词器,默认使用离线估算)"""
+
+    def __init__(self, tokenizer: Optional[Callable[[str], int]] = None):
+        self.tokenizer: Callable[[str], int] = tokenizer or estimate_tokens
+
+    @classmethod
+    def from_name(cls, name: str = "estimate") -> "TokenCounter":
+        """
+        根据名称创建计数器
+
+        Args:
+            name: estimate(离线估算) 或 tiktoken[:编码名],如 tiktoken:cl100k_base
+        """
+        if name and name.startswith("tiktoken"):
+            _, _, encoding_name = name.partition(":")
+            tokenizer = _load_tiktoken(encoding_name or "cl100k_base")
+            if tokenizer:
+                return cls(tokenizer)
+        return cls()
+
+    def count(self, text: str) -> int:
+        """计算文本token数"""
+        return self.tokenizer(text or "")
+
+    def count_message(self, role: str, content: str) -> int:
+        """计算单条消息token数(包含消息固定开销)"""
+        return self.count(role) + self.count(content) + MESSAGE_OVERHEAD
+
+
+# 全局共享的计数器(按配置的分词器创建,各模块统一使用)
+token_counter = TokenCounter.from_name(config.tokenizer)
@@ -0,0 +1,186 @@
+"""
+并行工具节点
+
+模型在一步中返回多个 tool_calls 时,在有界线程池(同步)或事件循环(异步)中同时执行,
+每个工具有独立的并发上限与超时,结果按 tool_calls 的顺序返回。
+一步的耗时接近最慢的工具,而不是所有工具耗时之和。
+
+Python无法强制结束正在运行的线程: 超时的工具调用只是不再等待,工具本身会继续运行,
+直到结束前一直占用线程池的一个线程与该工具的一个并发名额(异步执行时同步工具也会继续占用线程)。
+因此等待并发名额同样受超时限制,超时仍在运行的调用占满半个线程池时换用新的线程池,
+旧线程池在其中的工具结束后退出,不会让后续调用一直排队。需要可靠结束的工具(如run_cmd)应自带超时。
+
+并行执行依赖ToolNode的内部方法(_parse_input/_run_one/_arun_one/_combine_tool_outputs),
+LangGraph版本变化导致这些方法不存在时退回ToolNode自身的执行方式。
+"""
+import time
+import asyncio
+import threading
+import contextvars
+import weakref
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import get_config_list
+from langgraph.prebuilt import ToolNode
+from langgraph.store.base import BaseStore
+
+
+# 并行执行使用的ToolNode内部方法
+_TOOL_NODE_INTERNALS = ("_parse_input", "_run_one", "_arun_one", "_combine_tool_outputs")
+PARALLEL_SUPPORTED = all(callable(getattr(ToolNode, name, None)) for name in _TOOL_NODE_INTERNALS)
+
+
+class ParallelToolNode(ToolNode):
+    """并行执行同一步内多个工具调用的ToolNode"""
+
+    def __init__(self, tools: Sequence, max_workers: int = 8, timeout: float = 60.0,
+                 default_limit: int = 4, limits: Optional[Dict[str, int]] = None, **kwargs):
+        """
+        Args:
+            tools: 工具列表
+            max_workers: 线程池大小(同步执行时所有工具共用)
+            timeout: 单个工具调用的超时时间(秒,0表示不限制)
+            default_limit: 每个工具的默认并发上限
+            limits: 按工具名单独设置的并发上限
+        """
+        super().__init__(tools, **kwargs)
+        self.timeout = timeout
+        self._limits = {name: (limits or {}).get(name, default_limit) for name in self.tools_by_name}
+        self._semaphores = {name: threading.BoundedSemaphore(limit) for name, limit in self._limits.items()}
+        # asyncio.Semaphore 绑定事件循环,按循环分别创建
+        self._async_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = \
+            weakref.WeakKeyDictionary()
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None  # 首次执行时创建,shutdown后再次执行时重新创建
+        self._executor_lock = threading.Lock()
+        self._abandoned = 0  # 当前线程池中已超时但仍在运行的调用数
+
+    @property
+    def abandoned_workers(self) -> int:
+        """已超时但仍在运行、占用线程的工具调用数"""
+        with self._executor_lock:
+            return self._abandoned
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tool")
+            return self._executor
+
+    def _submit(self, fn, *args):
+        """提交到当前线程池(线程池恰好被关闭或替换时改用新的线程池),返回(线程池, future)"""
+        while True:
+            executor = self._pool()
+            try:
+                return executor, executor.submit(fn, *args)
+            except RuntimeError:
+                continue
+
+    def shutdown(self, wait: bool = False):
+        """关闭线程池(节点被缓存淘汰时调用;之后仍可使用,再次执行时重新创建线程池)"""
+        with self._executor_lock:
+            executor, self._executor, self._abandoned = self._executor, None, 0
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _abandon(self, executor: ThreadPoolExecutor, future):
+        """记录超时后仍在运行的调用,占满半个线程池时换用新的线程池"""
+        with self._executor_lock:
+            if executor is not self._executor:
+                return
+            self._abandoned += 1
+            retire = self._abandoned >= max(1, self.max_workers // 2)
+            if retire:
+                self._executor, self._abandoned = None, 0
+            else:
+                future.add_done_callback(lambda _: self._release_abandoned(executor))
+        if retire:
+            executor.shutdown(wait=False)
+
+    def _release_abandoned(self, executor: ThreadPoolExecutor):
+        with self._executor_lock:
+            if executor is self._executor:
+                self._abandoned -= 1
+
+    def _timeout_message(self, call: Dict) -> ToolMessage:
+        return ToolMessage(
+            content=f"错误: 工具 {call['name']} 执行超时({self.timeout}s)",
+            name=call["name"],
+            tool_call_id=call["id"],
+            status="error"
+        )
+
+    def _run_limited(self, call: Dict, input_type: str, config: RunnableConfig,
+                     deadline: Optional[float]) -> ToolMessage:
+        semaphore = self._semaphores.get(call["name"])
+        if semaphore is None:
+            # 未知工具: 交给父类生成错误消息
+            return self._run_one(call, input_type, config)
+        # 并发名额被超时仍在运行的调用占用时,等待到截止时间为止,不无限占用线程
+        remaining = max(0.0, deadline - time.monotonic()) if deadline else None
+        if not semaphore.acquire(timeout=remaining):
+            return self._timeout_message(call)
+        try:
+            return self._run_one(call, input_type, config)
+        finally:
+            semaphore.release()
+
+    def _func(self, input: Any, config: RunnableConfig, *, store: Optional[BaseStore]) -> Any:
+        if not PARALLEL_SUPPORTED:
+            return super()._func(input, config, store=store)
+        tool_calls, input_type = self._parse_input(input, store)
+        config_list = get_config_list(config, len(tool_calls))
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        # 复制上下文,使工具内可以读取当前会话等上下文变量
+        submitted = [
+            self._submit(contextvars.copy_context().run, self._run_limited, call, input_type, call_config, deadline)
+            for call, call_config in zip(tool_calls, config_list)
+        ]
+        outputs: List[ToolMessage] = []
+        for call, (executor, future) in zip(tool_calls, submitted):
+            try:
+                remaining = max(0.0, deadline - time.monotonic()) if deadline else None
+                outputs.append(future.result(timeout=remaining))
+            except FutureTimeoutError:
+                # 尚未开始的调用直接取消,已在运行的调用无法中断
+                if not future.cancel():
+                    self._abandon(executor, future)
+                outputs.append(self._timeout_message(call))
+        return self._combine_tool_outputs(outputs, input_type)
+
+    def _async_semaphore(self, name: str) -> Optional[asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        semaphores = self._async_semaphores.get(loop)
+        if semaphores is None:
+            semaphores = self._async_semaphores[loop] = {
+                tool_name: asyncio.Semaphore(limit) for tool_name, limit in self._limits.items()
+            }
+        return semaphores.get(name)
+
+    async def _arun_limited(self, call: Dict, input_type: str, config: RunnableConfig) -> ToolMessage:
+        semaphore = self._async_semaphore(call["name"])
+        if semaphore is None:
+            return await self._arun_one(call, input_type, config)
+
+        async def run() -> ToolMessage:
+            async with semaphore:
+                return await self._arun_one(call, input_type, config)
+
+        # 等待并发名额的时间也计入超时
+        try:
+            return await asyncio.wait_for(run(), self.timeout or None)
+        except asyncio.TimeoutError:
+            return self._timeout_message(call)
+
+    async def _afunc(self, input: Any, config: RunnableConfig, *, store: Optional[BaseStore]) -> Any:
+        if not PARALLEL_SUPPORTED:
+            return await super()._afunc(input, config, store=store)
+        tool_calls, input_type = self._parse_input(input, store)
+        config_list = get_config_list(config, len(tool_calls))
+        outputs = await asyncio.gather(
+            *(self._arun_limited(call, input_type, call_config) for call, call_config in zip(tool_calls, config_list))
+        )
+        return self._combine_tool_outputs(list(outputs), input_type)
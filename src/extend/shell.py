@@ -0,0 +1,310 @@
+"""
+命令执行
+
+run_command / arun_command: 每次启动新的shell执行命令,增量读取输出并实时回调,
+限制执行时间与保留的输出长度,超时后结束整个进程组(含子进程)。
+ShellSession: 每个会话一个常驻shell(仅Linux/macOS),连续执行命令时省去启动进程的开销,
+cd、环境变量等状态在同一会话的命令之间保留。
+"""
+import os
+import time
+import uuid
+import queue
+import shlex
+import atexit
+import codecs
+import locale
+import signal
+import asyncio
+import threading
+import subprocess
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+# 输出回调(收到一段输出时调用)
+OutputCallback = Optional[Callable[[str], None]]
+
+IS_WINDOWS = os.name == "nt"
+_READ_SIZE = 65536
+
+
+def _encoding() -> str:
+    return locale.getpreferredencoding(False)
+
+
+def _new_group_kwargs() -> Dict:
+    """在新的进程组中启动,超时时可以结束整个进程树"""
+    if IS_WINDOWS:
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def _kill_tree(pid: int):
+    """结束进程及其全部子进程"""
+    try:
+        if IS_WINDOWS:
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)], capture_output=True)
+        else:
+            os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+
+class _Output:
+    """累计命令输出(超出上限的部分只计数不保存)"""
+
+    def __init__(self, limit: int, on_output: OutputCallback = None):
+        self.limit = limit
+        self.on_output = on_output
+        self.parts = []
+        self.size = 0
+        self.dropped = 0  # 超出上限而省略的字符数
+
+    def add(self, text: str):
+        if not text:
+            return
+        if self.on_output:
+            self.on_output(text)
+        keep = max(0, min(len(text), self.limit - self.size))
+        if keep:
+            self.parts.append(text[:keep])
+            self.size += keep
+        self.dropped += len(text) - keep
+
+    def text(self) -> str:
+        return "".join(self.parts)
+
+
+def format_result(command: str, stdout: _Output, stderr: Optional[_Output] = None, exit_code: Optional[int] = None,
+                  timeout: Optional[float] = None) -> str:
+    """拼接 stdout 和 stderr,并附加截断/超时/退出码说明;内容为空时返回提示"""
+    outputs = [o for o in (stdout, stderr) if o is not None]
+    output = "\n".join(o.text().strip() for o in outputs if o.text().strip())
+    notes = []
+    dropped = sum(o.dropped for o in outputs)
+    if dropped:
+        notes.append(f"输出过长,已省略 {dropped} 字符")
+    if timeout is not None:
+        notes.append(f"命令执行超时({timeout}s),已结束进程")
+    elif exit_code:
+        notes.append(f"退出码: {exit_code}")
+    if not output and not notes:
+        return f"命令已执行成功，但没有输出: {command}"
+    return "\n".join([output] + [f"...({note})" for note in notes]).strip()
+
+
+def _pump(stream, name: str, output_queue: queue.Queue):
+    """读取管道并按块放入队列(EOF时放入None)"""
+    decoder = codecs.getincrementaldecoder(_encoding())("replace")
+    fd = stream.fileno()
+    while True:
+        chunk = os.read(fd, _READ_SIZE)
+        if not chunk:
+            break
+        output_queue.put((name, decoder.decode(chunk)))
+    output_queue.put((name, decoder.decode(b"", final=True)))
+    output_queue.put((name, None))
+
+
+def run_command(command: str, timeout: float = 0, limit: int = 20000, on_output: OutputCallback = None) -> str:
+    """启动新的shell执行命令(timeout为0表示不限制时间)"""
+    try:
+        process = subprocess.Popen(command, shell=True, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, **_new_group_kwargs())
+    except Exception as e:
+        return f"命令执行异常: {str(e)}"
+    outputs = {"stdout": _Output(limit, on_output), "stderr": _Output(limit, on_output)}
+    output_queue: queue.Queue = queue.Queue()
+    readers = [threading.Thread(target=_pump, args=(getattr(process, name), name, output_queue), daemon=True)
+               for name in outputs]
+    for reader in readers:
+        reader.start()
+
+    deadline = time.monotonic() + timeout if timeout else None
+    open_streams, timed_out = len(readers), False
+    while open_streams:
+        remaining = deadline - time.monotonic() if deadline else None
+        if remaining is not None and remaining <= 0:
+            timed_out = True
+            _kill_tree(process.pid)
+            break
+        try:
+            name, text = output_queue.get(timeout=remaining)
+        except queue.Empty:
+            continue
+        if text is None:
+            open_streams -= 1
+        else:
+            outputs[name].add(text)
+    try:
+        exit_code = process.wait(timeout=max(0.0, deadline - time.monotonic()) if deadline and not timed_out else None)
+    except subprocess.TimeoutExpired:
+        # 输出管道已关闭但进程仍在运行
+        timed_out = True
+        _kill_tree(process.pid)
+        exit_code = process.wait()
+    for reader in readers:
+        reader.join(timeout=1)
+    for pipe in (process.stdout, process.stderr):
+        pipe.close()
+    return format_result(command, outputs["stdout"], outputs["stderr"], exit_code, timeout if timed_out else None)
+
+
+async def arun_command(command: str, timeout: float = 0, limit: int = 20000, on_output: OutputCallback = None) -> str:
+    """run_command 的异步实现(等待子进程期间不占用线程)"""
+    try:
+        process = await asyncio.create_subprocess_shell(command, stdin=asyncio.subprocess.DEVNULL,
+                                                        stdout=asyncio.subprocess.PIPE,
+                                                        stderr=asyncio.subprocess.PIPE, **_new_group_kwargs())
+    except Exception as e:
+        return f"命令执行异常: {str(e)}"
+    stdout, stderr = _Output(limit, on_output), _Output(limit, on_output)
+
+    async def pump(stream, output: _Output):
+        decoder = codecs.getincrementaldecoder(_encoding())("replace")
+        while chunk := await stream.read(_READ_SIZE):
+            output.add(decoder.decode(chunk))
+        output.add(decoder.decode(b"", final=True))
+
+    timed_out = False
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(pump(process.stdout, stdout), pump(process.stderr, stderr), process.wait()),
+            timeout or None
+        )
+    except asyncio.TimeoutError:
+        timed_out = True
+        _kill_tree(process.pid)
+    exit_code = await process.wait()
+    return format_result(command, stdout, stderr, exit_code, timeout if timed_out else None)
+
+
+class ShellSession:
+    """常驻shell(stdin写入命令,以唯一结束标记识别命令结束与退出码)"""
+
+    def __init__(self, shell: str = "/bin/sh"):
+        self.shell = shell
+        self.lock = threading.Lock()  # 同一时间只执行一条命令
+        self.process: Optional[subprocess.Popen] = None
+        self._queue: queue.Queue = queue.Queue()
+
+    def _start(self):
+        self._queue = queue.Queue()
+        self.process = subprocess.Popen([self.shell], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT, **_new_group_kwargs())
+        threading.Thread(target=_pump, args=(self.process.stdout, "stdout", self._queue), daemon=True).start()
+
+    def run(self, command: str, timeout: float = 0, limit: int = 20000, on_output: OutputCallback = None) -> str:
+        """在常驻shell中执行命令(调用方持有lock)"""
+        if self.process is None or self.process.poll() is not None:
+            self._start()
+        marker = f"__CMD_DONE_{uuid.uuid4().hex}__"
+        # 命令作为一个整体交给eval执行: 引号不配对等语法错误不会吞掉后面的结束标记(eval报错或shell退出),
+        # 命令的标准输入重定向到/dev/null,避免读取到后续写入的命令
+        script = f"eval {shlex.quote(command)} < /dev/null\nprintf '\\n{marker} %s\\n' \"$?\"\n"
+        try:
+            self.process.stdin.write(script.encode(_encoding()))
+            self.process.stdin.flush()
+        except OSError as e:
+            self.close()
+            return f"命令执行异常: {str(e)}"
+
+        output = _Output(limit, on_output)
+        sentinel = "\n" + marker
+        buffer = ""
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            remaining = deadline - time.monotonic() if deadline else None
+            if remaining is not None and remaining <= 0:
+                # 结束整个shell(含仍在运行的命令),下一条命令在新的shell中执行
+                self.close()
+                output.add(buffer)
+                return format_result(command, output, timeout=timeout)
+            try:
+                _, text = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if text is None:
+                # shell已退出(例如执行了exit或命令有语法错误),下一条命令在新的shell中执行
+                output.add(buffer)
+                exit_code = self.process.wait()
+                self.close()
+                return format_result(command, output, exit_code=exit_code)
+            buffer += text
+            index = buffer.find(sentinel)
+            if index == -1:
+                # 保留可能是结束标记前缀的尾部,其余内容立即输出
+                safe = len(buffer) - len(sentinel)
+                if safe > 0:
+                    output.add(buffer[:safe])
+                    buffer = buffer[safe:]
+                continue
+            rest = buffer[index + len(sentinel):]
+            if "\n" not in rest:
+                continue
+            output.add(buffer[:index])
+            status = rest.split("\n", 1)[0].strip()
+            return format_result(command, output, exit_code=int(status) if status.isdigit() else None)
+
+    def close(self):
+        """结束shell及其子进程"""
+        if self.process is not None:
+            _kill_tree(self.process.pid)
+            for pipe in (self.process.stdin, self.process.stdout):
+                try:
+                    pipe.close()
+                except OSError:
+                    pass
+            self.process = None
+
+
+class ShellPool:
+    """按会话复用常驻shell(超出数量时关闭最久未使用的shell)"""
+
+    def __init__(self, max_sessions: int = 16):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, ShellSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _session(self, thread_id: str) -> ShellSession:
+        with self._lock:
+            session = self._sessions.get(thread_id)
+            if session is None:
+                session = self._sessions[thread_id] = ShellSession()
+            self._sessions.move_to_end(thread_id)
+            for key in list(self._sessions)[:-1]:
+                if len(self._sessions) <= self.max_sessions:
+                    break
+                if not self._sessions[key].lock.locked():
+                    self._sessions.pop(key).close()
+            return session
+
+    def run(self, thread_id: Optional[str], command: str, timeout: float = 0, limit: int = 20000,
+            on_output: OutputCallback = None) -> Optional[str]:
+        """
+        在会话的常驻shell中执行命令
+
+        Returns:
+            命令输出; 没有会话ID、不支持常驻shell或该会话的shell正忙时返回None(由调用方单独启动进程执行)
+        """
+        if thread_id is None or IS_WINDOWS:
+            return None
+        session = self._session(thread_id)
+        if not session.lock.acquire(blocking=False):
+            return None
+        try:
+            return session.run(command, timeout, limit, on_output)
+        finally:
+            session.lock.release()
+
+    def close(self):
+        """关闭全部常驻shell"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+# 全局常驻shell池
+shell_pool = ShellPool()
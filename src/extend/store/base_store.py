@@ -0,0 +1,52 @@
+from abc import ABC, abstractmethod
+from typing import List
+
+
+class SessionStore(ABC):
+    """
+    会话存储抽象基类。
+    消息统一为 [role, content] 列表,会话以会话ID区分。
+    """
+
+    @abstractmethod
+    def list_sessions(self) -> List[str]:
+        """列出所有会话ID(按名称排序,各后端一致)"""
+        pass
+
+    @abstractmethod
+    def exists(self, session_id: str) -> bool:
+        """会话是否存在"""
+        pass
+
+    @abstractmethod
+    def load(self, session_id: str) -> List:
+        """读取会话全部消息"""
+        pass
+
+    @abstractmethod
+    def append(self, session_id: str, messages: List):
+        """追加消息(会话不存在时自动创建)"""
+        pass
+
+    @abstractmethod
+    def save(self, session_id: str, messages: List):
+        """整体替换会话消息"""
+        pass
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        """删除会话,返回会话是否存在"""
+        pass
+
+    @abstractmethod
+    def rename(self, old_id: str, new_id: str) -> bool:
+        """重命名会话,返回旧会话是否存在"""
+        pass
+
+    def flush(self):
+        """将缓冲的数据落盘(默认无操作)"""
+        pass
+
+    def close(self):
+        """释放资源(默认无操作)"""
+        pass
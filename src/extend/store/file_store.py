@@ -0,0 +1,286 @@
+import os
+import json
+import atexit
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from src.extend.store.base_store import SessionStore
+
+
+class _SessionFile:
+    """单个会话日志文件的状态"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.handle = None  # 追加写入句柄
+        self.records = 0  # 日志中的消息条目数(reset记录按其中的消息数计)
+        self.live = 0  # 回放后的有效消息条数
+        self.pending = 0  # 尚未fsync的记录数
+        self.compacting = False
+
+
+class FileSessionStore(SessionStore):
+    """
+    追加写入的会话存储(JSONL)
+
+    每条消息追加为一行记录,整体替换(save)追加一条包含全部消息的reset记录并立即fsync;
+    追加的fsync按组批量执行。被reset覆盖的失效记录超过有效消息数时在后台压缩,
+    压缩通过临时文件+重命名原子完成。
+    旧版 {id}.json 文件在首次读取时自动迁移为 {id}.jsonl。
+    """
+
+    def __init__(self, directory: str = "./data/memory", fsync_every: int = 16,
+                 fsync_interval: float = 1.0, compact_min_records: int = 64):
+        self.directory = Path(directory)
+        self.fsync_every = fsync_every  # 累计多少条记录执行一次fsync
+        self.fsync_interval = fsync_interval  # 后台fsync间隔(秒)
+        self.compact_min_records = compact_min_records  # 触发压缩的最少记录数
+        self._files: Dict[str, _SessionFile] = {}
+        self._files_lock = threading.Lock()
+        self._index: Optional[Set[str]] = None  # 会话ID索引(首次列出时扫描目录,之后随写操作维护)
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="session-fsync", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    # --- 路径与状态 ---
+    def _log_path(self, session_id: str) -> Path:
+        return self.directory / f"{session_id}.jsonl"
+
+    def _legacy_path(self, session_id: str) -> Path:
+        return self.directory / f"{session_id}.json"
+
+    def _state(self, session_id: str) -> _SessionFile:
+        with self._files_lock:
+            state = self._files.get(session_id)
+            if state is None:
+                state = self._files[session_id] = _SessionFile()
+                with state.lock:
+                    self._recover(session_id, state)
+            return state
+
+    def _recover(self, session_id: str, state: _SessionFile):
+        """首次访问时迁移旧格式并修复崩溃留下的半行记录"""
+        path = self._log_path(session_id)
+        legacy = self._legacy_path(session_id)
+        if not path.exists() and legacy.exists():
+            history = json.loads(legacy.read_text(encoding="utf-8"))
+            self._write_atomic(path, history)
+            legacy.unlink()
+        # 压缩在重命名前崩溃留下的临时文件(未生效)
+        path.with_suffix(".jsonl.tmp").unlink(missing_ok=True)
+        if path.exists():
+            messages, records, good_size = self._replay(path)
+            if good_size < path.stat().st_size:
+                with open(path, "r+b") as f:
+                    f.truncate(good_size)
+            state.records, state.live = records, len(messages)
+
+    @staticmethod
+    def _replay(path: Path):
+        """回放日志,返回(消息列表, 消息条目数, 最后一条完整记录的结束位置)"""
+        messages: List = []
+        records = 0
+        good_size = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if record["op"] == "add":
+                    messages.append([record["role"], record["content"]])
+                    records += 1
+                elif record["op"] == "reset":
+                    messages = [list(m) for m in record["messages"]]
+                    records += len(messages)
+                good_size += len(line)
+        return messages, records, good_size
+
+    @staticmethod
+    def _encode(record: Dict) -> bytes:
+        return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def _write_atomic(self, path: Path, messages: List):
+        """写入临时文件并fsync后重命名,保证文件要么是旧内容要么是新内容"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".jsonl.tmp")
+        with open(tmp, "wb") as f:
+            for role, content in messages:
+                f.write(self._encode({"op": "add", "role": role, "content": content}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        if hasattr(os, "O_DIRECTORY"):
+            fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _close_handle(self, state: _SessionFile):
+        if state.handle is not None:
+            state.handle.flush()
+            os.fsync(state.handle.fileno())
+            state.handle.close()
+            state.handle = None
+            state.pending = 0
+
+    def _append_records(self, session_id: str, state: _SessionFile, records: List[Dict], sync: bool = False):
+        if state.handle is None:
+            path = self._log_path(session_id)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            state.handle = open(path, "ab")
+        state.handle.write(b"".join(self._encode(r) for r in records))
+        state.handle.flush()
+        state.pending += len(records)
+        if sync or state.pending >= self.fsync_every:
+            os.fsync(state.handle.fileno())
+            state.pending = 0
+
+    # --- 会话接口 ---
+    def _scan(self) -> Set[str]:
+        """扫描目录建立会话ID索引"""
+        sessions = set()
+        if self.directory.exists():
+            for name in os.listdir(self.directory):
+                if name.endswith(".jsonl"):
+                    sessions.add(name[:-6])
+                elif name.endswith(".json"):
+                    sessions.add(name[:-5])
+        return sessions
+
+    def _indexed(self, session_id: str, present: bool):
+        """写操作后同步会话ID索引"""
+        with self._files_lock:
+            if self._index is not None:
+                if present:
+                    self._index.add(session_id)
+                else:
+                    self._index.discard(session_id)
+
+    def list_sessions(self) -> List[str]:
+        """列出所有会话ID"""
+        with self._files_lock:
+            if self._index is None:
+                self._index = self._scan()
+            return sorted(self._index)
+
+    def exists(self, session_id: str) -> bool:
+        return self._log_path(session_id).exists() or self._legacy_path(session_id).exists()
+
+    def load(self, session_id: str) -> List:
+        """读取会话全部消息"""
+        state = self._state(session_id)
+        with state.lock:
+            path = self._log_path(session_id)
+            if not path.exists():
+                return []
+            if state.handle is not None:
+                state.handle.flush()
+            messages, state.records, _ = self._replay(path)
+            state.live = len(messages)
+            return messages
+
+    def append(self, session_id: str, messages: List):
+        """追加消息"""
+        if not messages:
+            return
+        state = self._state(session_id)
+        with state.lock:
+            self._append_records(session_id, state, [
+                {"op": "add", "role": role, "content": content} for role, content in messages
+            ])
+            state.records += len(messages)
+            state.live += len(messages)
+        self._indexed(session_id, True)
+        self._maybe_compact(session_id, state)
+
+    def save(self, session_id: str, messages: List):
+        """整体替换会话消息(追加一条reset记录并fsync,半行记录在恢复时截断,因此替换是原子的)"""
+        state = self._state(session_id)
+        with state.lock:
+            self._append_records(session_id, state, [{"op": "reset", "messages": [list(m) for m in messages]}],
+                                 sync=True)
+            state.records += len(messages)
+            state.live = len(messages)
+        self._indexed(session_id, True)
+        self._maybe_compact(session_id, state)
+
+    def delete(self, session_id: str) -> bool:
+        """删除会话"""
+        state = self._state(session_id)
+        with state.lock:
+            self._close_handle(state)
+            deleted = False
+            for path in (self._log_path(session_id), self._legacy_path(session_id)):
+                if path.exists():
+                    path.unlink()
+                    deleted = True
+        with self._files_lock:
+            self._files.pop(session_id, None)
+        self._indexed(session_id, False)
+        return deleted
+
+    def rename(self, old_id: str, new_id: str) -> bool:
+        """重命名会话(文件重命名,不复制内容)"""
+        state = self._state(old_id)
+        with state.lock:
+            if not self._log_path(old_id).exists():
+                return False
+            self._close_handle(state)
+            os.replace(self._log_path(old_id), self._log_path(new_id))
+        with self._files_lock:
+            self._files.pop(old_id, None)
+            self._files.pop(new_id, None)
+        self._indexed(old_id, False)
+        self._indexed(new_id, True)
+        return True
+
+    # --- 后台任务 ---
+    def _maybe_compact(self, session_id: str, state: _SessionFile):
+        """失效记录超过有效消息数时在后台压缩日志"""
+        with state.lock:
+            if state.compacting or state.records < self.compact_min_records or state.records <= state.live * 2:
+                return
+            state.compacting = True
+        threading.Thread(target=self._compact, args=(session_id, state), daemon=True).start()
+
+    def _compact(self, session_id: str, state: _SessionFile):
+        try:
+            with state.lock:
+                path = self._log_path(session_id)
+                if path.exists():
+                    self._close_handle(state)
+                    messages, _, _ = self._replay(path)
+                    self._write_atomic(path, messages)
+                    state.records = state.live = len(messages)
+        finally:
+            state.compacting = False
+
+    def _flush_loop(self):
+        """定期fsync尚未落盘的记录"""
+        while not self._closed.wait(self.fsync_interval):
+            self.flush()
+
+    def flush(self):
+        """fsync所有未落盘的记录"""
+        with self._files_lock:
+            states = list(self._files.values())
+        for state in states:
+            with state.lock:
+                if state.handle is not None and state.pending:
+                    os.fsync(state.handle.fileno())
+                    state.pending = 0
+
+    def close(self):
+        """落盘并关闭所有文件句柄"""
+        self._closed.set()
+        with self._files_lock:
+            states = list(self._files.values())
+        for state in states:
+            with state.lock:
+                self._close_handle(state)
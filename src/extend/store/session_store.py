@@ -0,0 +1,25 @@
+"""
+会话存储工厂(按配置选择后端,智能体记忆与web会话共用同一实例)
+"""
+from src.config.config_model import config, Project
+from src.extend.store.base_store import SessionStore
+
+
+def create_session_store(project: Project) -> SessionStore:
+    """根据项目配置创建会话存储"""
+    storage = project.storage
+    backend = storage.backend.lower()
+    if backend == "sqlite":
+        from src.extend.store.sql_store import SQLiteSessionStore
+        return SQLiteSessionStore(storage.sqlite_path, storage.pool_size, storage.max_overflow)
+    if backend == "mysql":
+        from src.extend.store.sql_store import MySQLSessionStore
+        return MySQLSessionStore(project.mysql, storage.pool_size, storage.max_overflow)
+    if backend == "file":
+        from src.extend.store.file_store import FileSessionStore
+        return FileSessionStore(storage.file_dir)
+    raise ValueError(f"不支持的会话存储后端: {storage.backend}")
+
+
+# 全局会话存储
+session_store: SessionStore = create_session_store(config)
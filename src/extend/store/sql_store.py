@@ -0,0 +1,178 @@
+import time
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from sqlalchemy.pool import QueuePool
+
+from src.config.config_entity import MySQL_Config
+from src.extend.store.base_store import SessionStore
+
+
+class SqlSessionStore(SessionStore):
+    """
+    基于关系数据库的会话存储(连接池复用连接)
+
+    sessions 表保存会话元数据(自增主键+唯一名称),messages 表按会话主键与序号保存消息,
+    因此重命名与列出会话只涉及 sessions 表的一行/索引扫描,与消息数量无关。
+    """
+    placeholder = "?"  # SQL参数占位符
+    schema: List[str] = []  # 建表语句
+
+    def __init__(self, creator: Callable, pool_size: int = 5, max_overflow: int = 10):
+        self.pool = QueuePool(creator, pool_size=pool_size, max_overflow=max_overflow)
+        with self._cursor() as cur:
+            for statement in self.schema:
+                cur.execute(statement)
+
+    @contextmanager
+    def _cursor(self):
+        """从连接池取出连接并在一个事务内执行"""
+        conn = self.pool.connect()
+        try:
+            cur = conn.cursor()
+            yield cur
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _sql(self, sql: str) -> str:
+        return sql.replace("?", self.placeholder)
+
+    def _session_pk(self, cur, session_id: str) -> Optional[int]:
+        cur.execute(self._sql("SELECT id FROM sessions WHERE name = ?"), (session_id,))
+        row = cur.fetchone()
+        return row[0] if row else None
+
+    def _create_session(self, cur, session_id: str) -> int:
+        now = time.time()
+        cur.execute(
+            self._sql("INSERT INTO sessions (name, created_at, updated_at, message_count) VALUES (?, ?, ?, 0)"),
+            (session_id, now, now)
+        )
+        return cur.lastrowid
+
+    def _insert_messages(self, cur, pk: int, start: int, messages: List):
+        now = time.time()
+        cur.executemany(
+            self._sql("INSERT INTO messages (session_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)"),
+            [(pk, start + i, role, content, now) for i, (role, content) in enumerate(messages)]
+        )
+
+    # --- 会话接口 ---
+    def list_sessions(self) -> List[str]:
+        with self._cursor() as cur:
+            # 与文件存储一致按名称排序(使用name的唯一索引)
+            cur.execute("SELECT name FROM sessions ORDER BY name")
+            return [row[0] for row in cur.fetchall()]
+
+    def exists(self, session_id: str) -> bool:
+        with self._cursor() as cur:
+            return self._session_pk(cur, session_id) is not None
+
+    def load(self, session_id: str) -> List:
+        with self._cursor() as cur:
+            cur.execute(self._sql(
+                "SELECT m.role, m.content FROM messages m JOIN sessions s ON m.session_id = s.id "
+                "WHERE s.name = ? ORDER BY m.seq"
+            ), (session_id,))
+            return [[role, content] for role, content in cur.fetchall()]
+
+    def append(self, session_id: str, messages: List):
+        if not messages:
+            return
+        with self._cursor() as cur:
+            pk = self._session_pk(cur, session_id) or self._create_session(cur, session_id)
+            # 先更新计数获取写锁,再读取本次追加的起始序号
+            cur.execute(
+                self._sql("UPDATE sessions SET message_count = message_count + ?, updated_at = ? WHERE id = ?"),
+                (len(messages), time.time(), pk)
+            )
+            cur.execute(self._sql("SELECT message_count FROM sessions WHERE id = ?"), (pk,))
+            start = cur.fetchone()[0] - len(messages)
+            self._insert_messages(cur, pk, start, messages)
+
+    def save(self, session_id: str, messages: List):
+        with self._cursor() as cur:
+            pk = self._session_pk(cur, session_id) or self._create_session(cur, session_id)
+            cur.execute(
+                self._sql("UPDATE sessions SET message_count = ?, updated_at = ? WHERE id = ?"),
+                (len(messages), time.time(), pk)
+            )
+            cur.execute(self._sql("DELETE FROM messages WHERE session_id = ?"), (pk,))
+            self._insert_messages(cur, pk, 0, messages)
+
+    def delete(self, session_id: str) -> bool:
+        with self._cursor() as cur:
+            pk = self._session_pk(cur, session_id)
+            if pk is None:
+                return False
+            cur.execute(self._sql("DELETE FROM messages WHERE session_id = ?"), (pk,))
+            cur.execute(self._sql("DELETE FROM sessions WHERE id = ?"), (pk,))
+            return True
+
+    def rename(self, old_id: str, new_id: str) -> bool:
+        with self._cursor() as cur:
+            # 按主键判断会话是否存在: MySQL的rowcount只统计实际改变的行,改为同名时为0
+            pk = self._session_pk(cur, old_id)
+            if pk is None:
+                return False
+            cur.execute(self._sql("UPDATE sessions SET name = ? WHERE id = ?"), (new_id, pk))
+            return True
+
+    def close(self):
+        self.pool.dispose()
+
+
+class SQLiteSessionStore(SqlSessionStore):
+    """嵌入式SQLite会话存储(WAL模式)"""
+    schema = [
+        "CREATE TABLE IF NOT EXISTS sessions ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE, "
+        "created_at REAL NOT NULL, updated_at REAL NOT NULL, message_count INTEGER NOT NULL DEFAULT 0)",
+        "CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at)",
+        "CREATE TABLE IF NOT EXISTS messages ("
+        "session_id INTEGER NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, "
+        "created_at REAL NOT NULL, PRIMARY KEY (session_id, seq))",
+        "CREATE INDEX IF NOT EXISTS idx_messages_created ON messages (session_id, created_at)",
+    ]
+
+    def __init__(self, path: str = "./data/memory.db", pool_size: int = 5, max_overflow: int = 10):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(self._connect, pool_size, max_overflow)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+
+class MySQLSessionStore(SqlSessionStore):
+    """MySQL会话存储(连接由 MySQL_Config.get_conn 创建)"""
+    placeholder = "%s"
+    schema = [
+        "CREATE TABLE IF NOT EXISTS sessions ("
+        "id BIGINT AUTO_INCREMENT PRIMARY KEY, name VARCHAR(255) NOT NULL UNIQUE, "
+        "created_at DOUBLE NOT NULL, updated_at DOUBLE NOT NULL, message_count INT NOT NULL DEFAULT 0, "
+        "INDEX idx_sessions_updated (updated_at)) DEFAULT CHARSET=utf8mb4",
+        "CREATE TABLE IF NOT EXISTS messages ("
+        "session_id BIGINT NOT NULL, seq INT NOT NULL, role VARCHAR(32) NOT NULL, content LONGTEXT NOT NULL, "
+        "created_at DOUBLE NOT NULL, PRIMARY KEY (session_id, seq), "
+        "INDEX idx_messages_created (session_id, created_at)) DEFAULT CHARSET=utf8mb4",
+    ]
+
+    def __init__(self, mysql: MySQL_Config, pool_size: int = 5, max_overflow: int = 10):
+        self.mysql = mysql
+        super().__init__(self._connect, pool_size, max_overflow)
+
+    def _connect(self):
+        conn = self.mysql.get_conn()
+        # 追加消息需要在一个事务内完成计数与插入
+        conn.autocommit(False)
+        return conn
@@ -1,6 +1,21 @@
 import os
-import subprocess
+import re
+import mmap
+import asyncio
+from contextlib import contextmanager
 from langchain_core.tools import tool
+from langgraph.config import get_stream_writer
+
+from src.config.config_model import config
+from src.extend.openai.token_counter import token_counter
+from src.extend.file_index import file_index, compile_glob
+from src.extend.shell import IS_WINDOWS, run_command, arun_command, shell_pool
+from src.extend.tool_memo import current_thread_id, memoize, invalidates
+
+# 超过该大小的文件使用mmap读取(按需分页,不整体读入内存)
+MMAP_THRESHOLD = 1 << 20
+# 单行最多返回的字符数
+MAX_LINE_CHARS = 2000
 
 
 @tool
@@ -12,12 +27,217 @@ def list_files(directory: str) -> str:
         return f"错误: {str(e)}"
 
 
+def _is_binary(file_path: str) -> bool:
+    """文件开头包含NUL字节时视为二进制文件"""
+    with open(file_path, "rb") as f:
+        return b"\0" in f.read(8192)
+
+
+@contextmanager
+def _open_bytes(file_path: str):
+    """以只读字节视图打开文件(大文件使用mmap)"""
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield data
+        else:
+            yield f.read()
+
+
+def _line_offset(data, line: int) -> int:
+    """第line行(从1开始)的起始字节偏移"""
+    pos = 0
+    for _ in range(line - 1):
+        pos = data.find(b"\n", pos)
+        if pos == -1:
+            return len(data)
+        pos += 1
+    return pos
+
+
+def _tail_offset(data, lines: int) -> int:
+    """最后lines行的起始字节偏移"""
+    pos = len(data) - 1 if data[-1:] == b"\n" else len(data)
+    for _ in range(lines):
+        pos = data.rfind(b"\n", 0, pos)
+        if pos == -1:
+            return 0
+    return pos + 1
+
+
+def _count_lines(data, end: int) -> int:
+    """[0, end)范围内的换行数(分块统计,mmap不会整体读入内存)"""
+    return sum(data[i:min(i + MMAP_THRESHOLD, end)].count(b"\n") for i in range(0, end, MMAP_THRESHOLD))
+
+
+def _render(data, begin: int, end: int, line_no: int, byte_mode: bool = False) -> str:
+    """逐行输出[begin, end)范围的内容,超出token预算时截断并提示如何继续读取"""
+    budget = config.tool_config.max_output_tokens
+    parts, used, pos = [], 0, begin
+    while pos < end:
+        newline = data.find(b"\n", pos, end)
+        stop = end if newline == -1 else newline + 1
+        line = data[pos:stop].decode("utf-8", "replace")
+        if len(line) > MAX_LINE_CHARS:
+            line = line[:MAX_LINE_CHARS] + "...(该行过长已截断)\n"
+        tokens = token_counter.count(line)
+        if parts and used + tokens > budget:
+            resume = f"从偏移 {pos} 继续读取" if byte_mode else f"从第 {line_no} 行继续读取"
+            parts.append(f"\n...(已达到输出上限 {budget} tokens,可{resume})")
+            break
+        parts.append(line)
+        used += tokens
+        line_no += 1
+        pos = stop
+    return "".join(parts)
+
+
+@tool
+def read_file(file_path: str, start_line: int = 0, end_line: int = 0, tail: int = 0,
+              offset: int = -1, length: int = 0) -> str:
+    """
+    读取指定文件内容(输出长度受token预算限制,超出时会提示如何继续读取)
+
+    Args:
+        file_path: 文件路径
+        start_line: 起始行号(从1开始,包含)
+        end_line: 结束行号(包含,0表示到文件末尾)
+        tail: 只读取最后N行
+        offset: 按字节读取的起始偏移(大于等于0时按字节读取)
+        length: 按字节读取的字节数(0表示到文件末尾)
+    """
+    try:
+        if _is_binary(file_path):
+            return f"二进制文件,不显示内容: {file_path} ({os.path.getsize(file_path)} 字节)"
+        with _open_bytes(file_path) as data:
+            size = len(data)
+            if offset >= 0:
+                begin = min(offset, size)
+                end = min(begin + length, size) if length > 0 else size
+                return _render(data, begin, end, 1, byte_mode=True)
+            if tail > 0:
+                begin = _tail_offset(data, tail)
+                return _render(data, begin, size, _count_lines(data, begin) + 1)
+            begin = _line_offset(data, start_line) if start_line > 1 else 0
+            end = _line_offset(data, end_line + 1) if end_line > 0 else size
+            return _render(data, begin, max(begin, end), max(start_line, 1))
+    except Exception as e:
+        return f"错误: {str(e)}"
+
+
+@tool
+def search_file(file_path: str, pattern: str, regex: bool = False, ignore_case: bool = False,
+                max_results: int = 50) -> str:
+    """
+    在文件中逐行搜索,返回 "行号: 内容" 形式的匹配结果(结果条数与输出长度受限)
+
+    Args:
+        file_path: 文件路径
+        pattern: 搜索内容
+        regex: pattern是否为正则表达式
+        ignore_case: 是否忽略大小写
+        max_results: 最多返回的匹配条数
+    """
+    try:
+        if _is_binary(file_path):
+            return f"二进制文件,不支持搜索: {file_path}"
+        matcher = re.compile(pattern if regex else re.escape(pattern), re.IGNORECASE if ignore_case else 0)
+        budget = config.tool_config.max_output_tokens
+        results, used = [], 0
+        with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+            for line_no, line in enumerate(f, 1):
+                if not matcher.search(line):
+                    continue
+                line = line.rstrip("\r\n")
+                if len(line) > MAX_LINE_CHARS:
+                    line = line[:MAX_LINE_CHARS] + "...(该行过长已截断)"
+                entry = f"{line_no}: {line}"
+                used += token_counter.count(entry)
+                if len(results) >= max_results or (results and used > budget):
+                    results.append(f"...(匹配结果已达上限,可缩小搜索范围或从第 {line_no} 行起用read_file查看)")
+                    break
+                results.append(entry)
+        return "\n".join(results) if results else f"未找到匹配内容: {pattern}"
+    except Exception as e:
+        return f"错误: {str(e)}"
+
+
+def _format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+
 @tool
-def read_file(file_path: str) -> str:
-    """读取指定文件内容"""
+def scan_tree(directory: str, max_depth: int = 3, max_entries: int = 300) -> str:
+    """
+    以缩进树的形式递归列出目录结构(目录以"/"结尾,跳过.git、node_modules等目录)
+
+    Args:
+        directory: 根目录
+        max_depth: 最大深度(1表示只列出根目录的子项)
+        max_entries: 最多列出的条目数
+    """
+    try:
+        budget = config.tool_config.max_output_tokens
+        lines, used = [], 0
+        for relative, is_dir, depth in file_index.walk(directory, max_depth):
+            name = relative.rsplit("/", 1)[-1]
+            line = "  " * (depth - 1) + (name + "/" if is_dir else name)
+            used += token_counter.count(line)
+            if len(lines) >= max_entries or (lines and used > budget):
+                lines.append("...(条目数已达上限,可用更深的子目录作为directory或减小max_depth继续查看)")
+                break
+            lines.append(line)
+        return "\n".join(lines) if lines else f"目录为空: {directory}"
+    except Exception as e:
+        return f"错误: {str(e)}"
+
+
+@tool
+def find_files(directory: str, pattern: str = "*", min_size: int = 0, max_size: int = 0, max_depth: int = 0,
+               max_results: int = 200) -> str:
+    """
+    在目录下递归查找文件,返回 "相对路径 (大小)" 形式的结果
+
+    Args:
+        directory: 根目录
+        pattern: 通配符,如 "*.py";包含"/"时匹配相对路径,如 "src/*/test_*.py"
+        min_size: 最小文件大小(字节)
+        max_size: 最大文件大小(字节,0表示不限制)
+        max_depth: 最大深度(0表示不限制)
+        max_results: 最多返回的结果数
+    """
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            return f.read()
+        root = os.path.abspath(directory)
+        match_path = "/" in pattern
+        matcher = compile_glob(pattern)
+        budget = config.tool_config.max_output_tokens
+        results, used, total = [], 0, 0
+        for relative, is_dir, _ in file_index.walk(root, max_depth):
+            if is_dir or not matcher.match(relative if match_path else relative.rsplit("/", 1)[-1]):
+                continue
+            if min_size or max_size or len(results) < max_results:
+                # 只对匹配的文件读取大小
+                try:
+                    size = os.path.getsize(os.path.join(root, relative))
+                except OSError:
+                    continue
+                if size < min_size or (max_size and size > max_size):
+                    continue
+            total += 1
+            if len(results) >= max_results or used > budget:
+                continue
+            entry = f"{relative} ({_format_size(size)})"
+            used += token_counter.count(entry)
+            results.append(entry)
+        if not results:
+            return f"未找到匹配的文件: {pattern}"
+        if total > len(results):
+            results.append(f"...(共找到 {total} 个文件,仅显示前 {len(results)} 个,可缩小目录或pattern范围)")
+        return "\n".join(results)
     except Exception as e:
         return f"错误: {str(e)}"
 
@@ -36,33 +256,50 @@ def write_file(file_path: str, content: str) -> str:
         return f"错误: {str(e)}"
     
 
+def _output_writer():
+    """把命令输出实时写入图的custom流(不在图中执行时返回None)"""
+    try:
+        writer = get_stream_writer()
+    except Exception:
+        return None
+    return lambda text: writer({"type": "tool_output", "name": "run_cmd", "content": text})
+
+
+def _run_cmd(command: str) -> str:
+    options = config.tool_config
+    kwargs = dict(timeout=options.cmd_timeout, limit=options.cmd_max_output, on_output=_output_writer())
+    if options.persistent_shell:
+        # 在当前会话的常驻shell中执行(cd、环境变量在命令之间保留)
+        result = shell_pool.run(current_thread_id.get(), command, **kwargs)
+        if result is not None:
+            return result
+    return run_command(command, **kwargs)
+
+
 @tool
 def run_cmd(command: str) -> str:
     """
     执行 Windows cmd 命令，并返回输出。
     """
-    try:
-        # 执行命令
-        result = subprocess.run(
-            command, 
-            shell=True, 
-            capture_output=True, 
-            text=True
-        )
-
-        # 拼接 stdout 和 stderr
-        output_parts = []
-        if result.stdout.strip():
-            output_parts.append(result.stdout.strip())
-        if result.stderr.strip():
-            output_parts.append(result.stderr.strip())
-            
-        output = "\n".join(output_parts)
-
-        # 如果内容为空，返回提示
-        if not output:
-            return f"命令已执行成功，但没有输出: {command}"
-        
-        return output
-    except Exception as e:
-        return f"命令执行异常: {str(e)}"
\ No newline at end of file
+    return _run_cmd(command)
+
+
+async def _arun_cmd(command: str) -> str:
+    """run_cmd 的异步实现(等待子进程期间不占用事件循环)"""
+    options = config.tool_config
+    if options.persistent_shell and not IS_WINDOWS and current_thread_id.get() is not None:
+        return await asyncio.to_thread(_run_cmd, command)
+    return await arun_command(command, timeout=options.cmd_timeout, limit=options.cmd_max_output,
+                              on_output=_output_writer())
+
+
+# 异步调用(ainvoke/astream)时使用协程版本
+run_cmd.coroutine = _arun_cmd
+
+
+# 幂等工具按 参数+文件状态 缓存结果,写文件/执行命令后清空当前会话的缓存
+memoize(list_files, "directory")
+memoize(read_file, "file_path")
+memoize(search_file, "file_path")
+invalidates(write_file)
+invalidates(run_cmd)
@@ -0,0 +1,148 @@
+"""
+工具结果缓存
+
+幂等工具(read_file、list_files)的结果按 会话 + 工具名 + 参数 缓存,并记录目标路径的
+mtime/size/inode,文件变化后自动失效;执行 write_file、run_cmd 后清空当前会话的缓存。
+命中时直接把缓存内容作为工具输出返回给模型。
+"""
+import os
+import json
+import threading
+import functools
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 当前对话所属的会话ID(由智能体在每轮对话开始时设置)
+current_thread_id: ContextVar[Optional[str]] = ContextVar("current_thread_id", default=None)
+
+
+@dataclass
+class ToolMemoStats:
+    """工具缓存指标"""
+    hits: int = 0  # 命中次数
+    misses: int = 0  # 未命中次数
+    stale: int = 0  # 文件已变化导致失效的次数
+    invalidations: int = 0  # 写文件/执行命令触发的清空次数
+
+
+def _fingerprint(path: str) -> Optional[Tuple]:
+    """文件/目录状态指纹(不存在时返回None)"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class ToolMemo:
+    """按会话隔离的工具结果缓存"""
+
+    def __init__(self, max_threads: int = 256, max_entries: int = 64, max_result_chars: int = 1_000_000):
+        self.max_threads = max_threads  # 最多缓存的会话数
+        self.max_entries = max_entries  # 每个会话最多缓存的结果数
+        self.max_result_chars = max_result_chars  # 超过该长度的结果不缓存
+        self.stats = ToolMemoStats()
+        self._threads: "OrderedDict[str, OrderedDict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[str, str, Dict], None]] = []
+
+    def add_listener(self, listener: Callable[[str, str, Dict], None]):
+        """注册缓存事件回调 listener(事件, 工具名, 指标)"""
+        self._listeners.append(listener)
+
+    def _notify(self, event: str, tool_name: str):
+        stats = self.get_stats()
+        for listener in self._listeners:
+            listener(event, tool_name, stats)
+
+    def _entries(self, thread_id: str) -> OrderedDict:
+        """获取会话的缓存(调用方持有锁)"""
+        entries = self._threads.get(thread_id)
+        if entries is None:
+            entries = self._threads[thread_id] = OrderedDict()
+            while len(self._threads) > self.max_threads:
+                self._threads.popitem(last=False)
+        else:
+            self._threads.move_to_end(thread_id)
+        return entries
+
+    def call(self, tool_name: str, func: Callable, path_arg: str, kwargs: Dict):
+        """执行幂等工具,参数与文件状态未变时返回缓存结果"""
+        thread_id = current_thread_id.get()
+        if thread_id is None:
+            return func(**kwargs)
+        key = (tool_name, json.dumps(kwargs, ensure_ascii=False, sort_keys=True, default=str))
+        fingerprint = _fingerprint(str(kwargs.get(path_arg, "")))
+        with self._lock:
+            cached = self._entries(thread_id).get(key)
+            if cached is not None and cached[0] == fingerprint:
+                self.stats.hits += 1
+                result = cached[1]
+            else:
+                self.stats.misses += 1
+                self.stats.stale += cached is not None
+                result = None
+        if result is not None:
+            self._notify("TOOL_CACHE_HIT", tool_name)
+            return result
+        result = func(**kwargs)
+        if isinstance(result, str) and len(result) <= self.max_result_chars:
+            with self._lock:
+                entries = self._entries(thread_id)
+                entries[key] = (fingerprint, result)
+                entries.move_to_end(key)
+                while len(entries) > self.max_entries:
+                    entries.popitem(last=False)
+        return result
+
+    def invalidate(self, tool_name: str):
+        """清空当前会话的缓存(有副作用的工具执行后调用)"""
+        thread_id = current_thread_id.get()
+        with self._lock:
+            if self._threads.pop(thread_id, None) is None:
+                return
+            self.stats.invalidations += 1
+        self._notify("TOOL_CACHE_CLEAR", tool_name)
+
+    def get_stats(self) -> Dict:
+        """获取缓存指标"""
+        with self._lock:
+            return asdict(self.stats)
+
+
+# 全局工具缓存
+tool_memo = ToolMemo()
+
+
+def memoize(tool, path_arg: str):
+    """把工具标记为幂等并缓存其结果(path_arg为参数中表示目标路径的字段)"""
+    func = tool.func
+    tool.metadata = {**(tool.metadata or {}), "idempotent": True}
+    tool.func = functools.wraps(func)(lambda **kwargs: tool_memo.call(tool.name, func, path_arg, kwargs))
+    return tool
+
+
+def invalidates(tool):
+    """工具执行后清空当前会话的工具缓存(同时包装同步与异步实现)"""
+    func, coroutine = tool.func, tool.coroutine
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            tool_memo.invalidate(tool.name)
+
+    tool.func = wrapper
+    if coroutine is not None:
+        @functools.wraps(coroutine)
+        async def async_wrapper(*args, **kwargs):
+            try:
+                return await coroutine(*args, **kwargs)
+            finally:
+                tool_memo.invalidate(tool.name)
+
+        tool.coroutine = async_wrapper
+    return tool
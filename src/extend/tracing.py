@@ -0,0 +1,342 @@
+"""
+智能体调用追踪
+
+每轮对话(invoke)、每次模型调用与工具调用各记录为一个span,按会话保存在固定大小的环形缓冲区中,
+耗时使用单调时钟计算;模型与工具span由LangChain回调记录,不依赖LangSmith,也不分析调用栈。
+配置了 trace.export_path 时,每轮对话结束后把该轮的span以OTLP/JSON格式追加写入本地文件
+(每行一个ExportTraceServiceRequest,可由OpenTelemetry Collector的otlpjsonfile接收器读取)。
+"""
+import json
+import time
+import random
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Any, Deque, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.config.config_model import config
+
+# span类型
+SPAN_INVOKE = "invoke"
+SPAN_MODEL = "model"
+SPAN_TOOL = "tool"
+SPAN_EVENT = "event"
+
+# span类型对应的OTLP SpanKind(1:INTERNAL 3:CLIENT)
+_OTLP_KIND = {SPAN_INVOKE: 1, SPAN_MODEL: 3, SPAN_TOOL: 1, SPAN_EVENT: 1}
+# 旧版递归日志中的级别与来源(网页日志面板按这两个字段显示)
+_LOG_LEVEL = {SPAN_INVOKE: "INVOKE", SPAN_MODEL: "MODEL", SPAN_TOOL: "TOOL_CALL", SPAN_EVENT: "EVENT"}
+_LOG_SOURCE = {SPAN_INVOKE: "Agent", SPAN_MODEL: "LLM", SPAN_TOOL: "Tool", SPAN_EVENT: "Tool"}
+
+
+class Span:
+    """一次调用的追踪记录"""
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "thread_id", "attributes",
+                 "start_time_ns", "end_time_ns", "_start", "duration", "error", "_trace")
+
+    def __init__(self, name: str, kind: str, thread_id: Optional[str], parent: "Span" = None,
+                 attributes: Dict[str, Any] = None):
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.kind = kind
+        self.thread_id = thread_id
+        self.attributes = attributes or {}
+        self.start_time_ns = time.time_ns()  # 开始时间(墙上时钟,仅用于显示与导出)
+        self._start = time.perf_counter()
+        self.end_time_ns = None
+        self.duration = None  # 耗时(秒,单调时钟)
+        self.error = None  # 错误信息(成功时为None)
+        # 根span收集本轮对话的全部span(用于导出)
+        self._trace: Optional[List["Span"]] = parent._trace if parent else []
+
+    @property
+    def finished(self) -> bool:
+        return self.duration is not None
+
+    def set(self, **attributes) -> "Span":
+        """设置属性"""
+        self.attributes.update(attributes)
+        return self
+
+    def fail(self, error: Any) -> "Span":
+        """标记为失败"""
+        self.error = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+        return self
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "thread_id": self.thread_id,
+            "start_time_ns": self.start_time_ns,
+            "duration": self.duration,
+            "error": self.error,
+            "attributes": dict(self.attributes),
+        }
+
+    def to_log(self) -> Dict:
+        """转换为网页日志面板使用的日志格式"""
+        level = _LOG_LEVEL[self.kind]
+        if self.error:
+            level = "TOOL_ERROR" if self.kind == SPAN_TOOL else "ERROR"
+        attributes = self.attributes
+        return {
+            "timestamp": time.strftime("%H:%M:%S", time.localtime(self.start_time_ns / 1e9))
+                         + f".{self.start_time_ns // 1_000_000 % 1000:03d}",
+            "level": level,
+            "function": self.name,
+            "params": attributes.get("input"),
+            "result": self.error or attributes.get("output"),
+            "source": _LOG_SOURCE[self.kind],
+            "tool_name": self.name if self.kind == SPAN_TOOL else None,
+            "duration_ms": round(self.duration * 1000, 2) if self.duration is not None else None,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+        }
+
+    def to_otlp(self) -> Dict:
+        """转换为OTLP/JSON格式的span"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": _OTLP_KIND[self.kind],
+            "startTimeUnixNano": str(self.start_time_ns),
+            "endTimeUnixNano": str(self.end_time_ns or self.start_time_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in
+                           {"span.type": self.kind, "session.id": self.thread_id, **self.attributes}.items()
+                           if value is not None],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+@dataclass
+class ExportStats:
+    """OTLP导出指标"""
+    exports: int = 0  # 成功导出的次数(每轮对话一次)
+    failures: int = 0  # 导出失败的次数
+    last_error: Optional[str] = None  # 最近一次导出失败原因
+
+
+class Tracer:
+    """按会话保存span的追踪器(每个会话一个固定大小的环形缓冲区,会话数超出上限时按LRU淘汰)"""
+
+    def __init__(self, enabled: bool = True, buffer_size: int = 500, max_sessions: int = 100,
+                 max_attr_chars: int = 500, export_path: str = "", service_name: str = "ai-agent"):
+        self.enabled = enabled
+        self.buffer_size = buffer_size  # 每个会话保留的span数
+        self.max_sessions = max_sessions  # 最多保留的会话数
+        self.max_attr_chars = max_attr_chars  # 输入/输出属性的最大长度
+        self.export_path = export_path  # OTLP/JSON导出文件(为空时不导出)
+        self.service_name = service_name
+        self._sessions: "OrderedDict[Optional[str], Deque[Span]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self.export_stats = ExportStats()
+
+    def truncate(self, value: Any) -> Optional[str]:
+        """截断输入/输出属性"""
+        if value is None:
+            return None
+        text = value if isinstance(value, str) else str(value)
+        if len(text) > self.max_attr_chars:
+            return f"{text[:self.max_attr_chars]}...(共{len(text)}字符)"
+        return text
+
+    def start_span(self, name: str, kind: str, thread_id: Optional[str] = None, parent: Span = None,
+                   **attributes) -> Span:
+        """开始一个span(子span继承父span的trace与会话)"""
+        if parent is not None:
+            thread_id = parent.thread_id
+        return Span(name, kind, thread_id, parent, attributes)
+
+    def end_span(self, span: Span, error: Any = None):
+        """结束span并写入所属会话的缓冲区(根span结束时导出本轮对话的全部span)"""
+        if span.finished:
+            return
+        span.duration = time.perf_counter() - span._start
+        span.end_time_ns = span.start_time_ns + int(span.duration * 1e9)
+        if error is not None:
+            span.fail(error)
+        if not self.enabled:
+            return
+        with self._lock:
+            buffer = self._sessions.get(span.thread_id)
+            if buffer is None:
+                buffer = self._sessions[span.thread_id] = deque(maxlen=self.buffer_size)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(span.thread_id)
+            buffer.append(span)
+        if self.export_path:
+            span._trace.append(span)
+            if span.parent_id is None:
+                self._submit_export(span._trace)
+
+    @contextmanager
+    def span(self, name: str, kind: str, thread_id: Optional[str] = None, parent: Span = None,
+             **attributes) -> Iterator[Span]:
+        """以上下文管理器记录span(抛出异常时记录为失败)"""
+        span = self.start_span(name, kind, thread_id, parent, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, e)
+            raise
+        self.end_span(span)
+
+    def record_event(self, name: str, thread_id: Optional[str] = None, **attributes) -> Span:
+        """记录一个瞬时事件(如工具缓存命中)"""
+        span = self.start_span(name, SPAN_EVENT, thread_id, **attributes)
+        self.end_span(span)
+        return span
+
+    def callbacks(self, parent: Span, **attributes) -> List[BaseCallbackHandler]:
+        """返回记录模型/工具调用的LangChain回调(作为parent的子span,attributes附加到每个子span)"""
+        return [TraceCallbackHandler(self, parent, attributes)] if self.enabled else []
+
+    def get_spans(self, thread_id: Optional[str] = None, limit: int = None) -> List[Span]:
+        """获取会话的span(按结束顺序,不传thread_id时返回全部会话)"""
+        with self._lock:
+            if thread_id is None:
+                spans = sorted((s for buffer in self._sessions.values() for s in buffer),
+                               key=lambda s: s.end_time_ns)
+            else:
+                spans = list(self._sessions.get(thread_id, ()))
+        return spans[-limit:] if limit else spans
+
+    def get_logs(self, thread_id: Optional[str] = None, limit: int = None) -> List[Dict]:
+        """获取会话的span(网页日志面板格式)"""
+        return [span.to_log() for span in self.get_spans(thread_id, limit)]
+
+    def clear(self, thread_id: Optional[str] = None):
+        """清空会话的span(不传thread_id时清空全部)"""
+        with self._lock:
+            if thread_id is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(thread_id, None)
+
+    def _submit_export(self, spans: List[Span]):
+        """导出本轮对话的span(在事件循环中结束时放到线程池中写文件,不阻塞事件循环)"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._export(spans)
+            return
+        loop.run_in_executor(None, self._export, spans)
+
+    def _export(self, spans: List[Span]):
+        """以OTLP/JSON格式追加写入本轮对话的span"""
+        request = {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otlp() for span in spans]}],
+        }]}
+        line = json.dumps(request, ensure_ascii=False) + "\n"
+        with self._export_lock:
+            try:
+                with open(self.export_path, "a", encoding="utf-8") as f:
+                    f.write(line)
+                self.export_stats.exports += 1
+            except OSError as e:
+                self.export_stats.failures += 1
+                self.export_stats.last_error = str(e)
+
+    def get_export_stats(self) -> Dict:
+        """获取导出指标(导出失败不影响对话,原因记录在last_error中)"""
+        with self._export_lock:
+            return asdict(self.export_stats)
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """把模型调用与工具调用记录为span"""
+    # 异步执行时也在当前线程内直接调用(只做字典操作,无需放入线程池)
+    run_inline = True
+
+    def __init__(self, tracer: Tracer, parent: Span, attributes: Dict = None):
+        self.tracer = tracer
+        self.parent = parent
+        self.attributes = attributes or {}
+        self._spans: Dict[UUID, Span] = {}
+
+    def _start(self, run_id: UUID, name: str, kind: str, **attributes):
+        self._spans[run_id] = self.tracer.start_span(name, kind, parent=self.parent,
+                                                     **self.attributes, **attributes)
+
+    def _end(self, run_id: UUID, error: Any = None, **attributes):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            span.set(**attributes)
+            self.tracer.end_span(span, error)
+
+    def on_chat_model_start(self, serialized: Dict, messages: List[List], *, run_id: UUID, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        name = params.get("model") or params.get("model_name") or (serialized or {}).get("name") or "chat_model"
+        self._start(run_id, name, SPAN_MODEL, input_messages=sum(len(batch) for batch in messages))
+
+    def on_llm_start(self, serialized: Dict, prompts: List[str], *, run_id: UUID, **kwargs):
+        self._start(run_id, (serialized or {}).get("name") or "llm", SPAN_MODEL,
+                    input=self.tracer.truncate(prompts[-1] if prompts else ""))
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        attributes = {}
+        generations = response.generations[0] if response.generations else []
+        if generations:
+            message = getattr(generations[0], "message", None)
+            attributes["output"] = self.tracer.truncate(generations[0].text)
+            usage = getattr(message, "usage_metadata", None)
+            if usage:
+                attributes["input_tokens"] = usage.get("input_tokens")
+                attributes["output_tokens"] = usage.get("output_tokens")
+            if getattr(message, "tool_calls", None):
+                attributes["tool_calls"] = len(message.tool_calls)
+        self._end(run_id, **attributes)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized: Dict, input_str: str, *, run_id: UUID, **kwargs):
+        self._start(run_id, (serialized or {}).get("name") or "tool", SPAN_TOOL,
+                    input=self.tracer.truncate(input_str))
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs):
+        content = getattr(output, "content", output)
+        error = content if isinstance(content, str) and content.startswith("Error:") else None
+        self._end(run_id, error, output=self.tracer.truncate(content))
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        self._end(run_id, error)
+
+
+def _create_tracer() -> Tracer:
+    options = config.trace
+    return Tracer(options.enabled, options.buffer_size, options.max_sessions,
+                  options.max_attr_chars, options.export_path, options.service_name)
+
+
+# 全局追踪器
+tracer = _create_tracer()
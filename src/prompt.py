@@ -2,5 +2,14 @@
 #摘要prompt
 summary_prompt = "帮我总结一下历史会话,尽量简短,不超过2048字节。"
 
+#上一段摘要的前缀(增量摘要时与新增消息一起发送)
+previous_summary_prefix = "以下是更早对话的摘要,请将其与后续对话合并为一份新的摘要:"
+
+#摘要块合并prompt
+merge_summary_prompt = "把以上多段对话摘要合并为一份摘要,保留关键事实与结论,尽量简短,不超过2048字节。"
+
 #系统prompt
-system_prompt = "你是一个Agent智能体,能够调用种工具函数,请在回答前检查是否可以调用MCP函数。"
\ No newline at end of file
+system_prompt = "你是一个Agent智能体,能够调用种工具函数,请在回答前检查是否可以调用MCP函数。"
+
+#模型路由prompt(由分类模型选择处理本轮问题的模型)
+router_prompt = "根据用户问题的难度选择最合适的模型,只回答模型名称,不要回答问题本身。可选模型:\n{routes}"
@@ -0,0 +1,309 @@
+"""
+离线基准测试(使用脚本化的假模型,不访问网络)
+
+场景:
+    turn_latency   端到端单轮延迟与每秒执行的步骤数(模型调用+工具调用),扣除模型本身耗时后的框架开销
+    memory_growth  单个会话连续对话(默认1000轮)的内存增长
+    summarization  触发摘要时相对不摘要的单轮耗时增量、阻塞等待时间
+    persistence    每轮增量保存与整体保存的耗时(file/sqlite后端)
+
+结果可保存为JSON基线,之后与基线比较,超出容差的指标视为性能回退。
+
+运行:
+    python tests/benchmark.py                         运行全部场景
+    python tests/benchmark.py --save baseline.json    保存为基线
+    python tests/benchmark.py --compare baseline.json 与基线比较(有回退时退出码为1)
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from dataclasses import dataclass, asdict, replace
+from datetime import datetime
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+
+from src.config.config_model import config
+from src.entity.agent.langgraph_agent import Langgraph_Agent
+from src.extend.openai.summarizing_memory import HistoryMemory
+from src.extend.store.file_store import FileSessionStore
+from src.extend.store.sql_store import SQLiteSessionStore
+from tests.fake_model import FakeChatModel, FakeLLM_Model
+
+
+@tool
+def lookup(key: str) -> str:
+    """查询固定内容(基准测试用工具,结果与耗时确定)"""
+    return f"{key}: " + "结果" * 50
+
+
+@dataclass
+class Scenario:
+    """基准场景参数"""
+    turns: int = 50  # 对话轮数
+    latency: float = 0.02  # 每次模型调用输出前的延迟(秒)
+    token_rate: float = 0.0  # 模型输出速度(字符/秒,0表示不限速)
+    tool_calls: int = 1  # 每轮给出回复前的工具调用步骤数
+    parallel_tools: int = 1  # 每个步骤同时调用的工具数
+    answer_chars: int = 200  # 最终回复长度
+    stream_tokens: bool = False  # 是否逐token回调
+    seed: int = 0  # 用户输入的随机种子
+
+
+def scripted_responses(scenario: Scenario) -> tuple:
+    """每轮的模型回复: tool_calls个工具调用步骤,最后是最终回复(按轮循环)"""
+    steps = tuple(
+        AIMessage(content="", tool_calls=[
+            {"name": "lookup", "args": {"key": f"k{step}-{i}"}, "id": f"call-{step}-{i}"}
+            for i in range(scenario.parallel_tools)
+        ])
+        for step in range(scenario.tool_calls)
+    )
+    return steps + ("答" * scenario.answer_chars,)
+
+
+def build_agent(scenario: Scenario, store_dir: str) -> Langgraph_Agent:
+    """创建使用脚本化假模型与临时会话存储的智能体"""
+    chunk_size = FakeChatModel.model_fields["chunk_size"].default
+    model = FakeLLM_Model(
+        responses=scripted_responses(scenario),
+        latency=scenario.latency,
+        chunk_latency=chunk_size / scenario.token_rate if scenario.token_rate else 0.0,
+    )
+    agent = Langgraph_Agent(model, tools=[lookup])
+    agent.memory = HistoryMemory(store=FileSessionStore(store_dir))
+    return agent
+
+
+def expected_model_seconds(scenario: Scenario) -> float:
+    """一轮对话中假模型自身的耗时(延迟与按输出速度计算的生成时间)"""
+    chunk_size = FakeChatModel.model_fields["chunk_size"].default
+    chunks = -(-scenario.answer_chars // chunk_size) + scenario.tool_calls
+    generation = chunks * chunk_size / scenario.token_rate if scenario.token_rate else 0.0
+    return (scenario.tool_calls + 1) * scenario.latency + generation
+
+
+def percentile(values: List[float], q: float) -> float:
+    """分位数(最近秩法)"""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, int(round(q * len(ordered))) - 1))]
+
+
+def run_turns(agent: Langgraph_Agent, scenario: Scenario, thread_id: str) -> List[float]:
+    """连续执行多轮对话,返回每轮耗时(秒)"""
+    rng = random.Random(scenario.seed)
+    stream_func = (lambda role, content: None) if scenario.stream_tokens else None
+    latencies = []
+    for i in range(scenario.turns):
+        question = f"问题{i}: " + "内容" * rng.randint(5, 50)
+        start = time.perf_counter()
+        result = agent.invoke(question, thread_id=thread_id, stream_func=stream_func,
+                              stream_tokens=scenario.stream_tokens)
+        latencies.append(time.perf_counter() - start)
+        if not result.isOk:
+            raise RuntimeError(f"第{i}轮对话失败: {result.error_data}")
+    return latencies
+
+
+def bench_turn_latency(scenario: Scenario) -> Dict:
+    """端到端单轮延迟与每秒步骤数"""
+    with tempfile.TemporaryDirectory() as directory:
+        agent = build_agent(scenario, directory)
+        start = time.perf_counter()
+        latencies = run_turns(agent, scenario, "latency")
+        elapsed = time.perf_counter() - start
+        agent.memory.store.close()
+    steps = scenario.turns * (scenario.tool_calls + 1 + scenario.tool_calls * scenario.parallel_tools)
+    p50 = percentile(latencies, 0.5)
+    return {
+        "turn_p50_ms": p50 * 1000,
+        "turn_p90_ms": percentile(latencies, 0.9) * 1000,
+        "turn_p99_ms": percentile(latencies, 0.99) * 1000,
+        "overhead_p50_ms": (p50 - expected_model_seconds(scenario)) * 1000,
+        "steps_per_second": steps / elapsed,
+    }
+
+
+def bench_memory_growth(scenario: Scenario) -> Dict:
+    """单个会话连续对话的内存增长(后半程的增长速度反映是否有泄漏)"""
+    scenario = replace(scenario, latency=0.0, token_rate=0.0)
+    checkpoints = 10
+    step = max(scenario.turns // checkpoints, 1)
+    with tempfile.TemporaryDirectory() as directory:
+        agent = build_agent(replace(scenario, turns=step), directory)
+        tracemalloc.start()
+        samples = [tracemalloc.get_traced_memory()[0]]
+        for i in range(checkpoints):
+            run_turns(agent, replace(scenario, turns=step, seed=scenario.seed + i), "memory")
+            samples.append(tracemalloc.get_traced_memory()[0])
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        agent.memory.store.close()
+    half = checkpoints // 2
+    return {
+        "turns": step * checkpoints,
+        "growth_kb": (samples[-1] - samples[0]) / 1024,
+        "late_growth_bytes_per_turn": (samples[-1] - samples[half]) / (step * (checkpoints - half)),
+        "peak_kb": peak / 1024,
+    }
+
+
+def bench_summarization(scenario: Scenario, summary_latency: float = 0.05, token_limit: int = 600) -> Dict:
+    """触发摘要(摘要模型延迟summary_latency)相对不摘要时的单轮耗时增量"""
+    original = config.summary_model, config.max_token_limit
+    results = {}
+    try:
+        config.summary_model = FakeLLM_Model(latency=summary_latency, responses=("摘要" * 40,))
+        for name, limit in (("off", 10 ** 9), ("on", token_limit)):
+            config.max_token_limit = limit
+            with tempfile.TemporaryDirectory() as directory:
+                agent = build_agent(scenario, directory)
+                latencies = run_turns(agent, scenario, "summary")
+                results[name] = (latencies, agent.memory.get_summary_stats("summary"))
+                agent.memory.store.close()
+    finally:
+        config.summary_model, config.max_token_limit = original
+    (off, _), (on, stats) = results["off"], results["on"]
+    return {
+        "turn_mean_off_ms": sum(off) / len(off) * 1000,
+        "turn_mean_on_ms": sum(on) / len(on) * 1000,
+        "overhead_per_turn_ms": (sum(on) / len(on) - sum(off) / len(off)) * 1000,
+        "blocking_wait_ms": stats["blocking_wait_seconds"] * 1000,
+        "summaries": stats["completed"],
+    }
+
+
+def bench_persistence(scenario: Scenario) -> Dict:
+    """每轮对话后增量保存,以及最终整体保存的耗时"""
+    results = {}
+    for backend in ("file", "sqlite"):
+        with tempfile.TemporaryDirectory() as directory:
+            store = FileSessionStore(directory) if backend == "file" else \
+                SQLiteSessionStore(os.path.join(directory, "memory.db"))
+            memory = HistoryMemory(store=store)
+            saves = []
+            for i in range(scenario.turns):
+                memory.add_message("persist", "user", f"问题{i}")
+                memory.add_message("persist", "assistant", "答" * scenario.answer_chars)
+                start = time.perf_counter()
+                memory.save("persist")
+                saves.append(time.perf_counter() - start)
+            history = memory.get_messages("persist")
+            start = time.perf_counter()
+            store.save("persist", history)
+            full = time.perf_counter() - start
+            store.close()
+        results[f"{backend}_save_p50_ms"] = percentile(saves, 0.5) * 1000
+        results[f"{backend}_save_p99_ms"] = percentile(saves, 0.99) * 1000
+        results[f"{backend}_full_save_ms"] = full * 1000
+    return results
+
+
+def run_all(turns: int = 50, memory_turns: int = 1000, latency: float = 0.02, token_rate: float = 2000.0) -> Dict:
+    """运行全部场景"""
+    # 摘要同样使用假模型,避免访问网络;关闭响应缓存以测量完整路径
+    config.summary_model = FakeLLM_Model()
+    config.llm_cache.mode = "off"
+    scenario = Scenario(turns=turns, latency=latency, token_rate=token_rate)
+    return {
+        "scenario": asdict(scenario),
+        "turn_latency": bench_turn_latency(scenario),
+        "turn_latency_streaming": bench_turn_latency(replace(scenario, stream_tokens=True)),
+        "turn_latency_parallel_tools": bench_turn_latency(replace(scenario, tool_calls=2, parallel_tools=4)),
+        "memory_growth": bench_memory_growth(replace(scenario, turns=memory_turns)),
+        "summarization": bench_summarization(replace(scenario, latency=0.0, token_rate=0.0)),
+        "persistence": bench_persistence(scenario),
+    }
+
+
+def save_baseline(results: Dict, path: str):
+    """保存基线(附带运行环境信息)"""
+    data = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def load_baseline(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+def compare(baseline: Dict, results: Dict, tolerance: float = 0.2, min_delta: float = 1.0) -> List[str]:
+    """
+    与基线比较,返回回退的指标
+
+    以 _per_second 结尾的指标越大越好,以 _ms/_kb/_bytes_per_turn 结尾的指标越小越好,其余指标只做记录;
+    变化超过基线的tolerance比例且绝对变化超过min_delta时视为回退(避免极小数值的抖动)。
+    """
+    regressions = []
+    for section, metrics in results.items():
+        base = baseline.get(section)
+        if not isinstance(metrics, dict) or not isinstance(base, dict) or section == "scenario":
+            continue
+        for name, value in metrics.items():
+            old = base.get(name)
+            if not isinstance(old, (int, float)):
+                continue
+            if name.endswith("_per_second"):
+                delta = old - value
+            elif name.endswith(("_ms", "_kb", "_bytes_per_turn")):
+                delta = value - old
+            else:
+                continue
+            if delta > min_delta and delta > abs(old) * tolerance:
+                regressions.append(f"{section}.{name}: {old:.2f} -> {value:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线基准测试(假模型,不访问网络)")
+    parser.add_argument("--turns", type=int, default=50, help="延迟场景的对话轮数")
+    parser.add_argument("--memory-turns", type=int, default=1000, help="内存增长场景的对话轮数")
+    parser.add_argument("--latency", type=float, default=0.02, help="每次模型调用的延迟(秒)")
+    parser.add_argument("--token-rate", type=float, default=2000.0, help="模型输出速度(字符/秒,0表示不限速)")
+    parser.add_argument("--save", help="把结果保存为基线JSON")
+    parser.add_argument("--compare", help="与基线JSON比较")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的回退比例")
+    args = parser.parse_args()
+
+    results = run_all(args.turns, args.memory_turns, args.latency, args.token_rate)
+    for section, metrics in results.items():
+        if section == "scenario":
+            continue
+        print(f"[{section}]")
+        for name, value in metrics.items():
+            print(f"  {name}: {value:.2f}" if isinstance(value, float) else f"  {name}: {value}")
+    if args.save:
+        save_baseline(results, args.save)
+        print(f"基线已保存: {args.save}")
+    if args.compare:
+        regressions = compare(load_baseline(args.compare), results, args.tolerance)
+        if regressions:
+            print("性能回退:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("与基线相比没有性能回退")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+"""
+测试公共夹具
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from src.config.config_model import config
+
+
+@pytest.fixture(autouse=True)
+def no_llm_cache(monkeypatch):
+    """关闭模型响应缓存(假模型的回复由输入决定,命中缓存会让测试互相影响)"""
+    monkeypatch.setattr(config.llm_cache, "mode", "off")
@@ -0,0 +1,128 @@
+"""
+本地假模型(测试/基准专用,不访问网络)
+"""
+import json
+import time
+import asyncio
+import threading
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from src.config.config_entity import LLM_Model
+
+
+class FakeChatModel(BaseChatModel):
+    """按顺序循环返回预设回复的聊天模型"""
+    responses: List[Any] = ["ok"]  # 预设回复(str 或 AIMessage)
+    latency: float = 0.0  # 每次调用的模拟延迟(秒)
+    chunk_size: int = 4  # 流式输出时每个分块的字符数
+    chunk_latency: float = 0.0  # 流式输出时每个分块的模拟延迟(秒,非流式调用按分块数累计)
+    echo: bool = False  # 为True时回复 "echo:" + 最后一条用户消息
+
+    _index: int = PrivateAttr(default=0)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _received: List[List[BaseMessage]] = PrivateAttr(default_factory=list)  # 每次调用收到的消息
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def bind_tools(self, tools, **kwargs):
+        """假模型不需要绑定工具"""
+        return self
+
+    @property
+    def received(self) -> List[List[BaseMessage]]:
+        """每次调用收到的消息(检查发送给模型的内容)"""
+        return self._received
+
+    def _next_message(self, messages: List[BaseMessage]) -> AIMessage:
+        self._received.append(list(messages))
+        if self.echo:
+            last_user = next((m.content for m in reversed(messages) if m.type == "human"), "")
+            return AIMessage(content=f"echo:{last_user}")
+        with self._lock:
+            response = self.responses[self._index % len(self.responses)]
+            self._index += 1
+        if isinstance(response, BaseMessage):
+            return response.model_copy()
+        return AIMessage(content=response)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        message = self._next_message(messages)
+        if self.chunk_latency:
+            time.sleep(self.chunk_latency * len(self._chunks(message)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, message: AIMessage) -> List[ChatGenerationChunk]:
+        """把回复拆分为流式分块(工具调用放在最后一个分块中一次性给出)"""
+        content = message.content
+        chunks = [
+            ChatGenerationChunk(message=AIMessageChunk(content=content[i:i + self.chunk_size]))
+            for i in range(0, len(content), self.chunk_size)
+        ]
+        if message.tool_calls or not content:
+            chunks.append(ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[
+                    {"name": tc["name"], "args": json.dumps(tc["args"]), "id": tc["id"], "index": i}
+                    for i, tc in enumerate(message.tool_calls)
+                ]
+            )))
+        return chunks
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        for chunk in self._chunks(self._next_message(messages)):
+            if self.chunk_latency:
+                time.sleep(self.chunk_latency)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        message = self._next_message(messages)
+        if self.chunk_latency:
+            await asyncio.sleep(self.chunk_latency * len(self._chunks(message)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for chunk in self._chunks(self._next_message(messages)):
+            if self.chunk_latency:
+                await asyncio.sleep(self.chunk_latency)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+@dataclass(order=True)
+class FakeLLM_Model(LLM_Model):
+    """返回FakeChatModel的模型配置"""
+    model_name: str = "fake"
+    model_provider: str = "fake"
+    latency: float = 0.0
+    echo: bool = False
+    responses: tuple = ()  # 预设回复(为空时使用FakeChatModel的默认回复)
+    chunk_latency: float = 0.0
+
+    def init_model(self, cache=None):
+        kwargs = {"cache": cache} if cache is not None and self.temperature == 0 else {}
+        if self.responses:
+            kwargs["responses"] = list(self.responses)
+        return FakeChatModel(latency=self.latency, echo=self.echo, chunk_latency=self.chunk_latency, **kwargs)
@@ -0,0 +1,75 @@
+"""
+离线基准测试框架的测试: 脚本化假模型的工具调用模式、各场景指标、基线保存与回退比较、ASGI并发吞吐量
+
+运行完整基准: python tests/benchmark.py
+ASGI压测: python scripts/load_bench.py [并发数] [每个并发的请求数] [模型延迟秒数]
+"""
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from src.config.config_model import config
+from tests.benchmark import (Scenario, bench_memory_growth, bench_persistence, bench_summarization,
+                             bench_turn_latency, build_agent, compare, load_baseline, run_turns, save_baseline)
+from tests.fake_model import FakeLLM_Model
+
+
+@pytest.fixture(autouse=True)
+def fake_summary_model(monkeypatch):
+    """摘要使用假模型(测试结束后恢复全局配置)"""
+    monkeypatch.setattr(config, "summary_model", FakeLLM_Model())
+
+
+def test_scripted_tool_pattern(tmp_path):
+    scenario = Scenario(turns=2, latency=0.0, tool_calls=2, parallel_tools=3, answer_chars=10)
+    agent = build_agent(scenario, str(tmp_path))
+    result = agent.invoke("问题", thread_id="pattern")
+    assert result.last_message == "答" * 10
+    # 第一条工具调用请求之后: 每个步骤3个并行工具结果,第二个步骤的工具调用请求,最终回复
+    assert [m.type for m in result.all_result_messages] == ["tool"] * 3 + ["ai"] + ["tool"] * 3 + ["ai"]
+    # 每轮重复同样的模式
+    assert len(run_turns(agent, scenario, "pattern")) == 2
+    agent.memory.store.close()
+
+
+def test_scenarios_report_metrics():
+    scenario = Scenario(turns=3, latency=0.0, answer_chars=20)
+    latency = bench_turn_latency(scenario)
+    assert latency["steps_per_second"] > 0 and latency["turn_p99_ms"] >= latency["turn_p50_ms"]
+    assert bench_memory_growth(Scenario(turns=20))["turns"] == 20
+    summary = bench_summarization(Scenario(turns=8, latency=0.0, answer_chars=200), summary_latency=0.0,
+                                  token_limit=300)
+    assert summary["summaries"] > 0
+    assert config.max_token_limit != 300
+    persistence = bench_persistence(Scenario(turns=5))
+    assert set(persistence) >= {"file_save_p50_ms", "sqlite_full_save_ms"}
+
+
+def test_baseline_compare(tmp_path):
+    path = str(tmp_path / "bench" / "baseline.json")
+    baseline = {"turn_latency": {"turn_p50_ms": 100.0, "steps_per_second": 50.0, "summaries": 3}}
+    save_baseline(baseline, path)
+    assert load_baseline(path) == baseline
+    assert compare(baseline, {"turn_latency": {"turn_p50_ms": 110.0, "steps_per_second": 45.0,
+                                                "summaries": 9}}) == []
+    regressions = compare(baseline, {"turn_latency": {"turn_p50_ms": 150.0, "steps_per_second": 30.0}})
+    assert regressions == ["turn_latency.turn_p50_ms: 100.00 -> 150.00",
+                           "turn_latency.steps_per_second: 50.00 -> 30.00"]
+    # 极小数值的抖动不算回退
+    assert compare({"p": {"save_ms": 0.1}}, {"p": {"save_ms": 0.5}}) == []
+
+
+# web.routes 导入 langchain_core.pydantic_v1 会触发弃用警告,延迟到测试内导入以便只在此处忽略
+@pytest.mark.filterwarnings("ignore::langchain_core._api.LangChainDeprecationWarning")
+def test_asgi_load(monkeypatch):
+    from scripts.load_bench import load_test, use_fake_models
+
+    use_fake_models(0.05, monkeypatch.setattr)
+    result = asyncio.run(load_test(concurrency=20, requests_per_user=2))
+    assert result["requests"] == 40
+    # 并发请求不应串行等待模型: 串行执行时吞吐量最多 1 / 0.05 = 20 req/s
+    assert result["rps"] > 20
@@ -0,0 +1,211 @@
+"""
+检查点记忆测试: 每轮只发送新消息、工具结果跨轮保留、发送前裁剪历史、升级重试回退、前缀指标、
+初始化不生成摘要、失败时不删除其他实例的检查点、SQLite检查点
+
+运行: python tests/test_checkpoint_memory.py [轮数]
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import InMemorySaver
+
+from src.config.config_model import config
+from src.config.config_entity import Checkpoint_Config, Route_Config
+from src.entity.agent.checkpoint import count_message_tokens, create_checkpointer
+from src.entity.agent.langgraph_agent import Langgraph_Agent
+from src.entity.agent.model_router import DEFAULT_ROUTE
+from tests.fake_model import FakeLLM_Model
+
+LOOKUP_CALL = AIMessage(content="", tool_calls=[{"name": "lookup", "args": {"key": "a"}, "id": "call-1"}])
+
+
+@tool
+def lookup(key: str) -> str:
+    """查询键对应的值"""
+    return f"value-of-{key}"
+
+
+def new_agent(*responses, **kwargs) -> Langgraph_Agent:
+    return Langgraph_Agent(FakeLLM_Model(responses=responses), tools=[lookup], system_prompt="你是助手",
+                           routes=[], checkpointer=kwargs.pop("checkpointer", None) or InMemorySaver(), **kwargs)
+
+
+def state_messages(agent: Langgraph_Agent, thread_id: str):
+    return agent.graph.get_state({"configurable": {"thread_id": thread_id}}).values["messages"]
+
+
+def test_tool_results_persist_across_turns():
+    agent = new_agent(LOOKUP_CALL, "答1", "答2")
+    first = agent.invoke("查一下a", thread_id="cp-tools")
+    assert first.last_message == "答1" and first.question_message == "查一下a"
+    assert [m.type for m in first.all_result_messages] == ["ai", "tool", "ai"]
+    second = agent.invoke("再说一遍", thread_id="cp-tools")
+    assert second.last_message == "答2" and second.question_message == "再说一遍"
+    assert [m.type for m in second.all_result_messages] == ["ai"]
+    # 第二轮模型看到上一轮的工具结果,系统提示在裁剪时加在开头且不写入检查点
+    received = agent.model.received[-1]
+    assert [m.type for m in received] == ["system", "human", "ai", "tool", "ai", "human"]
+    assert received[3].content == "value-of-a"
+    assert [m.type for m in state_messages(agent, "cp-tools")] == ["human", "ai", "tool", "ai", "human", "ai"]
+    # 记忆只保留对话原文(用于展示与会话存储)
+    assert agent.memory.get_messages("cp-tools") == [("user", "查一下a"), ("assistant", "答1"),
+                                                     ("user", "再说一遍"), ("assistant", "答2")]
+
+
+def test_history_is_trimmed_before_model(monkeypatch):
+    monkeypatch.setattr(config.checkpoint, "max_history_tokens", 60)
+    agent = new_agent("很长的回答" * 10)
+    for i in range(6):
+        agent.invoke(f"问题{i}", thread_id="cp-trim")
+    received = agent.model.received[-1]
+    assert received[0].type == "system" and received[1].type == "human"
+    assert received[-1].content == "问题5"
+    assert count_message_tokens(received[1:]) <= 60
+    # 超出裁剪范围的旧消息在下一轮开始时从检查点中移除,记忆中保留完整原文
+    state = state_messages(agent, "cp-trim")
+    assert len(state) < 12 and state[-1].content == "很长的回答" * 10
+    contents = [m.content for m in state[:-1]]
+    assert contents[-(len(received) - 1):] == [m.content for m in received[1:]]
+    assert len(agent.memory.get_messages("cp-trim")) == 12
+    # 本轮输入超过上限时仍发送本轮消息
+    agent.invoke("超长问题" * 50, thread_id="cp-trim")
+    assert [m.type for m in agent.model.received[-1]] == ["system", "human"]
+
+
+def test_seeds_from_memory_history():
+    agent = new_agent("好的")
+    agent.memory.set_history("cp-seed", [("user", "之前的问题"), ("assistant", "之前的回答")], transient=True)
+    agent.invoke("继续", thread_id="cp-seed")
+    assert [m.content for m in agent.model.received[-1]] == ["你是助手", "之前的问题", "之前的回答", "继续"]
+    # 之后只发送新消息,不再重复初始化
+    agent.invoke("然后呢", thread_id="cp-seed")
+    assert len(state_messages(agent, "cp-seed")) == 6
+    agent.delete_thread("cp-seed")
+    assert agent.checkpointer.get_tuple({"configurable": {"thread_id": "cp-seed"}}) is None
+    assert not agent.memory.has_thread("cp-seed")
+
+
+def test_escalation_rolls_back_failed_attempt():
+    bad_call = AIMessage(content="", tool_calls=[{"name": "no_such_tool", "args": {}, "id": "call-bad"}])
+    small = Route_Config(name="small", model=FakeLLM_Model(responses=(bad_call,)), max_input_tokens=100)
+    agent = Langgraph_Agent(FakeLLM_Model(echo=True), tools=[lookup], routes=[small], checkpointer=InMemorySaver())
+    for thread_id in ("cp-escalate",) * 2:
+        result = agent.invoke("你好", thread_id=thread_id)
+        assert result.route == DEFAULT_ROUTE and result.last_message == "echo:你好"
+    # 小模型失败的尝试不会留在会话状态中
+    assert [m.type for m in state_messages(agent, "cp-escalate")] == ["human", "ai"] * 2
+
+
+def test_error_keeps_last_good_checkpoint():
+    agent = new_agent("答1")
+    agent.invoke("第一轮", thread_id="cp-error")
+    # 先成功执行工具调用,再次调用模型时出错(回复列表为空)
+    agent.model.responses = [LOOKUP_CALL]
+    original = agent.model._next_message
+
+    def fail_after_tool(messages):
+        agent.model.responses = []
+        return original(messages)
+
+    object.__setattr__(agent.model, "_next_message", fail_after_tool)
+    assert not agent.invoke("第二轮", thread_id="cp-error").isOk
+    object.__setattr__(agent.model, "_next_message", original)
+    agent.model.responses = ["答3"]
+    agent.invoke("第三轮", thread_id="cp-error")
+    assert [m.content for m in agent.model.received[-1]][1:] == ["第一轮", "答1", "第三轮"]
+    # 失败后最新检查点即为成功状态: 不依赖实例内缓存的检查点id,新实例同样从成功状态继续
+    agent.model.responses = []
+    assert not agent.invoke("第四轮", thread_id="cp-error").isOk
+    restarted = new_agent("答5", checkpointer=agent.checkpointer)
+    restarted.invoke("第五轮", thread_id="cp-error")
+    assert [m.content for m in restarted.model.received[-1]][1:] == ["第一轮", "答1", "第三轮", "答3", "第五轮"]
+
+
+def test_prefix_stats_reported():
+    agent = new_agent(LOOKUP_CALL, "答1", "答2", "答3")
+    for i in range(3):
+        agent.invoke(f"问题{i}", thread_id="cp-prefix")
+    # 检查点模式下每轮只追加新消息,发送给模型的前缀保持不变
+    stats = agent.get_prefix_stats("cp-prefix")
+    assert stats["turns"] == 2 and stats["stable"] == 2 and stats["reuse_rate"] > 0
+
+
+def test_seed_does_not_summarize(monkeypatch):
+    monkeypatch.setattr(config, "max_token_limit", 100)
+    monkeypatch.setattr(config.checkpoint, "max_history_tokens", 60)
+    agent = new_agent("好的")
+    history = [(role, f"第{i}轮" + "内容" * 20) for i in range(10) for role in ("user", "assistant")]
+    agent.memory.set_history("cp-no-summary", history, transient=True)
+    agent.invoke("继续", thread_id="cp-no-summary")
+    # 历史超过摘要阈值也不生成摘要: 只用裁剪范围内的历史初始化检查点
+    assert agent.memory.get_summary_stats("cp-no-summary")["scheduled"] == 0
+    assert len(state_messages(agent, "cp-no-summary")) < len(history)
+    assert state_messages(agent, "cp-no-summary")[-2].content == "继续"
+
+
+def test_failed_first_turn_keeps_other_writers():
+    agent = new_agent("答1")
+    other = new_agent("答2", checkpointer=agent.checkpointer)
+    agent.invoke("第一轮", thread_id="cp-shared")
+    # 另一个实例没有该会话的检查点记录时第一轮失败: 不删除其他实例写入的检查点,从其中最新的一个继续
+    configurable = {"thread_id": "cp-shared", "checkpoint_id": None, "turn_id": "failed-turn"}
+    other._checkpoint_done("cp-shared", configurable, ok=False)
+    assert [m.content for m in state_messages(agent, "cp-shared")] == ["第一轮", "答1"]
+    assert agent.checkpointer.get_tuple({"configurable": {"thread_id": "cp-shared",
+                                                          "checkpoint_id": configurable["checkpoint_id"]}})
+    # 只有本轮写入的检查点时整体删除
+    failing = new_agent(checkpointer=agent.checkpointer)
+    failing.model.responses = []
+    assert not failing.invoke("第一轮", thread_id="cp-own").isOk
+    assert agent.checkpointer.get_tuple({"configurable": {"thread_id": "cp-own"}}) is None
+
+
+def test_sqlite_backend_async(tmp_path):
+    options = Checkpoint_Config(backend="sqlite", sqlite_path=str(tmp_path / "cp" / "checkpoints.db"))
+    agent = new_agent(LOOKUP_CALL, "答1", "答2", checkpointer=create_checkpointer(options))
+
+    async def run():
+        await agent.ainvoke("查一下a", thread_id="cp-sqlite")
+        return [event async for event in agent.astream("继续", thread_id="cp-sqlite")]
+
+    events = asyncio.run(run())
+    assert events[-1] == {"type": "done", "content": "答2"}
+    # 新进程(新的检查点连接)继续同一会话
+    restarted = new_agent("答3", checkpointer=create_checkpointer(options))
+    restarted.invoke("还记得吗", thread_id="cp-sqlite")
+    assert [m.type for m in restarted.model.received[-1]][1:] == ["human", "ai", "tool", "ai", "human", "ai",
+                                                                   "human"]
+    assert create_checkpointer(Checkpoint_Config()) is None
+
+
+if __name__ == "__main__":
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    # 每轮: 一次工具调用 + 较长回答;对比重放历史(摘要压缩)与检查点模式(裁剪,保留工具结果)
+    responses = (LOOKUP_CALL, "回答" * 200)
+    config.summary_model = FakeLLM_Model(responses=("摘要",))
+    # 关闭响应缓存,各模式都完整调用模型
+    config.llm_cache.mode = "off"
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, options in (("重放历史", Checkpoint_Config()),
+                              ("内存检查点", Checkpoint_Config(backend="memory")),
+                              ("SQLite检查点", Checkpoint_Config(backend="sqlite",
+                                                                 sqlite_path=os.path.join(tmp, "cp.db")))):
+            config.checkpoint = options
+            agent = Langgraph_Agent(FakeLLM_Model(responses=responses), tools=[lookup], system_prompt="你是助手",
+                                    routes=[])
+            elapsed = []
+            for i in range(turns):
+                start = time.perf_counter()
+                agent.invoke(f"问题{i}", thread_id="bench")
+                elapsed.append(time.perf_counter() - start)
+            elapsed.sort()
+            print(f"{name}: 每轮 p50 {elapsed[len(elapsed) // 2] * 1000:.2f} ms, "
+                  f"最后一轮发送给模型 {count_message_tokens(agent.model.received[-1])} tokens, "
+                  f"摘要 {agent.memory.get_summary_stats('bench')['scheduled']} 次")
@@ -0,0 +1,188 @@
+"""
+会话隔离压测: 多个会话并发对话,检查每个会话的历史只包含自己的消息且顺序正确
+
+运行: python tests/test_concurrency.py [会话数] [每个会话的轮数]
+"""
+import os
+import sys
+import time
+import uuid
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.entity.agent.langgraph_agent import Langgraph_Agent
+from src.extend.store.file_store import FileSessionStore
+from src.extend.openai.openai_message import OpenAIMessage
+from tests.fake_model import FakeLLM_Model
+
+
+def expected_history(thread_id: str, turns: int) -> list:
+    """会话按顺序完成所有轮次后应有的历史"""
+    history = []
+    for i in range(turns):
+        question = f"{thread_id}-{i}"
+        history += [("user", question), ("assistant", f"echo:{question}")]
+    return history
+
+
+def check_histories(agent: Langgraph_Agent, thread_ids: list, turns: int):
+    for thread_id in thread_ids:
+        history = [tuple(m) for m in agent.memory.get_history(thread_id)]
+        assert history == expected_history(thread_id, turns), thread_id
+
+
+def run_threads(agent: Langgraph_Agent, sessions: int, turns: int) -> list:
+    """线程池并发: 每个会话由两个线程同时发送消息(同一会话的轮次必须串行)"""
+    thread_ids = [f"sync-{uuid.uuid4().hex[:8]}" for _ in range(sessions)]
+
+    def talk(thread_id: str, parity: int):
+        for i in range(parity, turns, 2):
+            agent.invoke(f"{thread_id}-{i}", thread_id=thread_id)
+
+    with ThreadPoolExecutor(max_workers=sessions * 2) as pool:
+        futures = [pool.submit(talk, t, p) for t in thread_ids for p in (0, 1)]
+        for future in futures:
+            future.result()
+    return thread_ids
+
+
+async def run_tasks(agent: Langgraph_Agent, sessions: int, turns: int) -> list:
+    """协程并发: 所有会话交错执行ainvoke/astream"""
+    thread_ids = [f"async-{uuid.uuid4().hex[:8]}" for _ in range(sessions)]
+
+    async def talk(thread_id: str):
+        for i in range(turns):
+            if i % 2:
+                async for _ in agent.astream(f"{thread_id}-{i}", thread_id=thread_id):
+                    pass
+            else:
+                await agent.ainvoke(f"{thread_id}-{i}", thread_id=thread_id)
+
+    await asyncio.gather(*(talk(t) for t in thread_ids))
+    return thread_ids
+
+
+def test_thread_isolation():
+    agent = Langgraph_Agent(FakeLLM_Model(latency=0.001, echo=True))
+    # 每个会话只有一个线程发送,保证顺序可预期
+    thread_ids = [f"sync-{uuid.uuid4().hex[:8]}" for _ in range(8)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda t: [agent.invoke(f"{t}-{i}", thread_id=t) for i in range(5)], thread_ids))
+    check_histories(agent, thread_ids, 5)
+
+
+def test_same_thread_serialized():
+    agent = Langgraph_Agent(FakeLLM_Model(latency=0.001, echo=True))
+    thread_ids = run_threads(agent, 4, 6)
+    for thread_id in thread_ids:
+        history = agent.memory.get_history(thread_id)
+        # 两个线程交替发送,顺序不定,但每轮的问答必须成对相邻
+        assert len(history) == 12
+        for user, assistant in zip(history[::2], history[1::2]):
+            assert user[0] == "user" and assistant == ("assistant", f"echo:{user[1]}")
+
+
+def test_async_isolation():
+    agent = Langgraph_Agent(FakeLLM_Model(latency=0.001, echo=True))
+    thread_ids = asyncio.run(run_tasks(agent, 16, 4))
+    check_histories(agent, thread_ids, 4)
+
+
+def test_sync_and_async_turns_serialized():
+    agent = Langgraph_Agent(FakeLLM_Model(latency=0.005, echo=True))
+    thread_id = f"mixed-{uuid.uuid4().hex[:8]}"
+
+    async def talk_async():
+        for i in range(0, 8, 2):
+            await agent.ainvoke(f"{thread_id}-{i}", thread_id=thread_id)
+
+    def talk_sync():
+        for i in range(1, 8, 2):
+            agent.invoke(f"{thread_id}-{i}", thread_id=thread_id)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(talk_sync)
+        asyncio.run(talk_async())
+        future.result()
+    # 同步与异步调用共用轮次锁,每轮的问答成对相邻
+    history = agent.memory.get_history(thread_id)
+    assert len(history) == 16
+    for user, assistant in zip(history[::2], history[1::2]):
+        assert user[0] == "user" and assistant == ("assistant", f"echo:{user[1]}")
+
+
+def test_cancelled_async_waiter_releases_lock():
+    agent = Langgraph_Agent(FakeLLM_Model(echo=True))
+    lock = agent.memory.turn_lock("cancel")
+    lock.acquire()
+
+    async def enter():
+        async with agent.memory.async_turn_lock("cancel"):
+            pass
+
+    async def run():
+        task = asyncio.create_task(enter())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        # 被取消的等待者在线程中拿到锁后立即释放
+        lock.release()
+
+    asyncio.run(run())
+    assert not lock.locked()
+    agent.invoke("q", thread_id="cancel")
+
+
+class SlowStore(FileSessionStore):
+    """读写都很慢的会话存储"""
+
+    def load(self, session_id):
+        time.sleep(0.2)
+        return super().load(session_id)
+
+    def append(self, session_id, messages):
+        time.sleep(0.2)
+        super().append(session_id, messages)
+
+
+def test_async_store_io_does_not_block_loop(tmp_path):
+    agent = Langgraph_Agent(FakeLLM_Model(echo=True))
+    agent.memory.store = SlowStore(str(tmp_path))
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def run():
+        task = asyncio.create_task(ticker())
+        await asyncio.sleep(0.05)
+        await agent.ainvoke("q", thread_id="slow")
+        await asyncio.to_thread(agent.memory.save, "slow")
+        task.cancel()
+
+    asyncio.run(run())
+    # 加载与保存会话期间事件循环仍在调度其他协程
+    assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.15
+    assert agent.memory.store.load("slow") == [["user", "q"], ["assistant", "echo:q"]]
+
+
+def test_result_messages_not_shared():
+    first = OpenAIMessage([HumanMessage("a"), AIMessage("b")], 0)
+    second = OpenAIMessage([HumanMessage("c"), AIMessage("d")], 0)
+    assert [m.text for m in first.all_result_messages] == ["b"]
+    assert [m.text for m in second.all_result_messages] == ["d"]
+
+
+if __name__ == "__main__":
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    agent = Langgraph_Agent(FakeLLM_Model(latency=0.005, echo=True))
+    thread_ids = asyncio.run(run_tasks(agent, sessions, turns))
+    check_histories(agent, thread_ids, turns)
+    print(f"{sessions} 个会话 x {turns} 轮: 历史隔离检查通过")
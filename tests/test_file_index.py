@@ -0,0 +1,91 @@
+"""
+目录索引测试: 树形遍历顺序、忽略目录、按mtime增量刷新、find_files的通配符与大小过滤
+
+运行: python tests/test_file_index.py [目录数] [每个目录的文件数]
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.extend.file_index import FileIndex
+from src.extend.tool import scan_tree, find_files
+
+
+def make_tree(root: str, files: dict):
+    for relative, content in files.items():
+        path = os.path.join(root, *relative.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+
+def test_walk_order_and_ignore():
+    with tempfile.TemporaryDirectory() as root:
+        make_tree(root, {"b.txt": "", "src/main.py": "", "src/util/io.py": "", ".git/HEAD": ""})
+        index = FileIndex(ignore=[".git"])
+        assert list(index.walk(root)) == [
+            ("src", True, 1), ("src/util", True, 2), ("src/util/io.py", False, 3),
+            ("src/main.py", False, 2), ("b.txt", False, 1),
+        ]
+        assert [path for path, _, _ in index.walk(root, max_depth=1)] == ["src", "b.txt"]
+
+
+def test_incremental_refresh():
+    with tempfile.TemporaryDirectory() as root:
+        make_tree(root, {"a/x.py": "", "b/y.py": ""})
+        index = FileIndex()
+        list(index.walk(root))
+        assert index.get_stats()["scanned"] == 3
+        # 只有新增文件的目录会重新读取
+        make_tree(root, {"a/z.py": ""})
+        paths = [path for path, _, _ in index.walk(root)]
+        assert "a/z.py" in paths
+        stats = index.get_stats()
+        assert stats["scanned"] == 4 and stats["reused"] == 2
+
+
+def test_find_files_filters():
+    with tempfile.TemporaryDirectory() as root:
+        make_tree(root, {"src/app.py": "x" * 2000, "src/lib/util.py": "", "docs/readme.md": "", "setup.py": ""})
+        result = find_files.invoke({"directory": root, "pattern": "*.py"})
+        assert result.splitlines() == ["src/lib/util.py (0B)", "src/app.py (2.0KB)", "setup.py (0B)"]
+        assert find_files.invoke({"directory": root, "pattern": "src/*.py", "min_size": 1}) == "src/app.py (2.0KB)"
+        limited = find_files.invoke({"directory": root, "pattern": "*.py", "max_results": 1}).splitlines()
+        assert len(limited) == 2 and "共找到 3 个文件" in limited[1]
+        assert "未找到" in find_files.invoke({"directory": root, "pattern": "*.rs"})
+
+
+def test_scan_tree():
+    with tempfile.TemporaryDirectory() as root:
+        make_tree(root, {"src/lib/util.py": "", "setup.py": ""})
+        assert scan_tree.invoke({"directory": root}) == "src/\n  lib/\n    util.py\nsetup.py"
+        assert scan_tree.invoke({"directory": root, "max_entries": 1}).splitlines()[1].startswith("...")
+        assert scan_tree.invoke({"directory": os.path.join(root, "missing")}).startswith("错误")
+
+
+if __name__ == "__main__":
+    dir_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    file_count = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    with tempfile.TemporaryDirectory() as root:
+        make_tree(root, {f"pkg{i // 20}/mod{i}/f{j}.{'py' if j % 4 == 0 else 'txt'}": ""
+                         for i in range(dir_count) for j in range(file_count)})
+        start = time.perf_counter()
+        walked = sum(1 for _ in os.walk(root))
+        os_walk = time.perf_counter() - start
+
+        index = FileIndex()
+        start = time.perf_counter()
+        list(index.walk(root))
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        list(index.walk(root))
+        cached = time.perf_counter() - start
+        start = time.perf_counter()
+        result = find_files.invoke({"directory": root, "pattern": "*.py", "max_results": 50})
+        find = time.perf_counter() - start
+        print(f"{walked} 个目录, {dir_count * file_count} 个文件: os.walk {os_walk * 1000:.0f} ms, "
+              f"首次索引 {first * 1000:.0f} ms, 增量刷新 {cached * 1000:.0f} ms, find_files {find * 1000:.0f} ms")
+        print(result.splitlines()[-1])
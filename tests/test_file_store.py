@@ -0,0 +1,136 @@
+"""
+JSONL会话存储测试: 截断崩溃留下的半行记录、旧版 .json 迁移、追加与整体保存(reset记录)、后台压缩(临时文件+重命名)
+
+运行: python tests/test_file_store.py [消息数]
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.extend.store.file_store import FileSessionStore
+
+
+def record(role: str, content: str) -> str:
+    return json.dumps({"op": "add", "role": role, "content": content}, ensure_ascii=False) + "\n"
+
+
+def read_lines(path) -> list:
+    with open(path, encoding="utf-8") as f:
+        return f.readlines()
+
+
+def test_torn_last_line_is_truncated(tmp_path):
+    path = tmp_path / "s.jsonl"
+    good = record("user", "问题") + record("assistant", "回答")
+    # 写入过程中崩溃: 最后一条记录只写了一半(没有换行)
+    path.write_text(good + '{"op": "add", "role": "us', encoding="utf-8")
+    store = FileSessionStore(str(tmp_path))
+    assert store.load("s") == [["user", "问题"], ["assistant", "回答"]]
+    assert path.read_bytes() == good.encode("utf-8")
+    # 截断后继续追加得到完整的日志
+    store.append("s", [("user", "新问题")])
+    store.close()
+    assert FileSessionStore(str(tmp_path)).load("s")[-1] == ["user", "新问题"]
+
+
+def test_corrupt_line_stops_replay(tmp_path):
+    path = tmp_path / "s.jsonl"
+    path.write_text(record("user", "a") + "not json\n" + record("user", "b"), encoding="utf-8")
+    store = FileSessionStore(str(tmp_path))
+    # 损坏行之后的记录无法确认完整性,一并丢弃
+    assert store.load("s") == [["user", "a"]]
+    assert read_lines(path) == [record("user", "a")]
+    store.close()
+
+
+def test_legacy_json_is_migrated(tmp_path):
+    legacy = tmp_path / "old.json"
+    legacy.write_text(json.dumps([["user", "旧问题"], ["assistant", "旧回答"]], ensure_ascii=False), encoding="utf-8")
+    store = FileSessionStore(str(tmp_path))
+    assert store.list_sessions() == ["old"] and store.exists("old")
+    assert store.load("old") == [["user", "旧问题"], ["assistant", "旧回答"]]
+    assert not legacy.exists() and (tmp_path / "old.jsonl").exists()
+    assert read_lines(tmp_path / "old.jsonl") == [record("user", "旧问题"), record("assistant", "旧回答")]
+    store.append("old", [("user", "新问题")])
+    assert store.list_sessions() == ["old"] and len(store.load("old")) == 3
+    store.close()
+
+
+def test_append_and_save(tmp_path):
+    store = FileSessionStore(str(tmp_path))
+    path = tmp_path / "s.jsonl"
+    store.append("s", [("user", "q1"), ("assistant", "a1")])
+    store.append("s", [("user", "q2")])
+    store.append("s", [])
+    # 追加只写新增的记录
+    assert read_lines(path) == [record("user", "q1"), record("assistant", "a1"), record("user", "q2")]
+    store.save("s", [("system", "摘要"), ("user", "q2")])
+    # 整体保存追加一条reset记录,不重写已有记录
+    reset = json.dumps({"op": "reset", "messages": [["system", "摘要"], ["user", "q2"]]}, ensure_ascii=False) + "\n"
+    assert read_lines(path)[3:] == [reset]
+    assert sorted(os.listdir(tmp_path)) == ["s.jsonl"]
+    store.append("s", [("assistant", "a2")])
+    assert store.load("s") == [["system", "摘要"], ["user", "q2"], ["assistant", "a2"]]
+    store.close()
+
+
+def test_leftover_tmp_file_is_ignored(tmp_path):
+    (tmp_path / "s.jsonl").write_text(record("user", "已提交"), encoding="utf-8")
+    # 原子写入在重命名前崩溃,只留下临时文件
+    (tmp_path / "s.jsonl.tmp").write_text(record("user", "未提交"), encoding="utf-8")
+    store = FileSessionStore(str(tmp_path))
+    assert store.load("s") == [["user", "已提交"]] and store.list_sessions() == ["s"]
+    store.save("s", [("user", "新内容")])
+    assert sorted(os.listdir(tmp_path)) == ["s.jsonl"]
+    store.close()
+
+
+def test_compaction_rewrites_log(tmp_path):
+    path = tmp_path / "s.jsonl"
+    store = FileSessionStore(str(tmp_path), compact_min_records=4)
+    store.append("s", [("user", f"旧{i}") for i in range(10)])
+    # 整体保存后日志中有大量被reset记录覆盖的失效记录: 在后台压缩
+    store.save("s", [("system", "摘要")])
+    store.append("s", [("user", "新问题")])
+    deadline = time.monotonic() + 5
+    while len(read_lines(path)) != 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert read_lines(path) == [record("system", "摘要"), record("user", "新问题")]
+    assert sorted(os.listdir(tmp_path)) == ["s.jsonl"]
+    # 压缩后继续追加
+    store.append("s", [("assistant", "回答")])
+    assert store.load("s") == [["system", "摘要"], ["user", "新问题"], ["assistant", "回答"]]
+    store.close()
+
+
+def test_torn_reset_keeps_previous_messages(tmp_path):
+    path = tmp_path / "s.jsonl"
+    store = FileSessionStore(str(tmp_path))
+    store.append("s", [("user", "q1")])
+    store.close()
+    # 整体保存写入reset记录的过程中崩溃: 恢复时丢弃半行,保留替换前的消息
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"op": "reset", "messages": [["sys')
+    assert FileSessionStore(str(tmp_path)).load("s") == [["user", "q1"]]
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as directory:
+        store = FileSessionStore(directory)
+        history = []
+        start = time.perf_counter()
+        for i in range(count):
+            store.append("bench", [("user", f"问题{i}")])
+        appended = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(min(count, 200)):
+            history.append(("user", f"问题{i}"))
+            store.save("bench-full", history)
+        saved = time.perf_counter() - start
+        print(f"追加: {appended / count * 1e6:.1f} µs/条, 整体保存: {saved / min(count, 200) * 1000:.2f} ms/次")
+        store.close()
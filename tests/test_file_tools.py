@@ -0,0 +1,85 @@
+"""
+文件工具测试与基准: 按行/字节/尾部读取、二进制检测、搜索、输出token预算
+
+运行: python tests/test_file_tools.py [大文件行数]
+"""
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config.config_model import config
+from src.extend import tool as tools
+from src.extend.tool import read_file, search_file
+
+
+def make_file(directory: str, lines: int) -> str:
+    path = os.path.join(directory, "log.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(1, lines + 1):
+            f.write(f"line {i} {'ERROR' if i % 100 == 0 else 'ok'}\n")
+    return path
+
+
+def read(path: str, **kwargs) -> str:
+    return read_file.invoke({"file_path": path, **kwargs})
+
+
+def test_line_ranges_and_tail():
+    with tempfile.TemporaryDirectory() as directory:
+        path = make_file(directory, 10)
+        assert read(path, start_line=3, end_line=4) == "line 3 ok\nline 4 ok\n"
+        assert read(path, tail=2) == "line 9 ok\nline 10 ok\n"
+        assert read(path, offset=0, length=4) == "line"
+        assert read(path, start_line=20) == ""
+
+
+def test_binary_detection():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "a.bin")
+        with open(path, "wb") as f:
+            f.write(b"\x00\x01\x02")
+        assert "二进制文件" in read(path)
+
+
+def test_output_budget_and_mmap(monkeypatch):
+    monkeypatch.setattr(config.tool_config, "max_output_tokens", 50)
+    monkeypatch.setattr(tools, "MMAP_THRESHOLD", 1024)
+    with tempfile.TemporaryDirectory() as directory:
+        path = make_file(directory, 5000)
+        output = read(path)
+        assert output.startswith("line 1 ok") and "继续读取" in output
+        resume = int(output.rsplit("从第 ", 1)[1].split(" ")[0])
+        assert read(path, start_line=resume).startswith(f"line {resume} ")
+        assert read(path, tail=1) == "line 5000 ERROR\n"
+
+
+def test_search_file():
+    with tempfile.TemporaryDirectory() as directory:
+        path = make_file(directory, 1000)
+        output = search_file.invoke({"file_path": path, "pattern": "error", "ignore_case": True, "max_results": 3})
+        assert output.splitlines()[:3] == ["100: line 100 ERROR", "200: line 200 ERROR", "300: line 300 ERROR"]
+        assert "上限" in output.splitlines()[3]
+        assert "未找到" in search_file.invoke({"file_path": path, "pattern": r"line \d+ missing", "regex": True})
+
+
+if __name__ == "__main__":
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    with tempfile.TemporaryDirectory() as directory:
+        path = make_file(directory, lines)
+        size = os.path.getsize(path) / 1024 / 1024
+        for name, func in (("整体读取(旧实现)", lambda: open(path, encoding="utf-8").read()),
+                           ("read_file 默认", lambda: read(path)),
+                           ("read_file tail=20", lambda: read(path, tail=20)),
+                           ("search_file", lambda: search_file.invoke({"file_path": path, "pattern": "ERROR"}))):
+            tracemalloc.start()
+            start = time.perf_counter()
+            output = func()
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name}: {size:.0f} MiB 文件, {elapsed * 1000:.1f} ms, 峰值内存 {peak / 1024 / 1024:.1f} MiB, "
+                  f"输出 {len(output)} 字符")
@@ -0,0 +1,85 @@
+"""
+graph缓存测试: 工具变化时复用已编译graph、与工具顺序无关、按模型区分、LRU淘汰
+
+运行: python tests/test_graph_cache.py [切换次数]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config.config_model import config
+from src.config.config_entity import LLM_Model
+from src.entity.agent.graph_cache import GraphCache, graph_cache
+from src.entity.agent.langgraph_agent import Langgraph_Agent
+from src.extend.tool import list_files, read_file, scan_tree, find_files, search_file, write_file, run_cmd
+from tests.fake_model import FakeLLM_Model
+
+ALL_TOOLS = [list_files, scan_tree, find_files, read_file, search_file, write_file, run_cmd]
+
+
+def test_tool_changes_reuse_graphs():
+    agent = Langgraph_Agent(FakeLLM_Model(responses=("好的",)), tools=[list_files, read_file])
+    first = agent.graph
+    before = graph_cache.get_stats()
+    agent.add_tool(write_file)
+    assert agent.graph is not first
+    agent.remove_tool("write_file")
+    assert agent.graph is first and agent.list_tools() == ["list_files", "read_file"]
+    # 工具顺序不影响缓存
+    agent.set_tools([read_file, list_files])
+    assert agent.graph is first
+    stats = graph_cache.get_stats()
+    assert stats["misses"] - before["misses"] == 1 and stats["hits"] - before["hits"] == 2
+    assert agent.invoke("你好", thread_id="graph-cache").last_message == "好的"
+
+
+def test_models_do_not_share_graphs():
+    tools = [list_files]
+    a = Langgraph_Agent(FakeLLM_Model(), tools=tools)
+    b = Langgraph_Agent(FakeLLM_Model(), tools=tools)
+    assert a.graph is not b.graph
+    # 不同模型共用同一工具集合的工具节点
+    cache = GraphCache()
+    assert cache.get_graph(a.model, tools) is not cache.get_graph(b.model, tools)
+    assert cache.get_stats()["tool_nodes"] == 1
+
+
+def test_lru_eviction():
+    cache = GraphCache(max_size=2)
+    model = FakeLLM_Model().init_model()
+    graphs = [cache.get_graph(model, [tool]) for tool in (list_files, read_file, write_file)]
+    assert cache.get_stats()["evictions"] == 1 and cache.get_stats()["size"] == 2
+    assert cache.get_graph(model, [write_file]) is graphs[2]
+    assert cache.get_graph(model, [list_files]) is not graphs[0]
+
+
+def test_evicted_tool_node_is_shut_down():
+    cache = GraphCache(max_size=1)
+    node = cache.get_tool_node([list_files])
+    node._pool()
+    cache.get_tool_node([read_file])
+    # 被淘汰的工具节点释放线程池
+    assert node._executor is None
+    other = cache.get_tool_node([read_file])
+    other._pool()
+    cache.clear()
+    assert other._executor is None
+
+
+if __name__ == "__main__":
+    switches = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    # 真实的模型客户端(绑定工具时生成JSON Schema,不访问网络)
+    model = LLM_Model(model_name="qwen3", model_provider="ollama", base_url="http://127.0.0.1:1")
+    agent = Langgraph_Agent(model, tools=ALL_TOOLS)
+    tool_sets = [ALL_TOOLS[:3], ALL_TOOLS[:5], ALL_TOOLS]
+    for cached in (False, True):
+        start = time.perf_counter()
+        for i in range(switches):
+            if not cached:
+                graph_cache.clear()
+            agent.set_tools(tool_sets[i % len(tool_sets)])
+        elapsed = time.perf_counter() - start
+        print(f"{'缓存' if cached else '每次编译'}: {elapsed / switches * 1000:.2f} ms/次")
+    print(graph_cache.get_stats())
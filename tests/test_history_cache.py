@@ -0,0 +1,179 @@
+"""
+会话线程缓存测试: LRU淘汰与回写(在全局锁外执行)、懒加载、闲置超时、命中/未命中与回写失败计数、
+删除/重命名后不再回写
+
+运行: python tests/test_history_cache.py [会话数] [缓存容量]
+"""
+import os
+import sys
+import time
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.extend.openai.summarizing_memory import HistoryMemory
+from src.extend.store.file_store import FileSessionStore
+
+
+def new_memory(directory: str, max_threads: int = 2, ttl: float = 0) -> HistoryMemory:
+    return HistoryMemory(store=FileSessionStore(directory), max_threads=max_threads, ttl=ttl)
+
+
+def test_evict_writes_back_and_reloads():
+    with tempfile.TemporaryDirectory() as directory:
+        memory = new_memory(directory)
+        for thread_id in ("a", "b", "c"):
+            memory.add_message(thread_id, "user", f"hi {thread_id}")
+        # 容量为2: 最久未使用的a被淘汰并写回存储
+        assert memory.list_threads() == ["b", "c"]
+        assert memory.store.load("a") == [["user", "hi a"]]
+        stats = memory.get_cache_stats()
+        assert stats["evictions"] == 1 and stats["write_backs"] == 1 and stats["size"] == 2
+
+        # 再次访问时从存储懒加载
+        assert memory.get_messages("a") == [("user", "hi a")]
+        assert memory.get_cache_stats()["misses"] == 4
+        memory.store.close()
+
+
+def test_hot_thread_stays_cached():
+    with tempfile.TemporaryDirectory() as directory:
+        memory = new_memory(directory)
+        memory.add_message("hot", "user", "1")
+        memory.add_message("cold", "user", "2")
+        memory.get_messages("hot")
+        memory.add_message("new", "user", "3")
+        assert memory.list_threads() == ["hot", "new"]
+        assert memory.get_cache_stats()["hits"] == 1
+        memory.store.close()
+
+
+def test_transient_and_busy_threads():
+    with tempfile.TemporaryDirectory() as directory:
+        memory = new_memory(directory, max_threads=1)
+        memory.set_history("temp", [("user", "draft")], transient=True)
+        with memory.turn_lock("busy"):
+            # temp不回写存储; busy正在对话,不会被淘汰
+            memory.add_message("other", "user", "x")
+            assert "busy" in memory.list_threads()
+        assert not memory.store.exists("temp")
+        memory.store.close()
+
+
+def test_ttl_expiration():
+    with tempfile.TemporaryDirectory() as directory:
+        memory = new_memory(directory, max_threads=10, ttl=0.05)
+        memory.add_message("idle", "user", "x")
+        time.sleep(0.1)
+        memory.get_messages("active")
+        assert memory.list_threads() == ["active"]
+        assert memory.get_cache_stats()["expirations"] == 1
+        assert memory.store.load("idle") == [["user", "x"]]
+        memory.store.close()
+
+
+class SlowStore(FileSessionStore):
+    """写入很慢(或失败)的会话存储"""
+
+    def __init__(self, directory: str, delay: float = 0.3, fail: bool = False):
+        super().__init__(directory)
+        self.delay, self.fail = delay, fail
+        self.started = threading.Event()
+
+    def _slow_write(self):
+        self.started.set()
+        time.sleep(self.delay)
+        if self.fail:
+            raise OSError("磁盘已满")
+
+    def save(self, session_id, history):
+        self._slow_write()
+        super().save(session_id, history)
+
+    def append(self, session_id, messages):
+        self._slow_write()
+        super().append(session_id, messages)
+
+
+def test_write_back_runs_outside_global_lock():
+    with tempfile.TemporaryDirectory() as directory:
+        memory = HistoryMemory(store=SlowStore(directory), max_threads=2)
+        memory.add_message("a", "user", "hi a")
+        memory.add_message("b", "user", "hi b")
+        evicting = threading.Thread(target=memory.add_message, args=("c", "user", "hi c"))
+        evicting.start()
+        memory.store.started.wait()
+        # a正在回写时,其他会话的访问不需要等待
+        start = time.monotonic()
+        assert memory.get_messages("b") == [("user", "hi b")]
+        assert time.monotonic() - start < 0.1
+        # 正在回写的a被再次访问时直接放回缓存,不从存储读取旧数据
+        assert memory.get_messages("a") == [("user", "hi a")]
+        evicting.join()
+        stats = memory.get_cache_stats()
+        assert stats["write_backs"] == 1 and stats["misses"] == 3
+        memory.store.close()
+
+
+def test_write_back_failure_is_recorded():
+    with tempfile.TemporaryDirectory() as directory:
+        memory = HistoryMemory(store=SlowStore(directory, delay=0, fail=True), max_threads=1)
+        memory.add_message("a", "user", "hi a")
+        memory.add_message("b", "user", "hi b")
+        stats = memory.get_cache_stats()
+        assert stats["write_backs"] == 0 and stats["write_back_failures"] == 1
+        assert stats["last_error"] == "a: 磁盘已满"
+        memory.store.close()
+
+
+def test_removed_thread_is_not_written_back():
+    with tempfile.TemporaryDirectory() as directory:
+        memory = HistoryMemory(store=SlowStore(directory), max_threads=1)
+        memory.add_message("a", "user", "hi a")
+        evicting = threading.Thread(target=memory.add_message, args=("b", "user", "hi b"))
+        evicting.start()
+        memory.store.started.wait()
+        # a正在回写时删除会话: 等待回写结束后再删除存储,之后不会重新创建
+        memory.remove_thread("a")
+        memory.store.delete("a")
+        evicting.join()
+        assert not memory.store.exists("a")
+        memory.store.close()
+
+
+def test_renamed_thread_skips_pending_write_back():
+    with tempfile.TemporaryDirectory() as directory:
+        memory = new_memory(directory)
+        memory.add_message("a", "user", "hi a")
+        with memory._lock:
+            pending = [memory._remove(memory._dict_memory["a"])]
+        # 等待回写期间会话被重命名: 不再写到旧ID下,修改随新ID保留在缓存中
+        memory.rename_thread("a", "z")
+        memory._write_back(pending)
+        assert not memory.store.exists("a") and not memory.store.exists("z")
+        assert memory.get_messages("z") == [("user", "hi a")]
+        memory.save("z")
+        assert memory.store.load("z") == [["user", "hi a"]]
+        memory.store.close()
+
+
+if __name__ == "__main__":
+    import tracemalloc
+
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    capacity = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    with tempfile.TemporaryDirectory() as directory:
+        memory = new_memory(directory, max_threads=capacity)
+        tracemalloc.start()
+        start = time.perf_counter()
+        for i in range(sessions):
+            thread_id = f"s{i}"
+            memory.add_message(thread_id, "user", "问题" * 50)
+            memory.add_message(thread_id, "assistant", "回答" * 200)
+            memory.save(thread_id)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        print(f"{sessions} 个会话, 容量 {capacity}: {elapsed:.2f}s, 峰值内存 {peak / 1024:.0f} KiB")
+        print(memory.get_cache_stats())
+        memory.store.close()
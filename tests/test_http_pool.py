@@ -0,0 +1,141 @@
+"""
+模型连接池测试: 本地模拟Ollama服务,检查预热加载模型、多个模型客户端复用同一连接、
+异步连接池按事件循环隔离
+
+运行: python tests/test_http_pool.py [请求数]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config.config_entity import LLM_Model
+from src.extend.openai.http_pool import get_async_transport, get_transport, warm_up
+
+
+class FakeOllama(ThreadingHTTPServer):
+    """模拟Ollama: 模型首次被请求时模拟加载耗时,记录连接数与请求路径"""
+    daemon_threads = True
+
+    def __init__(self, load_seconds: float = 0.0):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.load_seconds = load_seconds
+        self.loaded = set()
+        self.connections = 0
+        self.requests = []
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, body.get("keep_alive")))
+            loading = body["model"] not in server.loaded
+            server.loaded.add(body["model"])
+        if loading:
+            time.sleep(server.load_seconds)
+        if self.path == "/api/generate":
+            reply = {"model": body["model"], "created_at": "2025-01-01T00:00:00Z", "response": "", "done": True}
+        else:
+            reply = {"model": body["model"], "created_at": "2025-01-01T00:00:00Z",
+                     "message": {"role": "assistant", "content": "ok"}, "done": True, "done_reason": "stop"}
+        data = (json.dumps(reply) + "\n").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def ollama_model(server: FakeOllama, name: str = "fake-model") -> LLM_Model:
+    return LLM_Model(model_name=name, model_provider="ollama", base_url=server.url)
+
+
+def test_warm_up_loads_model_once():
+    server = FakeOllama()
+    try:
+        model = ollama_model(server)
+        assert warm_up([model, model]) == [None, None]
+        assert server.requests == [("/api/generate", "30m")]
+        assert "fake-model" in server.loaded
+        assert warm_up([LLM_Model(model_name="x", model_provider="ollama", base_url="http://127.0.0.1:9")])[0]
+    finally:
+        server.shutdown()
+
+
+def test_models_share_connection_pool():
+    server = FakeOllama()
+    try:
+        chat = ollama_model(server).init_model()
+        summary = ollama_model(server).init_model()
+        assert chat._client._client._transport is get_transport()
+        warm_up([ollama_model(server)])
+        for model in (chat, summary, chat):
+            assert model.invoke("hi").content == "ok"
+        # 预热建立的连接被两个模型客户端复用
+        assert server.connections == 1
+        assert [path for path, _ in server.requests] == ["/api/generate"] + ["/api/chat"] * 3
+    finally:
+        server.shutdown()
+
+
+def test_async_transport_per_event_loop():
+    server = FakeOllama()
+    try:
+        chat = ollama_model(server).init_model()
+        transport = get_async_transport()
+
+        async def ask():
+            replies = [(await chat.ainvoke("hi")).content for _ in range(2)]
+            return replies, transport._current()
+
+        # 每次asyncio.run都是新的事件循环,不能复用上一个循环建立的连接
+        first_replies, first = asyncio.run(asyncio.wait_for(ask(), 5))
+        second_replies, second = asyncio.run(asyncio.wait_for(ask(), 5))
+        assert first_replies == second_replies == ["ok", "ok"]
+        assert first is not second
+        # 同一事件循环内复用连接
+        assert server.connections == 2
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for warm in (False, True):
+        server = FakeOllama(load_seconds=0.5)
+        model = ollama_model(server, f"bench-{warm}")
+        if warm:
+            warm_up([model])
+        chat = model.init_model()
+        latencies = []
+        for _ in range(count):
+            start = time.perf_counter()
+            chat.invoke("hi")
+            latencies.append(time.perf_counter() - start)
+        steady = sorted(latencies[1:])[len(latencies[1:]) // 2]
+        print(f"{'预热' if warm else '未预热'}: 首次请求 {latencies[0] * 1000:.1f} ms, "
+              f"稳定后中位数 {steady * 1000:.1f} ms, 连接数 {server.connections}")
+        server.shutdown()
@@ -0,0 +1,76 @@
+"""
+模型响应缓存测试与基准: 完全匹配、相似问题匹配、TTL与容量淘汰,以及命中时节省的耗时
+
+运行: python tests/test_llm_cache.py [模型延迟秒数] [请求次数]
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from src.extend.openai.llm_cache import ResponseCache, embed
+from tests.fake_model import FakeChatModel
+
+
+def ask(model: FakeChatModel, question: str, system: str = "你是助手") -> str:
+    # 每次构造新消息(ID不同),验证键与消息ID无关
+    return model.invoke([SystemMessage(system, id=str(time.time_ns())), HumanMessage(question)]).content
+
+
+def test_exact_match():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResponseCache(os.path.join(directory, "cache.db"))
+        model = FakeChatModel(responses=["first", "second"], cache=cache)
+        assert ask(model, "你好") == "first"
+        assert ask(model, "你好") == "first"
+        assert ask(model, "你好", system="另一个系统提示") == "second"
+        stats = cache.get_stats()
+        assert stats["lookups"] == 3 and stats["hits"] == 1 and stats["saved_tokens"] > 0
+
+
+def test_semantic_match():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResponseCache(os.path.join(directory, "cache.db"), mode="semantic", similarity=0.9)
+        model = FakeChatModel(responses=["weather", "other"], cache=cache)
+        assert ask(model, "今天北京的天气怎么样?") == "weather"
+        assert ask(model, "今天北京的天气怎么样") == "weather"
+        assert ask(model, "帮我写一个快速排序") == "other"
+        assert cache.get_stats()["semantic_hits"] == 1
+
+
+def test_ttl_and_capacity():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResponseCache(os.path.join(directory, "cache.db"), max_entries=2, ttl=0.05)
+        model = FakeChatModel(responses=["a", "b", "c", "d"], cache=cache)
+        ask(model, "q1")
+        time.sleep(0.1)
+        assert ask(model, "q1") == "b"  # 过期后重新调用模型
+        ask(model, "q2")
+        ask(model, "q3")
+        assert cache.get_stats()["evictions"] == 1
+        assert cache._db().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] == 2
+
+
+def test_embed_similarity():
+    a, b, c = embed("如何读取文件"), embed("如何读取文件?"), embed("今天天气")
+    assert sum(x * y for x, y in zip(a, b)) > 0.99
+    assert sum(x * y for x, y in zip(a, c)) < 0.5
+
+
+if __name__ == "__main__":
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.2
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    questions = [f"问题{i % 5}" for i in range(rounds)]
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResponseCache(os.path.join(directory, "cache.db"))
+        for name, model in (("无缓存", FakeChatModel(latency=latency)),
+                            ("exact缓存", FakeChatModel(latency=latency, cache=cache))):
+            start = time.perf_counter()
+            for question in questions:
+                ask(model, question)
+            print(f"{name}: {rounds} 次请求 {time.perf_counter() - start:.2f}s")
+        print(cache.get_stats())
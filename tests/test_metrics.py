@@ -0,0 +1,92 @@
+"""
+性能指标测试: HDR直方图分位数误差、Prometheus文本格式、每轮对话各阶段耗时与token计数
+
+运行: python tests/test_metrics.py [记录次数]
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage
+
+from src.entity.agent.langgraph_agent import Langgraph_Agent
+from src.extend.metrics import PHASE_SECONDS, TOKENS_TOTAL, TURNS_TOTAL, Histogram, Metrics, metrics
+from src.extend.tool import list_files
+from tests.fake_model import FakeLLM_Model
+
+TOOL_CALL = AIMessage(content="", tool_calls=[{"name": "list_files", "args": {"directory": "."}, "id": "c1"}])
+
+
+def test_histogram_percentiles():
+    rng = random.Random(1)
+    values = sorted(rng.uniform(0.001, 30.0) for _ in range(20000))
+    h = Histogram(precision=7)
+    for value in values:
+        h.record(value)
+    for q in (0.5, 0.9, 0.99):
+        exact = values[int(q * len(values)) - 1]
+        assert abs(h.percentile(q) - exact) / exact < 0.02
+    assert h.count == len(values) and h.max == values[-1] and h.last == values[-1]
+    # 子桶数量与数值范围的数量级有关,而不是与记录次数有关
+    assert len(h.counts) < 2000
+    assert Histogram().percentile(0.5) == 0.0
+
+
+def test_prometheus_format():
+    m = Metrics(quantiles=[0.5, 0.99])
+    m.observe(PHASE_SECONDS, 0.25, phase="model", route="small")
+    m.inc(TOKENS_TOTAL, 12, kind="input")
+    m.inc(TOKENS_TOTAL, 3, kind="input")
+    text = m.render_prometheus()
+    assert "# TYPE agent_phase_seconds summary" in text
+    assert 'agent_phase_seconds{phase="model",route="small",quantile="0.99"} 0.25' in text
+    assert 'agent_phase_seconds_count{phase="model",route="small"} 1' in text
+    assert "# TYPE agent_tokens_total counter" in text and 'agent_tokens_total{kind="input"} 15' in text
+    assert "model(small)" in m.format_summary()
+
+    disabled = Metrics(enabled=False)
+    disabled.observe(PHASE_SECONDS, 1.0, phase="turn")
+    assert disabled.render_prometheus() == "\n"
+
+
+def test_turn_phases():
+    metrics.reset()
+    agent = Langgraph_Agent(FakeLLM_Model(responses=(TOOL_CALL, "完成"), latency=0.01), tools=[list_files])
+    agent.invoke("列出文件", thread_id="metrics-invoke")
+    for phase in ("queue", "history", "turn"):
+        assert metrics.get_histogram(PHASE_SECONDS, phase=phase).count == 1
+    model = metrics.get_histogram(PHASE_SECONDS, phase="model", route="default")
+    assert model.count == 2 and model.percentile(0.5) >= 0.01
+    assert metrics.get_histogram(PHASE_SECONDS, phase="tool", tool="list_files").count == 1
+    assert metrics.get_counter(TOKENS_TOTAL, kind="input", route="default") > 0
+    assert metrics.get_counter(TOKENS_TOTAL, kind="output", route="default") > 0
+    assert metrics.get_counter(TURNS_TOTAL, status="ok") == 1
+    # 不逐token输出时没有首token耗时
+    assert metrics.get_histogram(PHASE_SECONDS, phase="model_ttft", route="default") is None
+
+    agent.invoke("你好", thread_id="metrics-tokens", stream_func=lambda role, content: None, stream_tokens=True)
+    ttft = metrics.get_histogram(PHASE_SECONDS, phase="model_ttft", route="default")
+    assert ttft.count == 2 and ttft.max <= metrics.get_histogram(PHASE_SECONDS, phase="model", route="default").max
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    m = Metrics()
+    start = time.perf_counter()
+    for i in range(count):
+        m.observe(PHASE_SECONDS, random.expovariate(2.0), phase="model", route="default")
+    elapsed = time.perf_counter() - start
+    h = m.get_histogram(PHASE_SECONDS, phase="model", route="default")
+    print(f"{count} 次记录: {elapsed * 1e6 / count:.2f} us/次, 子桶 {len(h.counts)} 个")
+    start = time.perf_counter()
+    text = m.render_prometheus()
+    print(f"导出 /metrics: {(time.perf_counter() - start) * 1000:.2f} ms, {len(text)} 字节")
+
+    agent = Langgraph_Agent(FakeLLM_Model(responses=(TOOL_CALL, "完成"), latency=0.02), tools=[list_files])
+    metrics.reset()
+    for i in range(20):
+        agent.invoke("列出文件", thread_id="bench", stream_func=lambda role, content: None, stream_tokens=True)
+    print(metrics.format_summary())
@@ -0,0 +1,175 @@
+"""
+模型路由测试: 按输入选择模型、工具调用出错时升级(从已执行的工具步骤继续)、分类模型选择、按路由统计耗时与token
+
+运行: python tests/test_model_router.py [轮数]
+"""
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.tools import tool
+
+from src.config.config_model import config
+from src.config.config_entity import LLM_Model, Route_Config, Router_Config
+from src.entity.agent.langgraph_agent import Langgraph_Agent
+from src.entity.agent.model_router import DEFAULT_ROUTE, ModelRouter, completed_steps, failure_reason
+from src.extend.tool import list_files
+from tests.fake_model import FakeLLM_Model
+
+# 调用不存在的工具(ToolNode返回以"Error:"开头的错误)
+BAD_TOOL_CALL = AIMessage(content="", tool_calls=[{"name": "no_such_tool", "args": {}, "id": "call-1"}])
+
+
+def small_route(**kwargs) -> Route_Config:
+    return Route_Config(name="small", model=FakeLLM_Model(**kwargs), max_input_tokens=20,
+                        exclude_keywords=["代码"], cost_per_1k_tokens=0.1)
+
+
+def new_agent(route: Route_Config, latency: float = 0.0) -> Langgraph_Agent:
+    return Langgraph_Agent(FakeLLM_Model(echo=True, latency=latency), tools=[list_files], routes=[route])
+
+
+def test_heuristic_plan():
+    router = ModelRouter([small_route()])
+    assert router.plan("你好") == ["small", DEFAULT_ROUTE]
+    assert router.plan("帮我写一段代码") == [DEFAULT_ROUTE]
+    assert router.plan("很长的问题" * 50) == [DEFAULT_ROUTE]
+    assert ModelRouter([small_route()], Router_Config(escalate=False)).plan("你好") == ["small"]
+    assert ModelRouter().plan("你好") == [DEFAULT_ROUTE]
+
+
+def test_classifier_plan():
+    router = ModelRouter([small_route()], Router_Config(mode="model", classifier=FakeLLM_Model(responses=("small",))))
+    assert router.plan("帮我写一段代码") == ["small", DEFAULT_ROUTE]
+    router = ModelRouter([small_route()], Router_Config(mode="model", classifier=FakeLLM_Model(responses=("?",))))
+    # 无法识别分类结果时使用规则
+    assert router.plan("你好") == ["small", DEFAULT_ROUTE]
+
+
+def test_broken_classifier_falls_back_to_heuristic(monkeypatch):
+    # 分类模型配置错误(无法创建)时按规则选择,不影响本轮对话
+    broken = Router_Config(mode="model", classifier=LLM_Model(model_name="x", model_provider="no-such-provider"))
+    assert ModelRouter([small_route()], broken).plan("你好") == ["small", DEFAULT_ROUTE]
+    monkeypatch.setattr(config, "router", broken)
+    agent = new_agent(small_route(echo=True))
+    result = agent.invoke("你好", thread_id="router-broken-classifier")
+    assert result.route == "small" and result.last_message == "echo:你好"
+    assert agent.memory.get_history("router-broken-classifier") == [("user", "你好"), ("assistant", "echo:你好")]
+
+
+def test_simple_turn_uses_small_model():
+    agent = new_agent(small_route(echo=True))
+    result = agent.invoke("你好", thread_id="router-simple")
+    assert result.route == "small" and result.last_message == "echo:你好"
+    assert agent.invoke("帮我写一段代码", thread_id="router-simple").route == DEFAULT_ROUTE
+    stats = agent.get_route_stats()
+    assert stats["small"]["turns"] == 1 and stats["small"]["tokens"] > 0
+    assert abs(stats["small"]["cost"] - stats["small"]["tokens"] / 1000 * 0.1) < 1e-9
+
+
+def test_bad_tool_call_escalates():
+    agent = new_agent(small_route(responses=(BAD_TOOL_CALL, "unused")))
+    notices = []
+    result = agent.invoke("你好", thread_id="router-escalate", stream_func=lambda role, content: notices.append(role))
+    assert result.route == DEFAULT_ROUTE and result.last_message == "echo:你好"
+    assert "router" in notices
+    stats = agent.get_route_stats()
+    assert stats["small"]["failures"] == 1 and stats["small"]["escalations"] == 1
+    assert stats[DEFAULT_ROUTE]["turns"] == 1 and stats[DEFAULT_ROUTE]["failures"] == 0
+    # 升级后的回答只记录一次
+    assert agent.memory.get_history("router-escalate") == [("user", "你好"), ("assistant", "echo:你好")]
+
+
+def test_stream_escalation_event():
+    agent = new_agent(small_route(responses=(AIMessage(content=""),)))
+    events = list(agent.stream("你好", thread_id="router-stream"))
+    assert any(event["type"] == "router" for event in events)
+    assert events[-1] == {"type": "done", "content": "echo:你好"}
+
+    async def run():
+        return [event async for event in agent.astream("你好", thread_id="router-astream")]
+
+    assert asyncio.run(run())[-1] == {"type": "done", "content": "echo:你好"}
+
+
+NOTES = []
+
+
+@tool
+def write_note(text: str) -> str:
+    """记录一条笔记(有副作用的工具)"""
+    NOTES.append(text)
+    return f"已记录: {text}"
+
+
+def side_effect_route() -> Route_Config:
+    """同一步内一个有副作用的工具调用与一个不存在的工具调用"""
+    mixed = AIMessage(content="", tool_calls=[{"name": "write_note", "args": {"text": "a"}, "id": "call-note"},
+                                              {"name": "no_such_tool", "args": {}, "id": "call-bad"}])
+    return Route_Config(name="small", model=FakeLLM_Model(responses=(mixed, "unused")), max_input_tokens=20)
+
+
+def test_completed_steps():
+    ok = ToolMessage(content="ok", tool_call_id="1")
+    bad = ToolMessage(content="Error: no is not a valid tool, try one of [write_note].", tool_call_id="2",
+                      status="error")
+    call, reply = BAD_TOOL_CALL, AIMessage(content="")
+    assert completed_steps([call, bad, reply]) == []
+    assert completed_steps([call, ok, bad, reply]) == [call, ok, bad]
+    assert completed_steps([call, ok, call, bad, reply]) == [call, ok]
+
+
+def test_tool_runtime_error_does_not_escalate():
+    # 工具执行时抛出的异常不是模型的问题: 不升级,异常步骤作为已执行步骤保留
+    raised = ToolMessage(content="Error: RuntimeError('boom')\n Please fix your mistakes.", tool_call_id="1",
+                         status="error")
+    invalid = ToolMessage(content="Error: 1 validation error for write_note\ntext\n  Field required",
+                          tool_call_id="2", status="error")
+    assert failure_reason([BAD_TOOL_CALL, raised, AIMessage(content="ok")]) is None
+    assert failure_reason([BAD_TOOL_CALL, invalid, AIMessage(content="ok")]).startswith("工具调用错误")
+    assert completed_steps([BAD_TOOL_CALL, raised, AIMessage(content="")]) == [BAD_TOOL_CALL, raised]
+
+
+def test_escalation_does_not_rerun_tools():
+    NOTES.clear()
+    agent = Langgraph_Agent(FakeLLM_Model(echo=True), tools=[write_note], routes=[side_effect_route()])
+    result = agent.invoke("你好", thread_id="router-side-effect")
+    assert result.route == DEFAULT_ROUTE and result.last_message == "echo:你好"
+    # 升级后从已执行的工具步骤继续,工具只执行一次
+    assert NOTES == ["a"]
+    received = agent.model.received[-1]
+    assert [m.type for m in received[-4:]] == ["human", "ai", "tool", "tool"]
+    assert agent.memory.get_history("router-side-effect") == [("user", "你好"), ("assistant", "echo:你好")]
+
+
+def test_stream_escalation_keeps_tool_events():
+    NOTES.clear()
+    agent = Langgraph_Agent(FakeLLM_Model(echo=True), tools=[write_note], routes=[side_effect_route()])
+
+    async def run():
+        return [event async for event in agent.astream("你好", thread_id="router-astream-side-effect")]
+
+    events = list(agent.stream("你好", thread_id="router-stream-side-effect")) + asyncio.run(run())
+    types = [event["type"] for event in events]
+    assert NOTES == ["a", "a"] and types.count("router") == 2 and types.count("done") == 2
+    # 每轮的工具事件只出现一次(升级后的尝试不会再次执行)
+    assert sum(1 for e in events if e["type"] == "tool_result" and e["name"] == "write_note") == 2
+
+
+if __name__ == "__main__":
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    questions = ["你好", "今天星期几", "帮我写一段代码分析日志", "谢谢"]
+    for routes in ([], [small_route(echo=True, latency=0.05)]):
+        agent = Langgraph_Agent(FakeLLM_Model(echo=True, latency=0.5), tools=[list_files], routes=routes)
+        start = time.perf_counter()
+        for i in range(turns):
+            agent.invoke(questions[i % len(questions)], thread_id=f"bench-{len(routes)}")
+        elapsed = time.perf_counter() - start
+        print(f"{'路由' if routes else '只用大模型'}: {turns} 轮 {elapsed:.2f}s")
+        for name, stats in agent.get_route_stats().items():
+            print(f"  {name}: {stats['turns']} 次, 平均 {stats['avg_latency_seconds'] * 1000:.0f} ms, "
+                  f"{stats['tokens']} tokens, 升级 {stats['escalations']} 次")
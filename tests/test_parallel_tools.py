@@ -0,0 +1,130 @@
+"""
+并行工具节点测试与基准: 一步内多个工具调用的耗时接近最慢的工具,结果顺序与调用顺序一致,
+超时仍在运行的工具不会占满线程池
+
+运行: python tests/test_parallel_tools.py [工具调用数] [单个工具耗时秒数]
+"""
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+
+from src.extend.parallel_tool_node import PARALLEL_SUPPORTED, ParallelToolNode
+
+# 超时用例中慢工具的耗时(远大于超时时间,耗时断言按它的比例计算,留足余量)
+SLOW = 2.0
+
+
+@tool
+def slow_echo(text: str, seconds: float) -> str:
+    """等待指定秒数后返回文本"""
+    time.sleep(seconds)
+    return text
+
+
+def step(calls: list) -> dict:
+    """构造一条包含多个工具调用的模型消息"""
+    return {"messages": [AIMessage(content="", tool_calls=[
+        {"name": "slow_echo", "args": {"text": text, "seconds": seconds}, "id": f"call_{i}"}
+        for i, (text, seconds) in enumerate(calls)
+    ])]}
+
+
+async def _arun(node: ParallelToolNode, calls: list):
+    # 在事件循环内计时(asyncio.run退出时会等待超时后仍在运行的工具线程)
+    start = time.perf_counter()
+    result = await node.ainvoke(step(calls))
+    return result, time.perf_counter() - start
+
+
+def run(node: ParallelToolNode, calls: list, use_async: bool = False):
+    if use_async:
+        result, elapsed = asyncio.run(_arun(node, calls))
+    else:
+        start = time.perf_counter()
+        result = node.invoke(step(calls))
+        elapsed = time.perf_counter() - start
+    return [m.content for m in result["messages"]], elapsed
+
+
+def test_parallel_and_ordered():
+    node = ParallelToolNode([slow_echo])
+    # 耗时不同的调用: 结果仍按调用顺序返回
+    calls = [("a", 0.3), ("b", 0.15), ("c", 0.25), ("d", 0.2)]
+    serialized = sum(seconds for _, seconds in calls)
+    for use_async in (False, True):
+        contents, elapsed = run(node, calls, use_async)
+        assert contents == ["a", "b", "c", "d"]
+        assert elapsed < serialized / 2
+
+
+def test_per_tool_limit():
+    node = ParallelToolNode([slow_echo], limits={"slow_echo": 1})
+    for use_async in (False, True):
+        _, elapsed = run(node, [("a", 0.1), ("b", 0.1), ("c", 0.1)], use_async)
+        assert elapsed >= 0.3
+
+
+def test_timeout():
+    node = ParallelToolNode([slow_echo], timeout=0.2)
+    for use_async in (False, True):
+        contents, elapsed = run(node, [("fast", 0.01), ("slow", SLOW)], use_async)
+        assert contents[0] == "fast" and "超时" in contents[1]
+        assert elapsed < SLOW / 2
+
+
+def test_timed_out_worker_does_not_starve_pool():
+    node = ParallelToolNode([slow_echo], max_workers=1, timeout=0.2)
+    contents, _ = run(node, [("slow", SLOW)])
+    assert "超时" in contents[0]
+    # 超时仍在运行的调用占满线程池: 换用新的线程池,后续调用不排队
+    assert node.abandoned_workers == 0
+    contents, elapsed = run(node, [("a", 0.05)])
+    assert contents == ["a"] and elapsed < SLOW / 2
+
+
+@tool
+def echo(text: str) -> str:
+    """返回文本"""
+    return text
+
+
+def test_busy_tool_limit_times_out():
+    node = ParallelToolNode([slow_echo, echo], max_workers=4, timeout=0.2, limits={"slow_echo": 1})
+    run(node, [("slow", SLOW)])
+    # 唯一的并发名额仍被超时的调用占用: 等待名额也受超时限制,不会一直占用线程
+    contents, elapsed = run(node, [("a", 0.01), ("b", 0.01), ("c", 0.01)])
+    assert all("超时" in content for content in contents) and elapsed < SLOW / 2
+    # 线程池没有被等待名额的调用占满,其他工具照常执行
+    result = node.invoke({"messages": [AIMessage(content="", tool_calls=[
+        {"name": "echo", "args": {"text": "ok"}, "id": "call_echo"}])]})
+    assert result["messages"][0].content == "ok"
+
+
+def test_shutdown_and_reuse():
+    node = ParallelToolNode([slow_echo])
+    run(node, [("a", 0.01), ("b", 0.01)])
+    node.shutdown(wait=True)
+    assert node._executor is None
+    # 关闭后再次执行时重新创建线程池
+    contents, _ = run(node, [("c", 0.01), ("d", 0.01)])
+    assert contents == ["c", "d"]
+
+
+def test_tool_node_internals_available():
+    # 依赖的ToolNode内部方法在当前LangGraph版本中存在(否则退回串行执行)
+    assert PARALLEL_SUPPORTED
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    calls = [(str(i), seconds) for i in range(count)]
+    _, serial = run(ParallelToolNode([slow_echo], limits={"slow_echo": 1}), calls)
+    _, parallel = run(ParallelToolNode([slow_echo], default_limit=count, max_workers=count), calls)
+    print(f"{count} 个工具调用(每个 {seconds}s): 串行 {serial:.2f}s, 并行 {parallel:.2f}s")
@@ -0,0 +1,72 @@
+"""
+提示词前缀测试: 正常对话只在末尾追加消息,摘要折叠/工具变化时记录变化位置
+
+运行: python tests/test_prompt_prefix.py [轮数]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config.config_model import config
+from src.entity.agent.langgraph_agent import Langgraph_Agent
+from src.extend.openai.prompt_prefix import PromptAssembler
+from src.extend.tool import list_files, read_file
+from tests.fake_model import FakeLLM_Model
+
+
+def test_append_only_turns_keep_prefix():
+    assembler = PromptAssembler()
+    history = []
+    for i in range(3):
+        messages = assembler.assemble("t", "system", history, f"q{i}")
+        assert messages[0] == ("system", "system") and messages[-1] == ("user", f"q{i}")
+        history += [("user", f"q{i}"), ("assistant", f"a{i}")]
+    stats = assembler.get_stats("t")
+    assert stats["turns"] == 2 and stats["stable"] == 2 and stats["changes"] == 0
+    assert 0 < stats["reuse_rate"] < 1
+
+
+def test_changes_are_attributed():
+    assembler = PromptAssembler()
+    history = [("user", "q0"), ("assistant", "a0")]
+    assembler.assemble("t", "system", history, "q1")
+    # 摘要折叠: 旧原文被替换为摘要块
+    history = [("system", "summary"), ("user", "q1"), ("assistant", "a1")]
+    assembler.assemble("t", "system", history, "q2")
+    assembler.set_tools([list_files])
+    assembler.assemble("t", "system", history + [("user", "q2"), ("assistant", "a2")], "q3")
+    assembler.assemble("t", "other system", [], "q4")
+    assert assembler.get_stats("t")["causes"] == {"summary": 1, "tools": 1, "system": 1}
+    assert assembler.get_stats()["changes"] == 3
+
+
+def test_tool_order_does_not_change_prefix():
+    assembler = PromptAssembler()
+    assembler.set_tools([list_files, read_file])
+    history = [("user", "q0"), ("assistant", "a0")]
+    assembler.assemble("t", "system", history, "q1")
+    # 同一组工具换了顺序: 与graph缓存一样视为相同的工具定义
+    assembler.set_tools([read_file, list_files])
+    assembler.assemble("t", "system", history + [("user", "q1"), ("assistant", "a1")], "q2")
+    assert assembler.get_stats("t")["stable"] == 1
+
+
+def test_agent_prefix_stats():
+    agent = Langgraph_Agent(FakeLLM_Model(echo=True), tools=[list_files, read_file], system_prompt="system")
+    for i in range(3):
+        agent.invoke(f"q{i}", thread_id="prefix")
+    stats = agent.get_prefix_stats("prefix")
+    assert stats["turns"] == 2 and stats["stable"] == 2
+
+
+if __name__ == "__main__":
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    # 超过token上限时由假模型生成摘要
+    config.summary_model = FakeLLM_Model()
+    agent = Langgraph_Agent(FakeLLM_Model(echo=True), tools=[list_files, read_file], system_prompt="system " * 200)
+    for i in range(turns):
+        agent.invoke(f"问题{i} " + "内容" * 100, thread_id="bench")
+    stats = agent.get_prefix_stats("bench")
+    print(f"{turns} 轮: 前缀保持 {stats['stable']}/{stats['turns']}, 变化 {stats['causes']}, "
+          f"可复用token占比 {stats['reuse_rate']:.0%}")
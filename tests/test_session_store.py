@@ -0,0 +1,104 @@
+"""
+会话存储接口测试: 文件与SQLite后端的读写、整体保存、删除、重命名(含改为同名)与会话列表顺序一致
+
+运行: python tests/test_session_store.py [会话数]
+"""
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from src.extend.store.file_store import FileSessionStore
+from src.extend.store.sql_store import SQLiteSessionStore
+
+BACKENDS = ["file", "sqlite"]
+
+
+def new_store(backend: str, directory: str):
+    if backend == "file":
+        return FileSessionStore(directory)
+    return SQLiteSessionStore(os.path.join(directory, "memory.db"))
+
+
+@pytest.fixture(params=BACKENDS)
+def store(request, tmp_path):
+    store = new_store(request.param, str(tmp_path))
+    yield store
+    store.close()
+
+
+def test_append_save_load(store):
+    assert store.load("s") == [] and not store.exists("s")
+    store.append("s", [("user", "q1"), ("assistant", "a1")])
+    store.append("s", [("user", "q2")])
+    store.append("s", [])
+    assert store.exists("s")
+    assert store.load("s") == [["user", "q1"], ["assistant", "a1"], ["user", "q2"]]
+    store.save("s", [("system", "摘要"), ("user", "q2")])
+    store.append("s", [("assistant", "a2")])
+    assert store.load("s") == [["system", "摘要"], ["user", "q2"], ["assistant", "a2"]]
+
+
+def test_delete(store):
+    store.append("s", [("user", "q")])
+    assert store.delete("s") and not store.exists("s") and store.load("s") == []
+    assert not store.delete("s")
+    assert store.list_sessions() == []
+
+
+def test_rename(store):
+    store.append("old", [("user", "q")])
+    assert store.rename("old", "new")
+    assert not store.exists("old") and store.load("new") == [["user", "q"]]
+    assert store.list_sessions() == ["new"]
+    # 改为同名视为成功,不存在的会话返回False
+    assert store.rename("new", "new") and store.load("new") == [["user", "q"]]
+    assert not store.rename("missing", "other") and not store.exists("other")
+    # 重命名后继续追加
+    store.append("new", [("assistant", "a")])
+    assert store.load("new") == [["user", "q"], ["assistant", "a"]]
+
+
+def test_list_order_is_by_name(store):
+    for name in ("会话_b", "会话_a", "新会话_1", "a"):
+        store.append(name, [("user", name)])
+        time.sleep(0.001)
+    # 最近更新的会话不会排到前面,两种后端顺序一致
+    store.append("会话_b", [("assistant", "更新")])
+    assert store.list_sessions() == sorted(["会话_b", "会话_a", "新会话_1", "a"])
+
+
+def test_reopen_keeps_sessions(tmp_path):
+    for backend in BACKENDS:
+        directory = str(tmp_path / backend)
+        store = new_store(backend, directory)
+        store.append("s", [("user", "q")])
+        store.close()
+        reopened = new_store(backend, directory)
+        assert reopened.list_sessions() == ["s"] and reopened.load("s") == [["user", "q"]]
+        reopened.close()
+
+
+if __name__ == "__main__":
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    for backend in BACKENDS:
+        with tempfile.TemporaryDirectory() as directory:
+            store = new_store(backend, directory)
+            start = time.perf_counter()
+            for i in range(sessions):
+                store.append(f"s{i}", [("user", "问题"), ("assistant", "回答")])
+            appended = time.perf_counter() - start
+            start = time.perf_counter()
+            store.list_sessions()
+            listed = time.perf_counter() - start
+            start = time.perf_counter()
+            for i in range(sessions):
+                store.rename(f"s{i}", f"r{i}")
+            renamed = time.perf_counter() - start
+            print(f"{backend}: 追加 {appended / sessions * 1000:.3f} ms/会话, 列出 {listed * 1000:.2f} ms, "
+                  f"重命名 {renamed / sessions * 1000:.3f} ms/次")
+            store.close()
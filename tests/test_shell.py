@@ -0,0 +1,123 @@
+"""
+命令执行测试: 实时输出、超时结束进程组、输出上限、常驻shell保留状态与出错后重建
+
+运行: python tests/test_shell.py [命令数]
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from src.extend.shell import IS_WINDOWS, ShellPool, ShellSession, run_command, arun_command
+
+posix_only = pytest.mark.skipif(IS_WINDOWS, reason="常驻shell仅支持Linux/macOS")
+
+
+def test_streams_output_incrementally():
+    chunks = []
+    result = run_command("echo first; sleep 0.3; echo second", timeout=5,
+                         on_output=lambda text: chunks.append((time.monotonic(), text)))
+    assert result == "first\nsecond"
+    # 第一行在命令结束前就已回调
+    assert len(chunks) >= 2 and chunks[-1][0] - chunks[0][0] >= 0.2
+
+
+def test_timeout_kills_process_group():
+    start = time.monotonic()
+    result = run_command("sleep 30 & sleep 30; echo never", timeout=0.5)
+    assert time.monotonic() - start < 5
+    assert "超时" in result and "never" not in result
+
+
+def test_output_limit_and_exit_code():
+    result = run_command("yes x | head -n 5000; exit 3", limit=100)
+    assert result.startswith("x\nx") and "已省略 9900 字符" in result and "退出码: 3" in result
+
+
+def test_async_timeout():
+    async def run():
+        start = time.monotonic()
+        result = await arun_command("sleep 30", timeout=0.3)
+        return result, time.monotonic() - start
+
+    result, elapsed = asyncio.run(run())
+    assert "超时" in result and elapsed < 5
+
+
+@posix_only
+def test_session_keeps_state():
+    session = ShellSession()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            session.run(f"cd {directory} && export GREETING=hello")
+            assert session.run("pwd").endswith(os.path.basename(directory))
+            assert session.run("echo $GREETING") == "hello"
+            assert "退出码: 2" in session.run("false; (exit 2)")
+    finally:
+        session.close()
+
+
+@posix_only
+def test_session_restarts_after_timeout():
+    session = ShellSession()
+    try:
+        session.run("export GREETING=hello")
+        assert "超时" in session.run("sleep 30", timeout=0.3)
+        # shell已被结束,下一条命令在新的shell中执行
+        assert session.run("echo ${GREETING:-reset}") == "reset"
+    finally:
+        session.close()
+
+
+@posix_only
+def test_session_restarts_after_syntax_error():
+    session = ShellSession()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            session.run(f"cd {directory}")
+            # 引号不配对: 不会一直等待结束标记直到超时
+            start = time.monotonic()
+            result = session.run('echo "unterminated', timeout=5)
+            assert time.monotonic() - start < 2 and "超时" not in result
+            # shell报错退出或继续可用,下一条命令都能正常执行
+            assert session.run("echo ok") == "ok"
+            assert session.run("echo 'it''s' \"quoted\"") == "its quoted"
+    finally:
+        session.close()
+
+
+@posix_only
+def test_pool_falls_back_when_busy():
+    pool = ShellPool(max_sessions=1)
+    try:
+        assert pool.run(None, "echo x") is None
+        assert pool.run("a", "echo a") == "a"
+        session = pool._session("a")
+        with session.lock:
+            assert pool.run("a", "echo a") is None
+        pool.run("b", "echo b")
+        assert list(pool._sessions) == ["b"]
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    start = time.perf_counter()
+    for i in range(count):
+        run_command(f"echo {i}")
+    one_shot = time.perf_counter() - start
+
+    pool = ShellPool()
+    start = time.perf_counter()
+    for i in range(count):
+        pool.run("bench", f"echo {i}")
+    persistent = time.perf_counter() - start
+    pool.close()
+    print(f"{count} 条命令: 每次启动进程 {one_shot:.2f}s ({one_shot / count * 1000:.1f} ms/条), "
+          f"常驻shell {persistent:.2f}s ({persistent / count * 1000:.1f} ms/条)")
@@ -0,0 +1,52 @@
+"""
+摘要智能体复用基准: 对比每次摘要重新构建模型与执行图 / 复用缓存的构建耗时
+
+运行: python tests/test_summarizer_cache.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph.prebuilt import create_react_agent
+
+from src.extend.openai.summarizer import get_summarizer, clear_summarizers
+from tests.fake_model import FakeLLM_Model
+
+
+def build_every_time(model: FakeLLM_Model):
+    """旧实现: 每次摘要重新创建模型与执行图"""
+    return create_react_agent(model=model.init_model(), tools=[])
+
+
+def bench(factory, model: FakeLLM_Model, rounds: int) -> float:
+    """返回单次构建的平均耗时(毫秒)"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        factory(model)
+    return (time.perf_counter() - start) * 1000 / rounds
+
+
+def test_summarizer_is_reused():
+    clear_summarizers()
+    model = FakeLLM_Model()
+    assert get_summarizer(model) is get_summarizer(FakeLLM_Model())
+    assert get_summarizer(model) is not get_summarizer(FakeLLM_Model(model_name="other"))
+
+
+def test_summarizer_invoke():
+    clear_summarizers()
+    result = get_summarizer(FakeLLM_Model()).invoke({"messages": [("user", "hi")]})
+    assert result["messages"][-1].content == "ok"
+
+
+if __name__ == "__main__":
+    rounds = 50
+    model = FakeLLM_Model()
+    clear_summarizers()
+    before = bench(build_every_time, model, rounds)
+    after = bench(get_summarizer, model, rounds)
+    print(f"每次重建: {before:.3f} ms/次")
+    print(f"复用缓存: {after:.3f} ms/次")
+    print(f"加速比: {before / max(after, 1e-6):.0f}x")
@@ -0,0 +1,212 @@
+"""
+后台摘要测试: 软阈值后台摘要、硬阈值阻塞等待、摘要期间新增消息的原子替换、摘要失败时的回退、
+折叠边界与摘要块合并
+
+运行: python tests/test_summarizing_memory.py [摘要延迟秒数]
+"""
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from src.config.config_model import config
+from src.extend.openai.summarizer import clear_summarizers
+from src.extend.openai.summarizing_memory import MemoryThread, token_counter
+from tests.fake_model import FakeLLM_Model
+
+QUESTION = "问题" * 10
+ANSWER = "回答" * 10
+
+
+@pytest.fixture(autouse=True)
+def small_limits(monkeypatch):
+    """较小的token上限与假摘要模型(每轮约50 token,硬阈值约为3轮)"""
+    monkeypatch.setattr(config, "max_token_limit", 150)
+    monkeypatch.setattr(config, "summary_soft_ratio", 0.5)
+    monkeypatch.setattr(config, "summary_keep_turns", 1)
+    monkeypatch.setattr(config, "summary_max_blocks", 4)
+    monkeypatch.setattr(config, "summary_model", FakeLLM_Model(responses=("摘要",)))
+
+
+def new_thread(turns: int) -> MemoryThread:
+    thread = MemoryThread("summary")
+    for _ in range(turns):
+        thread.add_message("user", QUESTION)
+        thread.add_message("assistant", ANSWER)
+    return thread
+
+
+def wait_summary(thread: MemoryThread):
+    future = thread._summary_future
+    if future is not None:
+        future.result()
+
+
+def test_below_soft_limit_does_not_summarize():
+    thread = new_thread(1)
+    assert thread.get_history() == [("user", QUESTION), ("assistant", ANSWER)]
+    assert thread.summary_stats.scheduled == 0
+
+
+def test_soft_limit_summarizes_in_background(monkeypatch):
+    monkeypatch.setattr(config, "summary_model", FakeLLM_Model(responses=("摘要",), latency=0.2))
+    thread = new_thread(2)
+    assert config.max_token_limit * config.summary_soft_ratio < thread.token_total <= config.max_token_limit
+    start = time.monotonic()
+    history = thread.get_history()
+    # 本轮不等待摘要,仍使用未压缩的历史
+    assert time.monotonic() - start < 0.1 and len(history) == 4
+    assert thread.summary_stats.scheduled == 1 and thread.summary_stats.blocking_waits == 0
+    wait_summary(thread)
+    assert thread.get_history() == [("system", "摘要"), ("user", QUESTION), ("assistant", ANSWER)]
+    assert thread.summary_stats.completed == 1
+
+
+def test_hard_limit_blocks_until_summary():
+    thread = new_thread(4)
+    assert thread.token_total > config.max_token_limit
+    history = thread.get_history()
+    assert history == [("system", "摘要"), ("user", QUESTION), ("assistant", ANSWER)]
+    stats = thread.summary_stats
+    assert stats.blocking_waits == 1 and stats.blocking_wait_seconds > 0 and stats.completed == 1
+
+
+def test_messages_added_during_summary_are_kept(monkeypatch):
+    monkeypatch.setattr(config, "summary_model", FakeLLM_Model(responses=("摘要",), latency=0.2))
+    thread = new_thread(2)
+    thread.get_history()
+    # 摘要进行中新增的一轮不属于本次摘要,替换后保持原样
+    thread.add_message("user", "新问题")
+    thread.add_message("assistant", "新回答")
+    wait_summary(thread)
+    assert thread.get_history()[:1] == [("system", "摘要")]
+    assert thread.history_memory == [("user", QUESTION), ("assistant", ANSWER),
+                                     ("user", "新问题"), ("assistant", "新回答")]
+
+
+def test_reload_during_summary_discards_result(monkeypatch):
+    monkeypatch.setattr(config, "summary_model", FakeLLM_Model(responses=("摘要",), latency=0.2))
+    thread = new_thread(2)
+    thread.get_history()
+    thread._set_history([("user", "重新加载")])
+    wait_summary(thread)
+    assert thread.summaries == [] and thread.history_memory == [("user", "重新加载")]
+    assert thread.summary_stats.discarded == 1
+
+
+def test_hard_limit_failure_falls_back_to_full_history(monkeypatch):
+    thread = new_thread(4)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("摘要模型不可用")
+
+    monkeypatch.setattr(thread, "_create_summary", fail)
+    history = thread.get_history()
+    assert len(history) == 8 and history[0] == ("user", QUESTION)
+    stats = thread.summary_stats
+    assert stats.failures == 1 and stats.last_error == "摘要模型不可用" and stats.blocking_waits == 1
+    # 下一次仍可重新调度
+    assert thread._summary_future is None
+
+
+def test_concurrent_blocking_waits_are_counted(monkeypatch):
+    monkeypatch.setattr(config, "summary_model", FakeLLM_Model(responses=("摘要",), latency=0.1))
+    thread = new_thread(4)
+    workers = [threading.Thread(target=thread.get_history) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert thread.summary_stats.blocking_waits == 8
+
+
+def test_fold_index_boundaries(monkeypatch):
+    thread = MemoryThread("fold")
+    assert thread._fold_index() == 0
+    # 只有助手/摘要消息时没有可折叠的轮次
+    thread.history_memory = [("assistant", "a")]
+    assert thread._fold_index() == 0
+    thread.history_memory = [("user", "q1"), ("assistant", "a1")]
+    # 轮数不足时至少保留最后一轮
+    assert thread._fold_index() == 0
+    thread.history_memory += [("user", "q2"), ("assistant", "a2"), ("user", "q3")]
+    assert thread._fold_index() == 4
+    monkeypatch.setattr(config, "summary_keep_turns", 2)
+    assert thread._fold_index() == 2
+    monkeypatch.setattr(config, "summary_keep_turns", 0)
+    # 保留轮数小于1时按1处理
+    assert thread._fold_index() == 4
+    monkeypatch.setattr(config, "summary_keep_turns", 3)
+    assert thread._fold_index() == 4
+
+
+def test_fold_does_not_split_tool_call_pair():
+    thread = MemoryThread("fold-tools")
+    thread._set_history([("user", "查一下a"), ("assistant", "调用lookup"), ("tool", "value-of-a"),
+                         ("assistant", "a的值"), ("user", "再查b"), ("assistant", "调用lookup"),
+                         ("tool", "value-of-b"), ("assistant", "b的值")])
+    # 折叠位置落在用户消息上,工具调用与工具结果不会被分到两侧
+    count = thread._fold_index()
+    assert count == 4 and thread.history_memory[count][0] == "user"
+    thread._apply_fold(count, "摘要", replace_last=False)
+    assert thread.summaries == ["摘要"]
+    assert [role for role, _ in thread.history_memory] == ["user", "assistant", "tool", "assistant"]
+    assert thread._token_counts == [token_counter.count_message(role, content)
+                                    for role, content in thread.history_memory]
+    assert thread.token_total == sum(thread._token_counts) + sum(thread._summary_tokens) and thread._needs_reset
+
+
+def test_apply_fold_accumulates_into_last_block():
+    thread = new_thread(3)
+    thread._apply_fold(2, "摘要1", replace_last=False)
+    thread._apply_fold(2, "摘要1+2", replace_last=True)
+    # 继续累积时替换最后一个摘要块,不新增块
+    assert thread.summaries == ["摘要1+2"] and len(thread._summary_tokens) == 1
+    assert thread.history_memory == [("user", QUESTION), ("assistant", ANSWER)]
+
+
+def test_blocks_merge_when_over_limit(monkeypatch):
+    monkeypatch.setattr(config, "summary_max_blocks", 2)
+    # 摘要智能体按模型配置缓存,清空后假模型从第一条回复开始
+    clear_summarizers()
+    monkeypatch.setattr(config, "summary_model", FakeLLM_Model(responses=("新块", "合并")))
+    thread = new_thread(2)
+    # 已冻结的摘要块(超过块预算,不再在其上累积)
+    frozen = ["旧摘要" * 40, "次旧摘要" * 40]
+    thread._set_history([("system", block) for block in frozen] + thread._compose())
+    thread._schedule_summary().result()
+    # 新块加入后超过块数上限,较旧的块合并为一个更高层级的摘要
+    assert thread.summaries == ["合并", "新块"]
+    assert thread._summary_tokens == [token_counter.count_message("system", s) for s in thread.summaries]
+    assert thread.token_total == sum(thread._summary_tokens) + sum(thread._token_counts)
+    assert thread.summary_stats.completed == 1
+
+
+def test_merge_discarded_when_blocks_changed():
+    thread = new_thread(1)
+    thread._set_history([("system", "块1"), ("system", "块2"), ("user", "q")])
+    generation = thread._generation
+    thread.summaries[0] = "被改写"
+    thread._merge_blocks(["块1"], generation)
+    assert thread.summaries == ["被改写", "块2"] and thread.summary_stats.discarded == 1
+
+
+if __name__ == "__main__":
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+    config.max_token_limit, config.summary_soft_ratio, config.summary_keep_turns = 150, 0.5, 1
+    config.summary_model = FakeLLM_Model(responses=("摘要",), latency=latency)
+    # 每轮取历史的耗时: 软阈值提前在后台摘要,只有超过硬阈值时才阻塞
+    thread, waits = MemoryThread("bench"), []
+    for _ in range(20):
+        start = time.monotonic()
+        thread.get_history()
+        waits.append(time.monotonic() - start)
+        thread.add_message("user", QUESTION)
+        thread.add_message("assistant", ANSWER)
+        time.sleep(latency / 2)
+    print(f"每轮取历史: 最大 {max(waits) * 1000:.1f} ms, 平均 {sum(waits) / len(waits) * 1000:.1f} ms")
+    print(thread.summary_stats)
@@ -0,0 +1,89 @@
+"""
+token计数测试: 离线估算(CJK与其他字符)、分词器选择与回退、MemoryThread的增量token总数
+
+运行: python tests/test_token_counter.py [消息数]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.extend.openai import token_counter as token_counter_module
+from src.extend.openai.token_counter import MESSAGE_OVERHEAD, TokenCounter, estimate_tokens
+from src.extend.openai.summarizing_memory import MemoryThread, token_counter
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0 and estimate_tokens(None) == 0
+    # 其他字符按4个字符1个token向上取整
+    assert estimate_tokens("abcd") == 1 and estimate_tokens("abcde") == 2
+    # CJK字符(汉字、假名、韩文、全角标点)各按1个token计
+    assert estimate_tokens("你好") == 2
+    assert estimate_tokens("こんにちは") == 5 and estimate_tokens("안녕") == 2
+    assert estimate_tokens("你好，") == 3
+    assert estimate_tokens("你好 world") == 2 + 2
+
+
+def test_count_message_includes_overhead():
+    counter = TokenCounter()
+    assert counter.count(None) == 0
+    assert counter.count_message("user", "你好") == estimate_tokens("user") + 2 + MESSAGE_OVERHEAD
+    custom = TokenCounter(len)
+    assert custom.count_message("ai", "abc") == 2 + 3 + MESSAGE_OVERHEAD
+
+
+def test_from_name_falls_back_to_estimate(monkeypatch):
+    assert TokenCounter.from_name("estimate").tokenizer is estimate_tokens
+    assert TokenCounter.from_name("").tokenizer is estimate_tokens
+    requested = []
+
+    def fake_loader(name):
+        requested.append(name)
+        return len if name == "cl100k_base" else None
+
+    monkeypatch.setattr(token_counter_module, "_load_tiktoken", fake_loader)
+    assert TokenCounter.from_name("tiktoken").tokenizer is len
+    # 分词器不可用(未安装或无法下载编码)时回退到离线估算
+    assert TokenCounter.from_name("tiktoken:o200k_base").tokenizer is estimate_tokens
+    assert requested == ["cl100k_base", "o200k_base"]
+
+
+def full_count(thread: MemoryThread) -> int:
+    """按当前历史重新计算的token总数"""
+    return (sum(token_counter.count_message(role, content) for role, content in thread.history_memory) +
+            sum(token_counter.count_message("system", s) for s in thread.summaries))
+
+
+def test_memory_thread_token_total_is_incremental():
+    thread = MemoryThread("tokens")
+    assert thread.token_total == 0
+    thread.add_message("user", "你好")
+    thread.add_message("assistant", "hello world")
+    assert thread.token_total == full_count(thread)
+    assert thread._token_counts == [token_counter.count_message("user", "你好"),
+                                    token_counter.count_message("assistant", "hello world")]
+    # 整体替换历史(开头的system为摘要块)
+    thread._set_history([("system", "摘要"), ("user", "问题"), ("assistant", "回答")])
+    assert thread.token_total == full_count(thread) and thread._summary_tokens
+    # 摘要折叠与替换最后一个摘要块后总数保持一致
+    thread.add_message("user", "新问题")
+    thread._apply_fold(2, "新的摘要", replace_last=True)
+    assert thread.summaries == ["新的摘要"] and thread.history_memory == [("user", "新问题")]
+    assert thread.token_total == full_count(thread)
+    thread.clear_history()
+    assert thread.token_total == 0 and thread._token_counts == [] and thread._summary_tokens == []
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    thread = MemoryThread("bench")
+    start = time.perf_counter()
+    for i in range(count):
+        thread.add_message("user", "问题" * 50)
+    incremental = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(100):
+        full_count(thread)
+    recount = (time.perf_counter() - start) / 100
+    print(f"增量累计: {incremental / count * 1e6:.2f} µs/条, 全量重算({count}条): {recount * 1000:.2f} ms/次")
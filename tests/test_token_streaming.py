@@ -0,0 +1,72 @@
+"""
+invoke逐token回调测试: token增量拼接为完整回复、已逐token输出的回复不再整条回调、工具调用步骤照常回调
+
+运行: python tests/test_token_streaming.py [回复字数]
+"""
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage
+
+from src.entity.agent.langgraph_agent import Langgraph_Agent
+from src.extend.tool import list_files
+from tests.fake_model import FakeLLM_Model
+
+ANSWER = "这是一段需要逐token输出的较长回复。"
+
+
+def collect(agent: Langgraph_Agent, stream_tokens: bool, thread_id: str):
+    events = []
+    result = agent.invoke("你好", thread_id=thread_id, stream_tokens=stream_tokens,
+                          stream_func=lambda role, content: events.append((role, content)))
+    return result, events
+
+
+def test_tokens_are_streamed_once():
+    agent = Langgraph_Agent(FakeLLM_Model(responses=(ANSWER,)), tools=[list_files])
+    result, events = collect(agent, True, "tokens")
+    tokens = [content for role, content in events if role == "token"]
+    assert len(tokens) > 1 and "".join(tokens) == ANSWER == result.last_message
+    # 已逐token输出的回复不再整条回调
+    assert [role for role, _ in events if role != "token"] == []
+
+    _, events = collect(agent, False, "steps")
+    assert events == [("ai", ANSWER)]
+
+
+def test_tool_steps_still_reported():
+    tool_call = AIMessage(content="", tool_calls=[{"name": "list_files", "args": {"directory": "."}, "id": "c1"}])
+    agent = Langgraph_Agent(FakeLLM_Model(responses=(tool_call, ANSWER)), tools=[list_files])
+    result, events = collect(agent, True, "tools")
+    roles = [role for role, _ in events]
+    assert roles[:2] == ["ai", "tool"] and set(roles[2:]) == {"token"}
+    assert result.last_message == ANSWER
+
+
+def test_async_tokens():
+    agent = Langgraph_Agent(FakeLLM_Model(responses=(ANSWER,)), tools=[list_files])
+    tokens = []
+
+    async def run():
+        return await agent.ainvoke("你好", thread_id="async", stream_tokens=True,
+                                   stream_func=lambda role, content: tokens.append(content))
+
+    assert asyncio.run(run()).last_message == "".join(tokens) == ANSWER
+
+
+if __name__ == "__main__":
+    length = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    # 每4个字符一个分块,每个分块10ms
+    model = FakeLLM_Model(responses=("字" * length,), latency=0.2, chunk_latency=0.01)
+    agent = Langgraph_Agent(model, tools=[list_files])
+    for stream_tokens in (False, True):
+        start = time.perf_counter()
+        first = []
+        agent.invoke("你好", thread_id=f"bench-{stream_tokens}", stream_tokens=stream_tokens,
+                     stream_func=lambda role, content: first or first.append(time.perf_counter() - start))
+        total = time.perf_counter() - start
+        print(f"{'逐token' if stream_tokens else '按步骤'}: 首次输出 {first[0] * 1000:.0f} ms, 完成 {total * 1000:.0f} ms")
@@ -0,0 +1,64 @@
+"""
+工具结果缓存测试: 同一会话重复读取命中缓存,文件变化/写文件/执行命令后失效,会话之间相互隔离
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.extend.tool import list_files, read_file, write_file
+from src.extend.tool_memo import tool_memo, current_thread_id
+
+
+def read(path: str) -> str:
+    return read_file.invoke({"file_path": path})
+
+
+def test_read_file_memoized_and_invalidated():
+    events = []
+    listener = lambda event, name, stats: events.append((event, name))
+    tool_memo.add_listener(listener)
+    try:
+        check_read_file(events)
+    finally:
+        tool_memo._listeners.remove(listener)
+
+
+def check_read_file(events: list):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "a.txt")
+        write_file.invoke({"file_path": path, "content": "v1"})
+        current_thread_id.set("memo-test")
+        before = tool_memo.get_stats()
+
+        assert read(path) == "v1"
+        assert read(path) == "v1"
+        assert tool_memo.get_stats()["hits"] == before["hits"] + 1
+        assert events[-1] == ("TOOL_CACHE_HIT", "read_file")
+
+        # 通过工具写文件: 清空当前会话缓存
+        write_file.invoke({"file_path": path, "content": "v2"})
+        assert events[-1] == ("TOOL_CACHE_CLEAR", "write_file")
+        assert read(path) == "v2"
+
+        # 绕过工具修改文件: 文件指纹变化,缓存失效
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("v3-longer")
+        assert read(path) == "v3-longer"
+        assert tool_memo.get_stats()["stale"] == before["stale"] + 1
+
+        # 其他会话不共享缓存
+        current_thread_id.set("memo-other")
+        misses = tool_memo.get_stats()["misses"]
+        assert read(path) == "v3-longer"
+        assert tool_memo.get_stats()["misses"] == misses + 1
+
+
+def test_list_files_sees_new_entries():
+    with tempfile.TemporaryDirectory() as directory:
+        current_thread_id.set("memo-list")
+        assert list_files.invoke({"directory": directory}) == ""
+        open(os.path.join(directory, "new.txt"), "w").close()
+        assert list_files.invoke({"directory": directory}) == "new.txt"
+        assert list_files.metadata["idempotent"]
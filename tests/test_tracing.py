@@ -0,0 +1,126 @@
+"""
+调用追踪测试: 每轮对话/模型调用/工具调用的span与父子关系、按会话的环形缓冲区、OTLP/JSON导出
+
+运行: python tests/test_tracing.py [span数]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+
+from src.entity.agent.langgraph_agent import Langgraph_Agent
+from src.extend.tool import list_files
+from src.extend.tracing import SPAN_INVOKE, SPAN_MODEL, SPAN_TOOL, Tracer, tracer
+from tests.fake_model import FakeLLM_Model
+
+TOOL_CALL = AIMessage(content="", tool_calls=[{"name": "list_files", "args": {"directory": "."}, "id": "c1"}])
+BAD_TOOL_CALL = AIMessage(content="", tool_calls=[{"name": "broken_tool", "args": {}, "id": "c2"}])
+
+
+@tool
+def broken_tool() -> str:
+    """总是出错的工具"""
+    raise ValueError("broken")
+
+
+def test_ring_buffer_per_session():
+    t = Tracer(buffer_size=3, max_sessions=2)
+    for i in range(5):
+        t.record_event(f"e{i}", "a")
+    t.record_event("b0", "b")
+    assert [s.name for s in t.get_spans("a")] == ["e2", "e3", "e4"]
+    assert [s.name for s in t.get_spans("b")] == ["b0"]
+    # 超出会话数时淘汰最久未使用的会话
+    t.record_event("c0", "c")
+    assert t.get_spans("a") == [] and len(t.get_spans()) == 2
+    t.clear("b")
+    assert [s.name for s in t.get_spans()] == ["c0"]
+
+
+def test_nested_spans_and_errors():
+    t = Tracer()
+    try:
+        with t.span("outer", SPAN_INVOKE, "s") as outer:
+            with t.span("inner", SPAN_TOOL, parent=outer) as inner:
+                pass
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    assert inner.trace_id == outer.trace_id and inner.parent_id == outer.span_id
+    assert inner.thread_id == "s" and outer.error == "ValueError: boom"
+    assert outer.duration >= inner.duration >= 0
+    assert [log["level"] for log in t.get_logs("s")] == ["TOOL_CALL", "ERROR"]
+
+    disabled = Tracer(enabled=False)
+    disabled.record_event("e", "s")
+    assert disabled.get_spans() == [] and disabled.callbacks(outer) == []
+
+
+def test_agent_turn_spans():
+    agent = Langgraph_Agent(FakeLLM_Model(responses=(TOOL_CALL, BAD_TOOL_CALL, "完成")),
+                            tools=[list_files, broken_tool])
+    agent.invoke("列出文件", thread_id="trace-invoke")
+    spans = tracer.get_spans("trace-invoke")
+    assert [s.kind for s in spans] == [SPAN_MODEL, SPAN_TOOL, SPAN_MODEL, SPAN_TOOL, SPAN_MODEL, SPAN_INVOKE]
+    root = spans[-1]
+    assert root.attributes["output"] == "完成" and root.attributes["route"] == "default"
+    assert all(s.parent_id == root.span_id and s.trace_id == root.trace_id for s in spans[:-1])
+    assert spans[1].name == "list_files" and spans[1].error is None
+    # 工具调用出错时span记录为失败
+    assert spans[3].name == "broken_tool" and "broken" in spans[3].error
+
+    async def run():
+        return [event async for event in agent.astream("你好", thread_id="trace-astream")]
+
+    asyncio.run(run())
+    assert tracer.get_spans("trace-astream")[-1].kind == SPAN_INVOKE
+
+
+def test_otlp_export(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    t = Tracer(export_path=str(path))
+    with t.span("invoke", SPAN_INVOKE, "s", input="你好") as root:
+        t.end_span(t.start_span("model", SPAN_MODEL, parent=root, input_tokens=3))
+    t.record_event("hit", "s")
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 2
+    spans = json.loads(lines[0])["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [s["name"] for s in spans] == ["model", "invoke"]
+    assert spans[0]["parentSpanId"] == spans[1]["spanId"] and spans[0]["traceId"] == spans[1]["traceId"]
+    assert {"key": "input_tokens", "value": {"intValue": "3"}} in spans[0]["attributes"]
+    assert int(spans[1]["endTimeUnixNano"]) >= int(spans[1]["startTimeUnixNano"])
+    assert t.get_export_stats() == {"exports": 2, "failures": 0, "last_error": None}
+
+
+def test_export_failure_is_recorded(tmp_path, capsys):
+    # 导出目录不存在: 记录失败次数与原因,不输出到标准输出
+    t = Tracer(export_path=str(tmp_path / "missing" / "traces.jsonl"))
+    t.record_event("hit", "s")
+    stats = t.get_export_stats()
+    assert stats["exports"] == 0 and stats["failures"] == 1 and stats["last_error"]
+    assert capsys.readouterr().out == ""
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    t = Tracer(buffer_size=1000)
+    start = time.perf_counter()
+    for i in range(count):
+        with t.span("tool", SPAN_TOOL, "bench", input="{'directory': '.'}"):
+            pass
+    elapsed = time.perf_counter() - start
+    print(f"{count} 个span: {elapsed * 1e6 / count:.2f} us/span, 缓冲区 {len(t.get_spans('bench'))} 条")
+
+    agent = Langgraph_Agent(FakeLLM_Model(responses=(TOOL_CALL, "完成")), tools=[list_files])
+    for enabled in (False, True):
+        tracer.enabled = enabled
+        start = time.perf_counter()
+        for i in range(50):
+            agent.invoke("列出文件", thread_id=f"bench-{enabled}")
+        print(f"追踪{'开启' if enabled else '关闭'}: {(time.perf_counter() - start) / 50 * 1000:.2f} ms/轮")
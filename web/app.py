@@ -1,6 +1,5 @@
 import os
 from flask import Flask
-from .utils import recursion_logger
 from .routes import main_bp
 
 # 初始化Flask应用
@@ -0,0 +1,144 @@
+"""
+ASGI入口
+
+/send_message 与 /stream_message 直接使用智能体的异步接口(ainvoke/astream),
+等待模型I/O期间不占用线程,单进程即可同时处理大量对话;
+其余路由通过 WsgiToAsgi 交给Flask应用处理。
+"""
+import io
+import asyncio
+from urllib.parse import unquote
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import Response, jsonify, request, session
+
+from . import routes
+from .app import app
+from .utils import format_sse
+
+# 其余路由交给Flask(在线程池中执行)
+wsgi_app = WsgiToAsgi(app)
+
+
+def _build_environ(scope, body: bytes) -> dict:
+    """根据ASGI请求构造WSGI environ,以便复用Flask的会话与表单解析"""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": unquote(scope["path"]),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": io.StringIO(),
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").upper().replace("-", "_")
+        value = value.decode("latin1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _read_body(receive) -> bytes:
+    """读取完整请求体"""
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _start_response(send, response: Response):
+    """发送响应头(写入Flask会话cookie)"""
+    app.session_interface.save_session(app, session, response)
+    await send({
+        "type": "http.response.start",
+        "status": response.status_code,
+        "headers": [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in response.headers.items()],
+    })
+
+
+async def send_message(send):
+    """发送消息并获取回复(异步)"""
+    try:
+        message = request.form.get('message', '')
+        current_session = session.get('session_id')
+        # 准备与记录会话会读写存储,放到线程池中执行,避免阻塞事件循环
+        await asyncio.to_thread(routes.prepare_thread, current_session)
+        response_text = routes.response_to_text(await routes.agent.ainvoke(message, thread_id=current_session))
+        await asyncio.to_thread(routes.record_turn, current_session, message, response_text)
+        response = jsonify({'response': response_text})
+    except Exception as e:
+        response = jsonify({'response': f'发生错误: {str(e)}'})
+        response.status_code = 500
+    await _start_response(send, response)
+    await send({"type": "http.response.body", "body": response.get_data()})
+
+
+async def stream_message(send):
+    """发送消息并以SSE流式返回回复(异步)"""
+    message = request.form.get('message', '')
+    current_session = session.get('session_id')
+    await _start_response(send, Response(mimetype='text/event-stream', headers=routes.SSE_HEADERS))
+    
+    response_text = ''
+    try:
+        await asyncio.to_thread(routes.prepare_thread, current_session)
+        async for event in routes.agent.astream(message, thread_id=current_session):
+            response_text = routes.event_response_text(event, response_text)
+            body = "".join(routes.event_to_sse(event)).encode("utf-8")
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+    except Exception as e:
+        response_text = f'发生错误: {str(e)}'
+        body = format_sse({'type': 'error', 'content': str(e)}).encode("utf-8")
+        await send({"type": "http.response.body", "body": body, "more_body": True})
+    await asyncio.to_thread(routes.record_turn, current_session, message, response_text)
+    await send({"type": "http.response.body", "body": b""})
+
+
+# 使用异步实现的路由
+ASYNC_ROUTES = {
+    "/send_message": send_message,
+    "/stream_message": stream_message,
+}
+
+
+async def application(scope, receive, send):
+    """ASGI应用"""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    handler = ASYNC_ROUTES.get(scope.get("path")) if scope["type"] == "http" and scope["method"] == "POST" else None
+    if handler is None:
+        await wsgi_app(scope, receive, send)
+        return
+
+    environ = _build_environ(scope, await _read_body(receive))
+    with app.request_context(environ):
+        # 执行before_request钩子(初始化智能体、分配会话ID)
+        response = app.preprocess_request()
+        if response is not None:
+            response = app.make_response(response)
+            await _start_response(send, response)
+            await send({"type": "http.response.body", "body": response.get_data()})
+            return
+        await handler(send)
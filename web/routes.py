@@ -1,5 +1,6 @@
 import uuid
 import json
+import time
 import sys
 import os
 # 确保Annotated在全局命名空间中可用
@@ -86,9 +87,15 @@ except ImportError:
 # 将Awaitable添加到全局命名空间
 __builtins__['Awaitable'] = Awaitable
 
-from flask import Blueprint, render_template, request, jsonify, session
-from .utils import recursion_logger, load_sessions, load_session_history, save_session_history, delete_session
+from flask import Blueprint, Response, g, render_template, request, jsonify, session, stream_with_context
+from .utils import (log_tool_cache, event_log, load_sessions, load_session_history, save_session_history,
+                    append_session_history,
+                    delete_session, rename_session_history, session_exists,
+                    has_temp_history, get_temp_history, set_temp_history, append_temp_history,
+                    pop_temp_history, format_sse)
 from functools import wraps
+from src.extend.tracing import SPAN_INVOKE, tracer
+from src.extend.metrics import HTTP_SECONDS, metrics
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -99,6 +106,9 @@ from main import Langgraph_Agent
 # 创建蓝图
 main_bp = Blueprint('main', __name__)
 
+# SSE响应头(禁止缓存与代理缓冲)
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
 # 全局智能体实例
 agent = None
 
@@ -108,32 +118,26 @@ def init_agent():
     # 导入必要的配置和工具
     from src.config.config_model import config
     from src.prompt import system_prompt
-    from src.extend.tool import list_files, read_file, write_file, run_cmd
+    from src.extend.tool import list_files, scan_tree, find_files, read_file, search_file, write_file, run_cmd
+    from src.extend.tool_memo import tool_memo
     
     # 初始化环境变量
     config.langsmith_config.init_env()
     
-    # 使用装饰器包装工具函数以记录工具调用
-    from .utils import RecursionLogger
-    log_tool_call = RecursionLogger.log_tool_call
-    
-    # 注意：我们不再包装工具函数，因为它们已经被@tool装饰器处理
-    # 直接使用原始工具函数
+    # 每轮对话、模型调用与工具调用由智能体自动记录到追踪器
     agent = Langgraph_Agent(
         config.llm_model,
-        tools=[list_files, read_file, write_file, run_cmd],
+        tools=[list_files, scan_tree, find_files, read_file, search_file, write_file, run_cmd],
         system_prompt=system_prompt
     )
-    agent._logger = recursion_logger
-    
-    # 使用装饰器包装invoke方法以记录递归调用
-    if not hasattr(agent.invoke, '_wrapped'):
-        agent.invoke = RecursionLogger.log_recursion(agent.invoke)
+    # 工具缓存命中/清空事件写入追踪记录
+    tool_memo.add_listener(log_tool_cache)
 
 @main_bp.before_request
 def before_request():
     """请求前初始化"""
     global agent
+    g.request_started = time.perf_counter()
     if agent is None:
         init_agent()
     
@@ -141,6 +145,18 @@ def before_request():
     if 'session_id' not in session:
         session['session_id'] = str(uuid.uuid4())
 
+@main_bp.teardown_request
+def teardown_request(exc):
+    """记录请求耗时(流式响应在流结束后记录)"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.observe(HTTP_SECONDS, time.perf_counter() - started, endpoint=request.endpoint)
+
+@main_bp.route('/metrics')
+def metrics_route():
+    """以Prometheus文本格式导出性能指标"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @main_bp.route('/')
 def index():
     """主页路由"""
@@ -148,25 +164,25 @@ def index():
     current_session = session.get('session_id')
     
     # 检查是否是临时会话
-    is_temp_session = current_session and current_session.startswith('新会话_') and 'temp_history' in session
+    is_temp_session = current_session and has_temp_history(current_session)
     
     if is_temp_session:
-        # 从session中获取临时历史
-        history = session.get('temp_history', [])
+        # 从服务端内存中获取临时历史
+        history = get_temp_history(current_session)
     else:
-        # 从硬盘加载历史
-        history = load_session_history(current_session)
+        # 从智能体记忆中获取历史(未缓存时从存储加载)
+        history = agent.memory.get_messages(current_session)
     
     return render_template('index.html', 
                           sessions=sessions, 
                           current_session=current_session, 
                           history=history, 
-                          recursion_logs=recursion_logger.get_logs())
+                          recursion_logs=tracer.get_logs(current_session))
 
 @main_bp.route('/new_session', methods=['POST'])
 def new_session():
     """创建新会话 - 不立即保存到硬盘，只在会话中设置ID"""
-    import datetime
+    from datetime import datetime
     # 使用临时会话ID或生成新ID
     temp_id = request.form.get('temp_session_id')
     if temp_id and temp_id.startswith('新会话_'):
@@ -175,7 +191,8 @@ def new_session():
         session['session_id'] = f"新会话_{datetime.now().strftime('%H%M%S')}"
     
     # 清空会话历史，但不保存到硬盘
-    session['temp_history'] = []
+    set_temp_history(session['session_id'], [])
+    agent.delete_thread(session['session_id'])
     
     return index()
 
@@ -183,13 +200,14 @@ def new_session():
 def switch_session():
     """切换会话"""
     session_id = request.form.get('session_id')
-    if session_id and session_id in load_sessions():
+    if session_id and session_exists(session_id):
         # 检查当前会话是否为空且是临时会话，如果是则删除
         current_session = session.get('session_id')
         if current_session and current_session.startswith('新会话_'):
             current_history = load_session_history(current_session)
             if not current_history or len(current_history) == 0:
                 # 删除未使用的临时空会话
+                agent.delete_thread(current_session)
                 delete_session(current_session)
         
         # 切换到新会话
@@ -204,9 +222,9 @@ def save_session():
         current_session = session.get('session_id')
         
         # 检查是否是临时会话
-        if current_session.startswith('新会话_') and 'temp_history' in session:
-            # 从session中获取临时历史
-            history = session.get('temp_history', [])
+        if has_temp_history(current_session):
+            # 从服务端内存中获取临时历史
+            history = get_temp_history(current_session)
             
             # 如果有历史记录，保存到硬盘
             if history:
@@ -219,25 +237,69 @@ def save_session():
                     save_session_history(new_session_id, history)
                     # 更新session中的ID
                     session['session_id'] = new_session_id
+                    # 丢弃临时线程与旧缓存,下次访问时从存储加载
+                    agent.delete_thread(current_session)
+                    agent.delete_thread(new_session_id)
                     # 清除临时历史
-                    session.pop('temp_history', None)
+                    pop_temp_history(current_session)
                     return jsonify({'message': '会话已保存', 'session_id': new_session_id})
                 else:
                     # 直接使用当前临时ID保存
                     save_session_history(current_session, history)
+                    agent.delete_thread(current_session)
                     # 清除临时历史
-                    session.pop('temp_history', None)
+                    pop_temp_history(current_session)
                     return jsonify({'message': '会话已保存'})
             else:
                 return jsonify({'message': '会话为空，无法保存'}), 400
         else:
-            # 非临时会话，直接保存
-            history = load_session_history(current_session)
-            save_session_history(current_session, history)
+            # 非临时会话，写入记忆中尚未保存的消息
+            agent.memory.save(current_session)
             return jsonify({'message': '会话已保存'})
     except Exception as e:
         return jsonify({'message': f'保存失败: {str(e)}'}), 500
 
+def response_to_text(response):
+    """处理OpenAIMessage对象，确保返回可序列化的内容"""
+    if hasattr(response, 'content'):
+        return response.content
+    elif hasattr(response, 'text'):
+        return response.text
+    elif isinstance(response, str):
+        return response
+    return str(response)
+
+def prepare_thread(session_id):
+    """准备临时会话的记忆线程(已保存的会话由智能体记忆从存储懒加载)"""
+    if has_temp_history(session_id) and not agent.memory.has_thread(session_id):
+        agent.memory.set_history(session_id, get_temp_history(session_id), transient=True)
+
+def record_turn(session_id, message, response_text):
+    """记录一轮对话(更新临时会话历史,或把记忆中的新消息追加到存储)"""
+    if has_temp_history(session_id):
+        turn = [['user', message], ['assistant', response_text]]
+        if not append_temp_history(session_id, turn):
+            # 生成回复期间临时会话已被保存到存储,直接追加本轮,避免丢失
+            append_session_history(session_id, turn)
+    else:
+        agent.memory.save(session_id)
+
+def event_to_sse(event):
+    """把智能体流式事件转换为SSE消息(工具事件同时作为日志推送给前端)"""
+    messages = []
+    if event['type'] in ('tool_call', 'tool_result'):
+        messages.append(format_sse({'type': 'log', 'log': event_log(event)}))
+    messages.append(format_sse(event))
+    return messages
+
+def event_response_text(event, response_text):
+    """根据流式事件更新最终回复内容"""
+    if event['type'] == 'done':
+        return event['content']
+    if event['type'] == 'error':
+        return f"发生错误: {event['content']}"
+    return response_text
+
 @main_bp.route('/send_message', methods=['POST'])
 def send_message():
     """发送消息并获取回复"""
@@ -245,45 +307,39 @@ def send_message():
         message = request.form.get('message', '')
         current_session = session.get('session_id')
         
-        # 检查是否是临时会话（尚未保存到硬盘）
-        is_temp_session = current_session.startswith('新会话_') and 'temp_history' in session
-        
-        if is_temp_session:
-            # 从session中获取临时历史
-            history = session.get('temp_history', [])
-        else:
-            # 从硬盘加载历史
-            history = load_session_history(current_session)
-        
-        # 添加用户消息到历史
-        history.append(['user', message])
-        
-        # 获取智能体回复
-        response = agent.invoke(message)
-        
-        # 处理OpenAIMessage对象，确保返回可序列化的内容
-        if hasattr(response, 'content'):
-            response_text = response.content
-        elif hasattr(response, 'text'):
-            response_text = response.text
-        elif isinstance(response, str):
-            response_text = response
-        else:
-            response_text = str(response)
-        
-        # 添加智能体回复到历史
-        history.append(['assistant', response_text])
-        
-        # 更新临时会话历史或保存到硬盘
-        if is_temp_session:
-            session['temp_history'] = history
-        else:
-            save_session_history(current_session, history)
+        # 获取智能体回复(每个会话使用独立的记忆线程)
+        prepare_thread(current_session)
+        response_text = response_to_text(agent.invoke(message, thread_id=current_session))
+        record_turn(current_session, message, response_text)
         
         return jsonify({'response': response_text})
     except Exception as e:
         return jsonify({'response': f'发生错误: {str(e)}'}), 500
 
+@main_bp.route('/stream_message', methods=['POST'])
+def stream_message():
+    """发送消息并以SSE流式返回回复(token与工具事件在生成时实时推送)"""
+    message = request.form.get('message', '')
+    current_session = session.get('session_id')
+    
+    def generate():
+        response_text = ''
+        try:
+            prepare_thread(current_session)
+            for event in agent.stream(message, thread_id=current_session):
+                response_text = event_response_text(event, response_text)
+                yield from event_to_sse(event)
+        except Exception as e:
+            response_text = f'发生错误: {str(e)}'
+            yield format_sse({'type': 'error', 'content': str(e)})
+        record_turn(current_session, message, response_text)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers=SSE_HEADERS
+    )
+
 @main_bp.route('/continue_from_history', methods=['POST'])
 def continue_from_history():
     """从历史记录继续对话"""
@@ -292,24 +348,26 @@ def continue_from_history():
         current_session = session.get('session_id')
         
         # 检查是否是临时会话
-        is_temp_session = current_session.startswith('新会话_') and 'temp_history' in session
+        is_temp_session = has_temp_history(current_session)
         
         if is_temp_session:
-            # 从session中获取临时历史
-            history = session.get('temp_history', [])
+            # 从服务端内存中获取临时历史
+            history = get_temp_history(current_session)
         else:
-            # 从硬盘加载历史
-            history = load_session_history(current_session)
+            # 从智能体记忆中获取历史
+            history = agent.memory.get_messages(current_session)
         
         # 截取历史记录到指定索引
         if history_index < len(history):
             history = history[:history_index + 1]
             
             # 更新临时会话历史或保存到硬盘
+            agent.memory.set_history(current_session, history, transient=is_temp_session)
+            agent.reset_checkpoint(current_session)
             if is_temp_session:
-                session['temp_history'] = history
+                set_temp_history(current_session, history)
             else:
-                save_session_history(current_session, history)
+                agent.memory.save(current_session)
         
         return index()
     except Exception as e:
@@ -317,47 +375,31 @@ def continue_from_history():
 
 @main_bp.route('/get_recursion_logs', methods=['GET'])
 def get_recursion_logs():
-    """获取递归调用日志"""
-    print("处理递归日志请求")
-    logs = recursion_logger.get_logs()
-    print(f"返回 {len(logs)} 条递归日志")
-    return jsonify({'logs': logs})
+    """获取当前会话的调用追踪记录(日志面板格式)"""
+    limit = request.args.get('limit', type=int)
+    return jsonify({'logs': tracer.get_logs(session.get('session_id'), limit)})
+
+@main_bp.route('/get_traces', methods=['GET'])
+def get_traces():
+    """获取当前会话的span(含trace_id/parent_id与耗时,可按父子关系还原调用树)"""
+    limit = request.args.get('limit', type=int)
+    return jsonify({'spans': [span.to_dict() for span in tracer.get_spans(session.get('session_id'), limit)]})
 
-# 确保测试递归日志路由正确注册
 @main_bp.route('/test_recursion_logs', methods=['GET'])
 def test_recursion_logs():
-    """测试递归日志生成"""
-    print("测试递归日志生成")
-    # 清除现有日志
-    recursion_logger.clear_logs()
-    
-    # 手动添加一些测试日志，添加source字段
-    recursion_logger.log('call', 'test_function', 'param1=value1, param2=value2', source='TestAgent')
-    recursion_logger.log('result', 'test_function', None, '测试结果成功', source='TestAgent')
+    """生成一组嵌套的测试span"""
+    current_session = session.get('session_id')
+    tracer.clear(current_session)
     
-    # 模拟递归调用
-    def test_function(level=0):
-        # 记录日志，添加source字段
-        recursion_logger.log('START', 'test_function', params={'level': level}, source='TestAgent')
-        
-        if level < 2:
-            result = test_function(level + 1)
-        else:
-            result = f"递归级别 {level} 完成"
-        
-        # 记录日志，添加source字段
-        recursion_logger.log('END', 'test_function', result=result, source='TestAgent')
-        
+    # 模拟递归调用(每一层是上一层的子span)
+    def test_function(level=0, parent=None):
+        with tracer.span('test_function', SPAN_INVOKE, current_session, parent, input=f'level={level}') as span:
+            result = test_function(level + 1, span) if level < 2 else f"递归级别 {level} 完成"
+            span.set(output=result)
         return result
     
-    # 执行测试函数
-    try:
-        test_function()
-    except Exception as e:
-        # 记录错误日志，添加source字段
-        recursion_logger.log('ERROR', 'test_function', result=str(e), source='TestAgent')
-    
-    return jsonify({'status': 'success', 'message': '已添加测试递归日志'})
+    test_function()
+    return jsonify({'status': 'success', 'message': '已添加测试追踪记录'})
 
 @main_bp.route('/delete_session', methods=['POST'])
 def delete_session_route():
@@ -371,6 +413,7 @@ def delete_session_route():
             return jsonify({'success': False, 'message': '不能删除当前正在使用的会话'}), 400
         
         # 执行删除
+        agent.delete_thread(session_id)
         if delete_session(session_id):
             return jsonify({'success': True, 'message': '会话删除成功'})
         else:
@@ -395,22 +438,22 @@ def rename_session():
         current_session = session.get('session_id')
         
         # 检查是否是临时会话的重命名
-        if old_session_id == current_session and current_session.startswith('新会话_') and 'temp_history' in session:
+        if old_session_id == current_session and has_temp_history(current_session):
             # 直接更新session中的ID
+            set_temp_history(new_session_name, pop_temp_history(current_session))
             session['session_id'] = new_session_name
+            agent.memory.rename_thread(current_session, new_session_name)
+            agent.reset_checkpoint(current_session)
             return jsonify({'success': True, 'message': '会话重命名成功', 'new_session_id': new_session_name})
         else:
-            # 常规会话重命名
-            # 加载旧会话历史
-            old_history = load_session_history(old_session_id)
-            if not old_history:
+            # 常规会话重命名(只修改存储中的会话名称)
+            if session_exists(new_session_name):
+                return jsonify({'success': False, 'message': '会话名称已存在'}), 400
+            if not rename_session_history(old_session_id, new_session_name):
                 return jsonify({'success': False, 'message': '旧会话不存在'}), 404
             
-            # 保存为新会话
-            save_session_history(new_session_name, old_history)
-            
-            # 删除旧会话
-            delete_session(old_session_id)
+            agent.memory.rename_thread(old_session_id, new_session_name)
+            agent.reset_checkpoint(old_session_id)
             
             # 如果是当前会话，更新session中的ID
             if old_session_id == current_session:
@@ -376,42 +376,87 @@ document.getElementById('chat-form').addEventListener('submit', function(e) {
     chatHistory.appendChild(loadingMessage);
     chatHistory.scrollTop = chatHistory.scrollHeight;
     
-    // 发送请求
-    fetch('/send_message', {
+    // 流式请求: 逐个接收token与工具事件并增量渲染
+    let responseText = '';
+    let responseContent = null;
+    let renderPending = false;
+    
+    // 首个token到达时把加载消息替换为回复消息
+    function ensureResponseMessage() {
+        if (responseContent) return;
+        loadingMessage.innerHTML = `
+            <div class="history-control">
+                <button class="continue-button">从此处继续</button>
+            </div>
+            <div class="message-content markdown-content"></div>
+        `;
+        responseContent = loadingMessage.querySelector('.message-content');
+    }
+    
+    // 合并同一帧内的多个token,只渲染一次Markdown
+    function scheduleRender() {
+        if (renderPending) return;
+        renderPending = true;
+        requestAnimationFrame(() => {
+            renderPending = false;
+            responseContent.innerHTML = marked.parse(responseText);
+            chatHistory.scrollTop = chatHistory.scrollHeight;
+        });
+    }
+    
+    function handleEvent(event) {
+        if (event.type === 'token') {
+            ensureResponseMessage();
+            responseText += event.content;
+            scheduleRender();
+        } else if (event.type === 'log') {
+            appendRecursionLog(event.log);
+        } else if (event.type === 'router') {
+            // 改用其他模型继续: 之前输出的token作废,已执行的工具结果保留
+            responseText = '';
+            if (responseContent) responseContent.innerHTML = '';
+            appendRecursionLog({level: 'ROUTER', function: 'router', result: event.content, source: 'Agent'});
+        } else if (event.type === 'done') {
+            ensureResponseMessage();
+            responseText = event.content;
+            responseContent.innerHTML = marked.parse(responseText);
+            hljs.highlightAll();
+            chatHistory.scrollTop = chatHistory.scrollHeight;
+        } else if (event.type === 'error') {
+            ensureResponseMessage();
+            responseText = `发生错误: ${event.content}`;
+            responseContent.textContent = responseText;
+        }
+    }
+    
+    fetch('/stream_message', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/x-www-form-urlencoded'
         },
         body: `message=${encodeURIComponent(message)}`
     })
-    .then(response => response.json())
-    .then(data => {
-        // 移除加载消息
-        chatHistory.removeChild(loadingMessage);
-        
-        // 添加回复消息
-        const responseMessage = document.createElement('div');
-        responseMessage.className = 'message assistant';
-        
-        // 渲染Markdown内容
-        const markdownContent = marked.parse(data.response);
-        
-        responseMessage.innerHTML = `
-            <div class="history-control">
-                <button class="continue-button">从此处继续</button>
-            </div>
-            <div class="message-content markdown-content">${markdownContent}</div>
-        `;
-        
-        chatHistory.appendChild(responseMessage);
-        
-        // 对代码块应用语法高亮
-        hljs.highlightAll();
-        
-        chatHistory.scrollTop = chatHistory.scrollHeight;
-        
-        // 更新递归日志
-        updateRecursionLogs();
+    .then(async response => {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            // SSE消息以空行分隔
+            const parts = buffer.split('\n\n');
+            buffer = parts.pop();
+            parts.forEach(part => {
+                const data = part.split('\n')
+                    .filter(line => line.startsWith('data: '))
+                    .map(line => line.slice(6))
+                    .join('\n');
+                if (data) {
+                    handleEvent(JSON.parse(data));
+                }
+            });
+        }
     })
     .catch(error => {
         chatHistory.removeChild(loadingMessage);
@@ -499,40 +544,7 @@ function updateRecursionLogs() {
             if (logs.length > 0) {
                 console.log(`发现 ${logs.length} 条递归日志记录`);
                 logs.forEach(log => {
-                    const logElement = document.createElement('div');
-                    
-                    // 添加日志级别类和工具调用标识
-                    let className = `recursion-log ${log.level || ''}`;
-                    if (log.tool_name) {
-                        className += ' tool-call';
-                    }
-                    
-                    // 添加来源类名（与index.html中的getSourceClassName保持一致）
-                    if (log.source) {
-                        const sourceClass = getSourceClassName(log.source);
-                        className += ` source-${sourceClass}`;
-                        logElement.setAttribute('data-source', log.source);
-                    }
-                    
-                    logElement.className = className;
-                    
-                    // 使用合适的字段名
-                    const functionName = log.function_name || log.function || '未知函数';
-                    const timestamp = log.timestamp || new Date().toLocaleTimeString();
-                    
-                    // 为工具调用添加特殊样式和标识
-                    const isToolCall = log.level && log.level.startsWith('TOOL_');
-                    const toolPrefix = isToolCall ? '<span class="tool-indicator">🔧 </span>' : '';
-                    
-                    logElement.innerHTML = `
-                        <div class="timestamp">${timestamp}</div>
-                        <div class="function">${toolPrefix}${log.level || '未知'} - ${functionName}${log.tool_name ? ` (工具: ${log.tool_name})` : ''}</div>
-                        ${log.params ? `<div class="params">参数: ${typeof log.params === 'string' ? log.params : JSON.stringify(log.params)}</div>` : ''}
-                        ${log.result ? `<div class="result">结果: ${typeof log.result === 'string' ? log.result : JSON.stringify(log.result)}</div>` : ''}
-                        ${log.source ? `<div class="source">来源: ${log.source}</div>` : ''}
-                    `;
-                    
-                    logsContainer.appendChild(logElement);
+                    logsContainer.appendChild(createLogElement(log));
                 });
                 logsContainer.scrollTop = logsContainer.scrollHeight;
             } else {
@@ -549,6 +561,55 @@ function updateRecursionLogs() {
         });
 }
 
+// 创建单条递归日志元素
+function createLogElement(log) {
+    const logElement = document.createElement('div');
+    
+    // 添加日志级别类和工具调用标识
+    let className = `recursion-log ${log.level || ''}`;
+    if (log.tool_name) {
+        className += ' tool-call';
+    }
+    
+    // 添加来源类名（与index.html中的getSourceClassName保持一致）
+    if (log.source) {
+        const sourceClass = getSourceClassName(log.source);
+        className += ` source-${sourceClass}`;
+        logElement.setAttribute('data-source', log.source);
+    }
+    
+    logElement.className = className;
+    
+    // 使用合适的字段名
+    const functionName = log.function_name || log.function || '未知函数';
+    const timestamp = log.timestamp || new Date().toLocaleTimeString();
+    
+    // 为工具调用添加特殊样式和标识
+    const isToolCall = log.level && log.level.startsWith('TOOL_');
+    const toolPrefix = isToolCall ? '<span class="tool-indicator">🔧 </span>' : '';
+    
+    logElement.innerHTML = `
+        <div class="timestamp">${timestamp}</div>
+        <div class="function">${toolPrefix}${log.level || '未知'} - ${functionName}${log.tool_name ? ` (工具: ${log.tool_name})` : ''}</div>
+        ${log.params ? `<div class="params">参数: ${typeof log.params === 'string' ? log.params : JSON.stringify(log.params)}</div>` : ''}
+        ${log.result ? `<div class="result">结果: ${typeof log.result === 'string' ? log.result : JSON.stringify(log.result)}</div>` : ''}
+        ${log.source ? `<div class="source">来源: ${log.source}</div>` : ''}
+    `;
+    return logElement;
+}
+
+// 追加单条递归日志(流式事件推送)
+function appendRecursionLog(log) {
+    const logsContainer = document.getElementById('recursion-logs');
+    if (!logsContainer) return;
+    const emptyMessage = logsContainer.querySelector('.no-logs-message');
+    if (emptyMessage || !logsContainer.querySelector('.recursion-log')) {
+        logsContainer.innerHTML = '';
+    }
+    logsContainer.appendChild(createLogElement(log));
+    logsContainer.scrollTop = logsContainer.scrollHeight;
+}
+
 // 从index.html复制的getSourceClassName函数，确保一致性
 function getSourceClassName(source) {
     if (!source) return 'Default';
@@ -657,24 +718,9 @@ window.addEventListener('load', function() {
     window.testChatResponse = testChatResponse;
     console.log('测试函数已暴露到全局window对象');
     
-    // 立即更新递归日志
-    console.log("首次更新递归日志");
+    // 立即更新递归日志(之后的工具调用日志随流式响应实时推送,无需轮询)
     updateRecursionLogs();
     
-    // 移除固定的定时器，改为在消息发送和页面活动时更新
-    console.log("移除固定定时器，改用事件触发更新");
-    
-    // 在消息发送后更新日志
-    document.getElementById('chat-form').addEventListener('submit', function() {
-        setTimeout(updateRecursionLogs, 1000); // 延迟1秒以确保后端有足够时间生成日志
-    });
-    
-    // 在获取到响应后更新日志
-    // 注意：这里不需要额外添加，因为在发送消息的fetch回调中已经有updateRecursionLogs()调用
-    
-    // 当用户在页面上活动时更新日志
-    window.addEventListener('focus', updateRecursionLogs);
-    
     // 添加手动刷新按钮功能
     const refreshBtn = document.createElement('button');
     refreshBtn.textContent = '刷新日志';